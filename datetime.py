@@ -1,16 +1,124 @@
+import json
+import time
+
 import machine
 import ntptime
 
+import helper as ih
+import metrics
+
 rtc = machine.RTC()
 
-def update():
-    global time_string
-    # grab the current time from the ntp server and update the Pico RTC
+# Time service. At boot the Pico RTC is seeded from the battery backed
+# PCF85063A, and NTP is only asked when the last sync is too old or the
+# measured drift of the clock says it has wandered too far. machine.RTC
+# runs on UTC, local time adds the UTC offset of the forecast location
+# (Open-Meteo reports it with DST applied).
+
+STATE_PATH = "/time.json"
+# Resync at least this often, in seconds
+MAX_AGE = 24 * 3600
+# Resync once the expected error from drift passes this, in seconds
+MAX_ERROR = 30
+NTP_TIMEOUT = 2
+
+# time.time() of the last NTP sync, measured drift in parts per million
+# and the UTC offset in seconds
+state = {"synced": None, "drift": 0.0, "offset": 0}
+
+
+def load_state():
+    global state
     try:
-        ntptime.settime()
-    except OSError:
-        print("Unable to contact NTP server")
+        with open(STATE_PATH, "r") as f:
+            state.update(json.loads(f.read()))
+    except (OSError, ValueError):
+        pass
+
+
+def save_state():
+    try:
+        with open(STATE_PATH, "w") as f:
+            f.write(json.dumps(state))
+    except OSError as e:
+        print("Error saving time state: ", e)
+
+
+def seed():
+    # Copies the PCF85063A time into machine.RTC, returns False if it looks unset
+    load_state()
+    try:
+        year, month, day, hour, minute, second, dow = ih.rtc.datetime()
+    except Exception as e:
+        print("Unable to read PCF85063A: ", e)
+        return False
+    if year < 2024:
+        return False
+    rtc.datetime((year, month, day, dow, hour, minute, second, 0))
+    return True
+
+
+def store():
+    # Copies machine.RTC into the PCF85063A so it survives power down
+    t = rtc.datetime()
+    ih.rtc.datetime((t[0], t[1], t[2], t[4], t[5], t[6], t[3]))
+
+
+def needs_sync(now = None):
+    if state["synced"] is None:
+        return True
+    if now is None:
+        now = time.time()
+    age = now - state["synced"]
+    if age < 0 or age > MAX_AGE:
+        return True
+    return abs(state["drift"]) * age / 1000000 > MAX_ERROR
+
+
+def sync():
+    # Asks NTP for the time, measures the drift since the last sync and sets both clocks
+    ntptime.timeout = NTP_TIMEOUT
+    t = metrics.begin()
+    ntp_now = ntptime.time()
+    metrics.end(metrics.NTP, t)
+    local_now = time.time()
+    if state["synced"] is not None and local_now > state["synced"]:
+        ppm = (local_now - ntp_now) * 1000000 / (local_now - state["synced"])
+        # Smooth the estimate, single syncs only have one second resolution
+        state["drift"] = 0.5 * state["drift"] + 0.5 * ppm
+    t = time.gmtime(ntp_now)
+    rtc.datetime((t[0], t[1], t[2], t[6], t[3], t[4], t[5], 0))
+    state["synced"] = ntp_now
+    save_state()
+    store()
+
+
+def update(force = False):
+    # Syncs with NTP if needed, returns True if the clock was set
+    try:
+        if not (force or needs_sync()):
+            print("RTC fresh, last NTP sync {}s ago".format(time.time() - state["synced"]))
+            return False
+        sync()
+        return True
+    except Exception as e:
+        print("Unable to contact NTP server", e)
+        return False
+
+
+def set_offset(seconds):
+    if seconds != state["offset"]:
+        state["offset"] = seconds
+        save_state()
+
+
+def localtime(stamp = None):
+    if stamp is None:
+        stamp = time.time()
+    return time.localtime(stamp + state["offset"])
 
-    current_t = rtc.datetime()
 
-    print(current_t)
\ No newline at end of file
+def now():
+    # Local time laid out like machine.RTC().datetime()
+    t = localtime()
+    return (t[0], t[1], t[2], t[6], t[3], t[4], t[5], 0)
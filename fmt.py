@@ -0,0 +1,122 @@
+# Text for the pages with as few heap allocations as possible. Numbers are
+# written as fixed point digits into a preallocated scratch buffer and the
+# finished text is made into a str once, instead of going through round(),
+# str(float) and format() temporaries. Day, month and compass names are
+# module level tables kept as bytes, so copying them allocates nothing.
+#
+#   fmt.fixed(14.25, 1, b" C")      "14.3 C"
+#   fmt.date(5, 17, 10)             "Saturday, 17 October"
+
+DAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+MONTHS = ("January", "February", "March", "April", "May", "June", "July", "August",
+          "September", "October", "November", "December")
+DIRS = ("N", "NNE", "NE", "ENE", "E", "ESE", "SE", "SSE", "S", "SSW", "SW", "WSW", "W", "WNW", "NW", "NNW")
+
+_DAYS = tuple(d.encode() for d in DAYS)
+_MONTHS = tuple(m.encode() for m in MONTHS)
+_DIRS = tuple(d.encode() for d in DIRS)
+_POW = (1, 10, 100, 1000)
+
+# Big enough for the longest draw call passed to ints()
+_buf = bytearray(256)
+_view = memoryview(_buf)
+
+
+def _put(pos, data):
+    # Copies bytes in at pos, returns the position after them
+    for c in data:
+        _buf[pos] = c
+        pos += 1
+    return pos
+
+
+def _int(pos, n, width = 1):
+    # Writes a non-negative int, zero padded to width
+    end = pos
+    m = n
+    while m or end - pos < width:
+        end += 1
+        m //= 10
+    i = end
+    while i > pos:
+        i -= 1
+        _buf[i] = 48 + n % 10
+        n //= 10
+    return end
+
+
+def _fixed(pos, value, decimals):
+    if decimals:
+        n = int(value * _POW[decimals] + (0.5 if value >= 0 else -0.5))
+    else:
+        n = int(value + (0.5 if value >= 0 else -0.5))
+    if n < 0:
+        _buf[pos] = 45
+        pos += 1
+        n = -n
+    if decimals:
+        pos = _int(pos, n // _POW[decimals])
+        _buf[pos] = 46
+        return _int(pos + 1, n % _POW[decimals], decimals)
+    return _int(pos, n)
+
+
+def _text(end):
+    return str(_view[:end], "ascii")
+
+
+def fixed(value, decimals = 1, suffix = b"", prefix = b""):
+    # value rounded to decimals places, between prefix and suffix
+    pos = _put(0, prefix)
+    pos = _fixed(pos, value, decimals)
+    return _text(_put(pos, suffix))
+
+
+def number(value, suffix = b"", prefix = b""):
+    return fixed(value, 0, suffix, prefix)
+
+
+def clock(hour, minute):
+    # "9:05"
+    pos = _int(0, hour)
+    _buf[pos] = 58
+    return _text(_int(pos + 1, minute, 2))
+
+
+def date(dow, day, month):
+    # "Saturday, 17 October" for the top of the pages
+    pos = _put(_put(0, _DAYS[dow]), b", ")
+    pos = _put(_int(pos, day), b" ")
+    return _text(_put(pos, _MONTHS[month - 1]))
+
+
+def compass(degrees):
+    # Nearest of the 16 compass points, a shared constant str
+    return DIRS[int((degrees + 11.25) / 22.5) % 16]
+
+
+def wind(speed, degrees):
+    # "11.3 km/h from SW"
+    pos = _fixed(0, speed, 1)
+    pos = _put(pos, b" km/h from ")
+    return _text(_put(pos, _DIRS[int((degrees + 11.25) / 22.5) % 16]))
+
+
+def ints(values):
+    # The ints among values, comma separated, with "_" for anything else, as
+    # a memoryview over the scratch buffer that is only good until the next
+    # call. For hashing draw calls, which take at most ten or so numbers.
+    pos = 0
+    for v in values:
+        if type(v) is int:
+            if v < 0:
+                _buf[pos] = 45
+                pos += 1
+                v = -v
+            pos = _int(pos, v)
+        else:
+            _buf[pos] = 95
+            pos += 1
+        _buf[pos] = 44
+        pos += 1
+    return _view[:pos]
@@ -0,0 +1,127 @@
+# Text metrics for the bitmap8 font, so layout never has to call the native
+# measure_text in the hot path. The advance width of each printable ASCII
+# glyph is measured once with PicoGraphics and stored in TABLE_PATH, so
+# later boots just read it back. Measured strings are kept in a small LRU
+# cache, and wrap() breaks text into lines the same way PicoGraphics does
+# when drawing with wordwrap, so line counts can be known up front.
+
+TABLE_PATH = "/font8.bin"
+FIRST = 32
+LAST = 126
+# Line pitch at scale 1, glyph height plus one row of spacing
+LINE_HEIGHT = 9
+# Advance used for characters outside the table
+DEFAULT_ADVANCE = 7
+
+# Advance per glyph from FIRST to LAST, including the letter spacing
+advances = None
+# Letter spacing measure_text leaves off the end of a string, 0 if it counts it
+trim = 0
+
+CACHE_SIZE = 64
+_cache = {}
+_order = []
+hits = 0
+misses = 0
+
+
+def load(gfx):
+    global advances, trim
+    try:
+        with open(TABLE_PATH, "rb") as f:
+            data = f.read()
+        if len(data) == LAST - FIRST + 2:
+            advances = data[:-1]
+            trim = data[-1]
+            return
+    except OSError:
+        pass
+    calibrate(gfx)
+    try:
+        with open(TABLE_PATH, "wb") as f:
+            f.write(advances)
+            f.write(bytes([trim]))
+    except OSError as e:
+        print("Error saving font table: ", e)
+
+
+def calibrate(gfx):
+    # One native call per glyph, then never again
+    global advances, trim
+    single = gfx.measure_text("A", 1)
+    trim = gfx.measure_text("AA", 1) - 2 * single
+    table = bytearray(LAST - FIRST + 1)
+    for c in range(FIRST, LAST + 1):
+        table[c - FIRST] = gfx.measure_text(chr(c), 1) + trim
+    advances = bytes(table)
+    _cache.clear()
+    del _order[:]
+
+
+def advance(c):
+    code = ord(c)
+    if FIRST <= code <= LAST:
+        return advances[code - FIRST]
+    return DEFAULT_ADVANCE
+
+
+def _width(text):
+    w = 0
+    for c in text:
+        w += advance(c)
+    return w
+
+
+def measure(text, scale):
+    global hits, misses
+    key = (text, scale)
+    if key in _cache:
+        hits += 1
+        # Move to the back of the eviction order
+        _order.remove(key)
+        _order.append(key)
+        return _cache[key]
+    misses += 1
+    if len(_order) >= CACHE_SIZE:
+        del _cache[_order.pop(0)]
+    width = (_width(text) - trim) * scale if text else 0
+    _cache[key] = width
+    _order.append(key)
+    return width
+
+
+def wrap(text, scale, width):
+    # Returns (start, end) spans of text for each line when wrapped to width.
+    # Words are broken before their leading space like PicoGraphics does,
+    # the space is left out of the span that starts a new line.
+    spans = []
+    line_start = 0
+    x = 0
+    i = 0
+    n = len(text)
+    while i < n:
+        j = text.find(" ", i + 1)
+        if j == -1:
+            j = n
+        k = text.find("\n", i + 1)
+        if k != -1 and k < j:
+            j = k
+        word_w = _width(text[i:j]) * scale
+        if x != 0 and x + word_w > width:
+            spans.append((line_start, i))
+            line_start = i + 1 if text[i] == " " else i
+            word_w -= advance(text[i]) * scale if text[i] == " " else 0
+            x = 0
+        if text[i] == "\n":
+            spans.append((line_start, i))
+            line_start = i + 1
+            x = 0
+            word_w = _width(text[i + 1:j]) * scale
+        x += word_w
+        i = j
+    spans.append((line_start, n))
+    return spans
+
+
+def lines(text, scale, width):
+    return [text[a:b] for a, b in wrap(text, scale, width)]
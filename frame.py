@@ -0,0 +1,97 @@
+import binascii
+import hashlib
+import json
+
+import fmt
+import metrics
+
+# Skips e-ink refreshes when nothing visible changed. Frame wraps the
+# PicoGraphics object and hashes every draw call made since the last
+# update(). If the hash matches the frame already on the panel, update()
+# returns without refreshing. The hash of the panel contents is kept in a
+# file so it survives a sleep or reboot. Without an SD card that file is on
+# flash, so it is only rewritten when the panel contents change and the
+# counters of a skip wait for the next refresh.
+
+# Draw calls that change the framebuffer. Other attributes pass straight through.
+DRAW_CALLS = ("set_pen", "set_font", "set_thickness", "clear", "pixel", "pixel_span", "line",
+              "rectangle", "circle", "triangle", "polygon", "text", "character")
+
+path = "/frame.json"
+
+
+class Frame:
+    def __init__(self, gfx):
+        self.gfx = gfx
+        self.refreshed = 0
+        self.skipped = 0
+        self.shown = None
+        self._hash = hashlib.sha256()
+
+    def load(self):
+        # Picks up the panel state saved before the last sleep or reboot
+        try:
+            with open(path, "r") as f:
+                state = json.loads(f.read())
+            self.shown = state["hash"]
+            self.refreshed = state["refreshed"]
+            self.skipped = state["skipped"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def _save(self):
+        try:
+            with open(path, "w") as f:
+                f.write(json.dumps({"hash": self.shown, "refreshed": self.refreshed, "skipped": self.skipped}))
+        except OSError as e:
+            print("Error saving frame state: ", e)
+
+    def __getattr__(self, name):
+        attr = getattr(self.gfx, name)
+        if name not in DRAW_CALLS:
+            return attr
+
+        key = name.encode()
+
+        def call(*args, **kwargs):
+            # Numbers go in through one scratch buffer write instead of
+            # str() and format(), other arguments as their text
+            h = self._hash
+            h.update(key)
+            h.update(fmt.ints(args))
+            for a in args:
+                if type(a) is str:
+                    h.update(a.encode())
+                elif type(a) is not int:
+                    h.update(repr(a).encode())
+            if kwargs:
+                for k in kwargs:
+                    h.update(k.encode())
+                    if type(kwargs[k]) is not int:
+                        h.update(repr(kwargs[k]).encode())
+                h.update(fmt.ints(kwargs.values()))
+            return attr(*args, **kwargs)
+        # Kept on the instance, later lookups skip __getattr__
+        setattr(self, name, call)
+        return call
+
+    def update(self, force=False):
+        digest = binascii.hexlify(self._hash.digest()).decode()
+        self._hash = hashlib.sha256()
+        if digest == self.shown and not force:
+            self.skipped += 1
+            metrics.count(metrics.SKIPS)
+            print("Frame unchanged, skipped refresh ({} skipped, {} refreshed)".format(self.skipped, self.refreshed))
+            if path.startswith("/sd/"):
+                self._save()
+            return False
+        t = metrics.begin()
+        self.gfx.update()
+        metrics.end(metrics.PANEL, t)
+        metrics.count(metrics.REFRESHES)
+        changed = digest != self.shown
+        self.shown = digest
+        self.refreshed += 1
+        if changed or path.startswith("/sd/"):
+            self._save()
+        return True
@@ -4,6 +4,7 @@ import os
 import time
 
 import inky_frame
+import metrics
 import network
 from machine import PWM, Pin, Timer
 from pcf85063a import PCF85063A
@@ -61,7 +62,7 @@ def stop_network_led():
     network_led_pwm.duty_u16(0)
 
 
-def sleep(t):
+def sleep(t, wait=None):
     # Time to have a little nap until the next update
     rtc.clear_timer_flag()
     rtc.set_timer(t, ttp=rtc.TIMER_TICK_1_OVER_60HZ)
@@ -71,8 +72,18 @@ def sleep(t):
     # this allows the device to go into sleep mode when on battery power.
     hold_vsys_en_pin.init(Pin.IN)
 
-    # Regular time.sleep for those powering from USB
-    time.sleep(60 * t)
+    # Still running, so we are powered from USB. Wait out the timer, using the
+    # given wait(ms) function if there is one so buttons still work.
+    if wait is None:
+        time.sleep(60 * t)
+        result = None
+    else:
+        result = wait(60000 * t)
+
+    # Hold VSYS again in case USB power goes away while we are awake
+    hold_vsys_en_pin.init(Pin.OUT)
+    hold_vsys_en_pin.on()
+    return result
 
 
 # Turns off the button LEDs
@@ -84,26 +95,19 @@ def clear_button_leds():
     inky_frame.button_e.led_off()
 
 
-def network_connect(SSID, PSK):
+def _connect_start(SSID, PSK):
     # Enable the Wireless
     wlan = network.WLAN(network.STA_IF)
     wlan.active(True)
 
-    # Number of attempts to make before timeout
-    max_wait = 10
-
     # Sets the Wireless LED pulsing and attempts to connect to your local network.
     pulse_network_led()
     wlan.config(pm=0xa11140)  # Turn WiFi power saving off for some slow APs
     wlan.connect(SSID, PSK)
+    return wlan
 
-    while max_wait > 0:
-        if wlan.status() < 0 or wlan.status() >= 3:
-            break
-        max_wait -= 1
-        print("waiting for connection...")
-        time.sleep(1)
 
+def _connect_done(wlan):
     stop_network_led()
     network_led_pwm.duty_u16(30000)
 
@@ -111,6 +115,25 @@ def network_connect(SSID, PSK):
     if wlan.status() != 3:
         stop_network_led()
         led_warn.on()
+        return False
+    return True
+
+
+def network_connect(SSID, PSK):
+    wlan = _connect_start(SSID, PSK)
+
+    # Number of attempts to make before timeout
+    max_wait = 10
+
+    while max_wait > 0:
+        if wlan.status() < 0 or wlan.status() >= 3:
+            break
+        max_wait -= 1
+        print("waiting for connection...")
+        time.sleep(1)
+
+    return _connect_done(wlan)
+
 
 cfg = {"run": "settings", "WIFI_SSID": "", "WIFI_PASSWORD": "", "API_KEY": "", "LOCATION_NAME": "", "LOCATION": [0.0, 0.0], "UPDATE_INTERVAL": 900}
 app = None
@@ -123,25 +146,73 @@ def file_exists(filename):
         return False
 
     
-def load_cfg():
-    global cfg
-    cfg_data = json.loads(open("/config.json", "r").read())
+# Config is kept in RAM and only written back when something changed. Batch
+# changes with update_cfgs() or set_cfg() + commit_cfg() to write once.
+cfg_loaded = False
+cfg_dirty = False
+
+
+def load_cfg(force=False):
+    global cfg, cfg_loaded, cfg_dirty
+    if cfg_loaded and not force:
+        return
+    with open("/config.json", "r") as f:
+        cfg_data = json.loads(f.read())
     if type(cfg_data) is dict:
         cfg = cfg_data
+        cfg_loaded = True
+        cfg_dirty = False
     else:
         print("config.json not a dict type")
         
         
 def save_cfg(data):
-    with open("/config.json", "w") as f:
+    # Write to a temp file and rename it over the old one, so a power cut
+    # leaves either the old or the new config and never half of one
+    with open("/config.json.tmp", "w") as f:
         f.write(json.dumps(data))
         f.flush()
-      
-      
-def update_cfg(field, value):
-    global cfg
     try:
+        os.rename("/config.json.tmp", "/config.json")
+    except OSError:
+        os.remove("/config.json")
+        os.rename("/config.json.tmp", "/config.json")
+    #Counted with the metrics so the rate covers every wake, not just this one
+    metrics.count(metrics.CFG_WRITES)
+
+
+def set_cfg(field, value):
+    # Changes a field in RAM, commit_cfg() writes it out
+    global cfg_dirty
+    if field not in cfg or cfg[field] != value:
         cfg[field] = value
+        cfg_dirty = True
+
+
+def commit_cfg():
+    global cfg_dirty
+    if not cfg_dirty:
+        return False
+    try:
         save_cfg(cfg)
-    except:
-        print("Error updating config")
\ No newline at end of file
+        cfg_dirty = False
+        return True
+    except Exception as e:
+        print("Error updating config: ", e)
+        return False
+
+
+def update_cfgs(fields):
+    # Sets several fields with a single write
+    for field in fields:
+        set_cfg(field, fields[field])
+    return commit_cfg()
+      
+      
+def update_cfg(field, value):
+    set_cfg(field, value)
+    return commit_cfg()
+
+
+def cfg_writes_per_hour():
+    return metrics.per_hour(metrics.CFG_WRITES)
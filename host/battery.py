@@ -0,0 +1,152 @@
+# Battery life projection for the refresh scheduler. Runs the real pages,
+# scheduler.next_wake() and scheduler.sleep() on the emulator's clock for a
+# few simulated days. After drawing, each wake goes through
+# main.wait_for_input() as on the device, so any idle window spent polling
+# the buttons before sleeping is charged as awake time. Waiting advances the
+# clock instead of taking real time, nobody presses a button, the sensor
+# reading drifts through the day, and fetches succeed at once with the
+# fixture data. Each wake then costs awake time, radio time if it joined
+# Wi-Fi, and a panel refresh if frame.Frame did not skip it, which gives the
+# charge used per day and the days a battery lasts.
+#
+#   python3 host/battery.py                          every page, 15 min interval
+#   python3 host/battery.py home --interval 3600 --days 7
+#   python3 host/battery.py --wake button            as if every wake was a button press
+
+import argparse
+import io
+import math
+import os
+import sys
+
+HOST = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HOST)
+import bench
+import emu
+
+# Rough current draw of the Inky Frame 4.0 in mA
+AWAKE_MA = 45
+WIFI_MA = 80
+REFRESH_MA = 30
+SLEEP_MA = 0.02
+# Seconds each part of a wake takes
+AWAKE_S = 8
+WIFI_S = 5
+REFRESH_S = 30
+
+PAGES = ("home", "wx_now", "wx_hourly", "wx_daily")
+
+
+def draw(main, page):
+    if page == "home":
+        main.dashboard()
+    else:
+        main.draw_weather(page[3:])
+
+
+def simulate(main, page, interval, days, wake):
+    import breakout_bme69x
+    import inky_frame
+    import inputs
+    import network
+    import scheduler
+
+    network.online = True
+    inky_frame.wake = wake
+    # Seconds waited awake polling the buttons and asleep on the RTC timer
+    idle = []
+    slept = []
+    asleep = [False]
+
+    def wait(ms):
+        (slept if asleep[0] else idle).append(ms / 1000)
+        emu.advance(ms // 1000)
+
+    def sleep(page, seconds):
+        asleep[0] = True
+        try:
+            return real_sleep(page, seconds)
+        finally:
+            asleep[0] = False
+    real_sleep = scheduler.sleep
+    inputs.wait = wait
+    scheduler.sleep = sleep
+    main.update_interval = interval
+    gfx = main.graphics
+    start = emu.clock
+    wakes = joins = refreshes = fetches = 0
+    mah = 0.0
+    while emu.clock - start < days * 86400:
+        day = (emu.clock - start) / 86400
+        breakout_bme69x.reading[0] = 19 + 3 * math.sin(2 * math.pi * day)
+        breakout_bme69x.reading[2] = 50 + 8 * math.sin(2 * math.pi * day + 1)
+        before = (network.joins, gfx.refreshed, counts["fetch"])
+        draw(main, page)
+        joined = network.joins > before[0]
+        refreshed = gfx.refreshed > before[1]
+        wakes += 1
+        joins += joined
+        refreshes += refreshed
+        fetches += counts["fetch"] - before[2]
+        mah += (AWAKE_S * AWAKE_MA + joined * WIFI_S * WIFI_MA + refreshed * REFRESH_S * REFRESH_MA) / 3600
+        emu.advance(AWAKE_S + joined * WIFI_S + refreshed * REFRESH_S)
+        del idle[:]
+        del slept[:]
+        main.wait_for_input(page)
+        mah += (sum(idle) * AWAKE_MA + sum(slept) * SLEEP_MA) / 3600
+    scheduler.sleep = real_sleep
+    span = (emu.clock - start) / 86400
+    return {"wakes": wakes / span, "joins": joins / span, "fetches": fetches / span,
+            "refreshes": refreshes / span, "mah": mah / span}
+
+
+counts = {"fetch": 0}
+
+
+def main_():
+    parser = argparse.ArgumentParser(description = "Projected battery life for the refresh schedule")
+    parser.add_argument("pages", nargs = "*", help = "pages to simulate, all by default")
+    parser.add_argument("--interval", type = int, default = 900, help = "update interval in seconds")
+    parser.add_argument("--days", type = float, default = 3)
+    parser.add_argument("--capacity", type = float, default = 1200, help = "battery capacity in mAh")
+    parser.add_argument("--wake", default = "rtc", choices = ("rtc", "button", "power"), help = "wake reason every wake reports")
+    args = parser.parse_args()
+
+    main = bench.setup()
+    import news
+    import wxdata
+    weather = wxdata.data
+    headlines = news.headlines
+
+    # Fetches always succeed and return what the fixtures hold
+    def fetch_weather(loc):
+        counts["fetch"] += 1
+        wxdata.fetched = emu.clock
+        wxdata.stale = False
+        return weather
+
+    def fetch_news(api_key):
+        counts["fetch"] += 1
+        news.fetched = emu.clock
+        news.stale = False
+        return headlines
+    wxdata.fetch = fetch_weather
+    news.fetch = fetch_news
+
+    print("{:<10} {:>8} {:>8} {:>8} {:>8} {:>10} {:>9}".format(
+        "page", "wakes/d", "joins/d", "fetch/d", "panel/d", "mAh/day", "days"))
+    out = sys.stdout
+    for page in args.pages or PAGES:
+        # The pages print a line per fetch and refresh, keep the table readable
+        sys.stdout = io.StringIO()
+        try:
+            r = simulate(main, page, args.interval, args.days, args.wake)
+        finally:
+            sys.stdout = out
+        print("{:<10} {:>8.1f} {:>8.1f} {:>8.1f} {:>8.1f} {:>10.1f} {:>9.1f}".format(
+            page, r["wakes"], r["joins"], r["fetches"], r["refreshes"], r["mah"], args.capacity / r["mah"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
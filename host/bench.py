@@ -0,0 +1,268 @@
+# Render benchmarks on the host emulator. Draws each page from the
+# fixtures with a frozen clock, times it, and counts the PicoGraphics calls
+# it makes. With a baseline file it exits 1 when a page makes more calls
+# than the baseline or gets slower by more than the time tolerance.
+#
+# "allocs" approximates heap allocations per render: the growth in live
+# blocks over every bytecode, summed, so short lived temporaries count too.
+# Frames CPython makes for calls and work inside the emulator are left out.
+# CPython also boxes ints above 256, which MicroPython does not, so the
+# counts run high for number crunching code. Compare them with each other
+# only, not with a device.
+#
+#   python3 host/bench.py                      print results
+#   python3 host/bench.py --check              compare with host/baseline.json
+#   python3 host/bench.py --update             rewrite host/baseline.json
+#   python3 host/bench.py --png out/           also save each page as a PNG
+
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+import emu
+
+BASELINE = os.path.join(emu.HOST, "baseline.json")
+# Call counts that are compared with the baseline
+COUNTED = ("measure_text", "rectangle", "text", "set_pen", "line", "allocs")
+LOCATION = [51.5, -0.12]
+
+cases = {}
+
+
+def case(name):
+    def register(fn):
+        cases[name] = fn
+        return fn
+    return register
+
+
+def setup():
+    # Boots the parts of main the pages need, with data from the fixtures
+    emu.install()
+    import datetime
+    import helper as ih
+    import jsonpull
+    import main
+    import news
+    import sensorlog
+    import wxdata
+    from breakout_bme69x import BreakoutBME69X, STATUS_HEATER_STABLE
+
+    ih.cfg.update({"API_KEY": "test", "LOCATION_NAME": "London", "LOCATION": LOCATION, "UPDATE_INTERVAL": 900})
+    main.location = LOCATION
+    main.location_name = "London"
+    main.update_interval = 900
+    main.sensor = True
+    main.graphics = main.setup_graphics()
+    main.bme = sensorlog.bme = BreakoutBME69X(None)
+    sensorlog.heater_stable = STATUS_HEATER_STABLE
+    # A day of readings for the sparklines
+    now = time.time()
+    for i in range(sensorlog.CAPACITY):
+        t = i / sensorlog.CAPACITY
+        sensorlog.add(now - (sensorlog.CAPACITY - i) * sensorlog.SAMPLE_S, 18 + 4 * t, 100800 + 600 * t, 45 + 10 * t)
+
+    wxdata.data = jsonpull.load(io.BytesIO(emu.fixture("open-meteo.json")), wxdata.SPEC)
+    # Page times are local to the forecast, as after a real fetch
+    datetime.set_offset(wxdata.data.get("utc_offset_seconds", 0))
+    wxdata.fetched = now
+    wxdata.location = LOCATION
+    response = jsonpull.load(io.BytesIO(emu.fixture("guardian.json")), news.SPEC)["response"]
+    news.headlines = [news.clean(r["webTitle"]) for r in response["results"]]
+    news.fetched = now
+    return main
+
+
+@case("home")
+def home(main):
+    main.dashboard()
+
+
+@case("wx_now")
+def wx_now(main):
+    main.draw_weather("now")
+
+
+@case("wx_hourly")
+def wx_hourly(main):
+    main.draw_weather("hourly")
+
+
+@case("wx_daily")
+def wx_daily(main):
+    main.draw_weather("daily")
+
+
+@case("qr")
+def qr(main):
+    main.graphics.set_pen(1)
+    main.graphics.clear()
+    main.draw_qr_code(main.graphics, 430, 10, 200, "WIFI:T:WPA;S:PICO_W;P:PICOWINKYFRAME4;;")
+
+
+def draw_qr_code_per_pixel(gfx, ox, oy, size, code):
+    # draw_qr_code as main.py had it before run-length drawing: it loops
+    # over the pixel size rather than the module count and draws one
+    # rectangle per dark module. Kept to compare with the qr case.
+    w, h = code.get_size()
+    module_size = int(size / w)
+    size = module_size * w
+    gfx.set_pen(1)
+    gfx.rectangle(ox, oy, size, size)
+    gfx.set_pen(0)
+    for x in range(size):
+        for y in range(size):
+            if code.get_module(x, y):
+                gfx.rectangle(ox + x * module_size, oy + y * module_size, module_size, module_size)
+
+
+@case("qr_per_pixel")
+def qr_per_pixel(main):
+    import qrcode
+    code = qrcode.QRCode()
+    code.set_text("WIFI:T:WPA;S:PICO_W;P:PICOWINKYFRAME4;;")
+    main.graphics.set_pen(1)
+    main.graphics.clear()
+    draw_qr_code_per_pixel(main.graphics, 430, 10, 200, code)
+
+
+@case("tsdb_week")
+def tsdb_week(main):
+    import tsdb
+    if not tsdb.enabled:
+        tsdb.open_store()
+        end = time.time()
+        for stamp in range(end - 7 * 86400, end, 300):
+            tsdb.append(stamp, (2000, 10100, 5000, 520))
+    end = time.time()
+    tsdb.query("temp", end - 7 * 86400, end, 200)
+
+
+def count_allocs(fn, *args):
+    total = 0
+    last = sys.getallocatedblocks()
+    skip = (emu.STUBS, os.path.abspath(emu.__file__))
+
+    def local(frame, event, arg):
+        # Growth over each opcode, so temporaries made and dropped within a
+        # line are still seen. The frame object CPython makes for a traced
+        # call is not counted, MicroPython keeps call frames off the heap.
+        nonlocal total, last
+        blocks = sys.getallocatedblocks()
+        if blocks > last:
+            total += blocks - last
+        last = blocks
+        return local
+
+    def ignored(frame, event, arg):
+        # Emulator frames, whatever they allocate is not the firmware's
+        nonlocal last
+        if event == "return":
+            last = sys.getallocatedblocks()
+        return ignored
+
+    def call(frame, event, arg):
+        nonlocal total, last
+        blocks = sys.getallocatedblocks()
+        if frame.f_code.co_filename.startswith(skip):
+            if blocks - 1 > last:
+                total += blocks - 1 - last
+            frame.f_trace_lines = False
+            return ignored
+        if blocks - 1 > last:
+            total += blocks - 1 - last
+        last = blocks
+        frame.f_trace_lines = False
+        frame.f_trace_opcodes = True
+        return local
+    sys.settrace(call)
+    try:
+        fn(*args)
+    finally:
+        sys.settrace(None)
+    return total
+
+
+def run(names, runs, png = None):
+    main = setup()
+    gfx = main.graphics.gfx
+    results = {}
+    for name in names:
+        times = []
+        for i in range(runs):
+            gfx.reset_counts()
+            start = time.perf_counter()
+            cases[name](main)
+            times.append((time.perf_counter() - start) * 1000)
+        counts = dict(gfx.counts)
+        # Warm runs above filled the caches, so this counts steady state
+        counts["allocs"] = min(count_allocs(cases[name], main) for _ in range(3))
+        result = {"ms": round(statistics.median(times), 2)}
+        for call in COUNTED:
+            result[call] = counts.get(call, 0)
+        results[name] = result
+        if png:
+            os.makedirs(png, exist_ok = True)
+            gfx.save_png(os.path.join(png, name + ".png"))
+    return results
+
+
+def compare(results, baseline, time_tolerance):
+    # Lines describing each regression against the baseline
+    problems = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for call in COUNTED:
+            # Counts added since the baseline was written are not compared
+            if call in base and result[call] > base[call]:
+                problems.append("{}: {} {} > {}".format(name, call, result[call], base[call]))
+        if result["ms"] > base["ms"] * (1 + time_tolerance):
+            problems.append("{}: {}ms > {}ms +{}%".format(name, result["ms"], base["ms"], int(time_tolerance * 100)))
+    return problems
+
+
+def main_():
+    parser = argparse.ArgumentParser(description = "Page render benchmarks on the host emulator")
+    parser.add_argument("cases", nargs = "*", help = "cases to run, all by default")
+    parser.add_argument("--runs", type = int, default = 5)
+    parser.add_argument("--check", action = "store_true", help = "fail on regressions against the baseline")
+    parser.add_argument("--update", action = "store_true", help = "write the results as the new baseline")
+    parser.add_argument("--baseline", default = BASELINE)
+    parser.add_argument("--time-tolerance", type = float, default = 1.0,
+                        help = "allowed slowdown as a fraction, host timings are noisy")
+    parser.add_argument("--png", help = "directory to save page images in")
+    args = parser.parse_args()
+    # The emulator changes directory into its filesystem
+    args.baseline = os.path.abspath(args.baseline)
+    if args.png:
+        args.png = os.path.abspath(args.png)
+
+    names = args.cases or list(cases)
+    results = run(names, args.runs, args.png)
+    print("{:<10} {:>9} ".format("case", "ms") + " ".join("{:>12}".format(c) for c in COUNTED))
+    for name, result in results.items():
+        print("{:<10} {:>9} ".format(name, result["ms"]) + " ".join("{:>12}".format(result[c]) for c in COUNTED))
+
+    if args.update:
+        with open(args.baseline, "w") as f:
+            f.write(json.dumps(results, indent = 2, sort_keys = True) + "\n")
+        print("Baseline written to", args.baseline)
+        return 0
+    if args.check:
+        with open(args.baseline, "r") as f:
+            baseline = json.loads(f.read())
+        problems = compare(results, baseline, args.time_tolerance)
+        for line in problems:
+            print("REGRESSION", line)
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
@@ -0,0 +1,155 @@
+# Time to first update at boot, against stubbed network latencies. For a
+# wake whose page data is due it times from power on to the start page
+# being drawn two ways: the serial order init() used to have (join, NTP,
+# sensor, display, SD card, then the page fetches its data) and init() as
+# it is now, where the sensor and display are set up while the radio
+# associates and the prefetch warms the page's caches. Both clock states
+# are reported: "sync" for the wake about once a day that also needs NTP,
+# "fresh" for every other wake. The stubs block for their latency the way
+# the real calls do, the join only polls. The panel refresh itself is left
+# out, it costs the same either way. Stage traces of the last init() runs
+# follow the table.
+#
+#   python3 host/boottrace.py
+#   python3 host/boottrace.py wx_hourly --join-ms 1000 4000 8000 --fetch-ms 1500
+
+import argparse
+import io
+import os
+import sys
+import time
+
+HOST = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HOST)
+import bench
+
+PAGES = ("home", "wx_now", "wx_hourly", "wx_daily")
+
+
+def slow(fn, ms):
+    def call(*args):
+        time.sleep(ms / 1000)
+        return fn(*args)
+    return call
+
+
+def draw(main, page):
+    if page == "home":
+        main.dashboard()
+    else:
+        main.draw_weather(page[3:])
+
+
+def cold(main):
+    # Empty caches and a radio that is off, as after power on
+    import netman
+    import news
+    import wxdata
+    netman.radio_off()
+    netman.state["retry_at"] = 0
+    wxdata.data = wxdata.fetched = None
+    news.headlines = news.fetched = None
+
+
+async def serial_init(main):
+    # init() before the pipeline: everything one after another
+    import datetime
+    import helper as ih
+    import netman
+    await netman.connect(ih.cfg["WIFI_SSID"], ih.cfg["WIFI_PASSWORD"])
+    if datetime.needs_sync():
+        datetime.update()
+    main.bme = main.setup_sensor()
+    main.graphics = main.setup_graphics()
+    main.sd = main.setup_storage()
+
+
+def serial(main, page):
+    import uasyncio as asyncio
+    cold(main)
+    t = time.perf_counter()
+    asyncio.run(serial_init(main))
+    draw(main, page)
+    return (time.perf_counter() - t) * 1000
+
+
+def pipelined(main, page):
+    import helper as ih
+    cold(main)
+    t = time.perf_counter()
+    main.graphics, main.sd, main.bme, main.wifi, main.sensor = main.init(ih.cfg["WIFI_PASSWORD"], ih.cfg["WIFI_SSID"], page)
+    draw(main, page)
+    return (time.perf_counter() - t) * 1000
+
+
+def main_():
+    parser = argparse.ArgumentParser(description = "Boot time to first update, serial against pipelined init")
+    parser.add_argument("page", nargs = "?", default = "home", choices = PAGES)
+    parser.add_argument("--join-ms", type = int, nargs = "*", default = [1000, 3000, 6000], help = "stubbed Wi-Fi join times")
+    parser.add_argument("--ntp-ms", type = int, default = 300, help = "stubbed NTP round trip")
+    parser.add_argument("--fetch-ms", type = int, default = 800, help = "stubbed time for each API fetch")
+    parser.add_argument("--setup-ms", type = int, default = 400, help = "stubbed time for each of sensor, display and SD setup")
+    args = parser.parse_args()
+
+    main = bench.setup()
+    import datetime
+    import helper as ih
+    import network
+    import news
+    import ntptime
+    import pipeline
+    import wxdata
+    ih.cfg.update({"WIFI_SSID": "HOME", "WIFI_PASSWORD": "password"})
+    network.online = True
+    ntptime.delay_ms = args.ntp_ms
+    for name in ("setup_sensor", "setup_graphics", "setup_storage"):
+        setattr(main, name, slow(getattr(main, name), args.setup_ms))
+
+    # Fetches take fetch_ms and return the fixture data
+    weather = wxdata.data
+    headlines = news.headlines
+
+    def fetch_weather(loc):
+        time.sleep(args.fetch_ms / 1000)
+        wxdata.data = weather
+        wxdata.fetched = time.time()
+        wxdata.location = loc
+        wxdata.stale = False
+        return weather
+
+    def fetch_news(api_key):
+        time.sleep(args.fetch_ms / 1000)
+        news.headlines = headlines
+        news.fetched = time.time()
+        news.stale = False
+        return headlines
+    wxdata.fetch = fetch_weather
+    news.fetch = fetch_news
+
+    print("{:<6} {:<8} {:>10} {:>10} {:>8}".format("clock", "join ms", "serial", "pipelined", "saved"))
+    out = sys.stdout
+    traces = {}
+    for clock in ("sync", "fresh"):
+        datetime.needs_sync = lambda now = None, sync = clock == "sync": sync
+        for join_ms in args.join_ms:
+            network.join_ms = join_ms
+            # init() and the pages print as they go, keep the table readable
+            sys.stdout = io.StringIO()
+            try:
+                before = serial(main, args.page)
+                after = pipelined(main, args.page)
+            finally:
+                sys.stdout = out
+            traces[clock] = list(pipeline.trace)
+            print("{:<6} {:<8} {:>8.0f}ms {:>8.0f}ms {:>8.0f}ms".format(clock, join_ms, before, after, before - after))
+
+    for clock, trace in traces.items():
+        print()
+        print("init() stages, {} clock, {} ms join:".format(clock, args.join_ms[-1]))
+        pipeline.trace[:] = trace
+        pipeline.report()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
@@ -0,0 +1,115 @@
+# Idle duty cycle of the button polling on a simulated clock. Swaps
+# inputs.ticks_ms and inputs.sleep_ms for a clock that only moves when a
+# button read costs time or the loop sleeps, then waits out an idle window
+# two ways: the busy loop the pages used to run (every button and the RTC
+# read back to back, no sleep) and inputs.wait(). It also presses a button
+# part way through a window and checks inputs.wait() returns it within the
+# debounce time. Exits 1 when a check fails.
+#
+# The clock counts fractional ms, so a poll shorter than a tick still shows
+# up in busy_ms. On the device ticks_ms() whole ms round those polls down.
+#
+#   python3 host/duty.py
+#   python3 host/duty.py --read-us 200 --window 120
+
+import argparse
+import os
+import sys
+
+HOST = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HOST)
+import emu
+
+# The old loops read the five buttons and then machine.RTC().datetime()
+OLD_DUTY_MIN = 0.99
+# Most the polling loop may be awake for
+NEW_DUTY_MAX = 0.01
+
+now = [0.0]
+
+
+def ticks_ms():
+    return now[0]
+
+
+def sleep_ms(ms):
+    now[0] += ms
+
+
+class Button:
+    # Held from press_at for hold_ms, each read costs read_us
+    def __init__(self, read_us):
+        self.read_us = read_us
+        self.press_at = None
+        self.hold_ms = 0
+
+    def read(self):
+        now[0] += self.read_us / 1000
+        return self.press_at is not None and self.press_at <= now[0] < self.press_at + self.hold_ms
+
+
+def busy_loop(buttons, window_ms, rtc_us):
+    # The loops home(), weather() and settings() had, returns the duty cycle
+    start = now[0]
+    busy = 0.0
+    while now[0] - start < window_ms:
+        t = now[0]
+        for b in buttons:
+            if b.read():
+                return 1.0
+        now[0] += rtc_us / 1000
+        busy += now[0] - t
+    return busy / (now[0] - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Button polling duty cycle on a simulated clock")
+    parser.add_argument("--window", type = float, default = 60, help = "idle window in seconds")
+    parser.add_argument("--read-us", type = float, default = 50, help = "cost of one button read")
+    parser.add_argument("--rtc-us", type = float, default = 30, help = "cost of one RTC read in the old loop")
+    args = parser.parse_args()
+
+    emu.install()
+    import inputs
+    buttons = [Button(args.read_us) for _ in range(5)]
+    inputs.BUTTONS = buttons
+    inputs.ticks_ms = ticks_ms
+    inputs.ticks_diff = lambda a, b: a - b
+    inputs.sleep_ms = sleep_ms
+    inputs.idle_hook = None
+    window = int(args.window * 1000)
+
+    failed = []
+
+    def check(ok, text):
+        print("{}  {}".format("ok  " if ok else "FAIL", text))
+        if not ok:
+            failed.append(text)
+
+    before = busy_loop(buttons, window, args.rtc_us)
+    inputs.reset_stats()
+    pressed = inputs.wait(window)
+    after = inputs.duty_cycle()
+    polls = window / inputs.POLL_MS
+    print("{} s idle: busy loop awake {:.1f}%, inputs.wait awake {:.3f}% over {:.0f} polls".format(
+        args.window, before * 100, after * 100, polls))
+    check(before >= OLD_DUTY_MIN, "busy loop duty cycle {:.3f} >= {}".format(before, OLD_DUTY_MIN))
+    check(after <= NEW_DUTY_MAX, "inputs.wait duty cycle {:.4f} <= {}".format(after, NEW_DUTY_MAX))
+    check(pressed is None, "no press reported in an idle window")
+
+    # Button C pressed a third of the way in, held for a short tap
+    press_at = now[0] + window / 3 + 17
+    buttons[2].press_at = press_at
+    buttons[2].hold_ms = 250
+    inputs.reset_stats()
+    pressed = inputs.wait(window)
+    latency = now[0] - press_at
+    limit = inputs.POLL_MS * inputs.DEBOUNCE
+    print("Tap on button C: returned {} after {:.1f} ms, awake {:.3f}%".format(pressed, latency, inputs.duty_cycle() * 100))
+    check(pressed == 2, "tap reported as button C")
+    check(latency <= limit, "tap seen within {} ms".format(limit))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
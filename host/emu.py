@@ -0,0 +1,197 @@
+# Runs the firmware modules under CPython. install() puts the stand-ins in
+# host/stubs ahead of the repo on sys.path, adds the MicroPython parts of
+# time and gc, freezes the wall clock, and maps the device filesystem
+# ("/config.json", "/sd/...") onto a host directory so nothing is written
+# outside it.
+#
+#   import emu
+#   emu.install()
+#   import main
+#
+# The repo has its own datetime module, which replaces the standard one
+# for everything imported after install().
+
+import builtins
+import calendar
+import gc
+import os
+import socket
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+HOST = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(HOST)
+STUBS = os.path.join(HOST, "stubs")
+
+# 2026-10-17 14:20 UTC, the time host/fixtures were made for
+EPOCH = calendar.timegm((2026, 10, 17, 14, 20, 0))
+
+# RP2040 heap the gc figures are reported against
+HEAP_BYTES = 192 * 1024
+
+root = None
+clock = EPOCH
+# Top level host directories, left unmapped
+_host_dirs = ()
+
+_open = builtins.open
+_os = {}
+_gmtime = time.gmtime
+_start = time.perf_counter()
+
+
+def path(p):
+    # Host path for a device path. Absolute paths are mapped into root
+    # unless their first part is a real host directory.
+    if isinstance(p, str) and p.startswith("/") and root is not None:
+        if p[1:].split("/", 1)[0] not in _host_dirs:
+            return os.path.join(root, p[1:])
+    return p
+
+
+def advance(seconds):
+    global clock
+    clock += seconds
+
+
+def ticks_ms():
+    return int((time.perf_counter() - _start) * 1000)
+
+
+def ticks_us():
+    return int((time.perf_counter() - _start) * 1000000)
+
+
+def ticks_diff(a, b):
+    return a - b
+
+
+def ticks_add(a, b):
+    return a + b
+
+
+def _time():
+    return clock
+
+
+def _gm(stamp = None):
+    return _gmtime(clock if stamp is None else stamp)
+
+
+def _mem_alloc():
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+    return 0
+
+
+def _mem_free():
+    return max(0, HEAP_BYTES - _mem_alloc())
+
+
+def _wrap(name):
+    real = getattr(os, name)
+    _os[name] = real
+
+    def call(p, *args, **kwargs):
+        return real(path(p), *args, **kwargs)
+    setattr(os, name, call)
+
+
+def _rename(a, b):
+    _os["rename"](path(a), path(b))
+
+
+def install(fs = None):
+    # fs is the host directory standing in for the device filesystem, a
+    # fresh temporary one by default
+    global root, _host_dirs
+    if root is not None:
+        return root
+    root = fs or tempfile.mkdtemp(prefix = "inky-fs-")
+    _host_dirs = set(d for d in os.listdir("/") if os.path.isdir("/" + d)) - {"sd"}
+    os.makedirs(os.path.join(root, "sd"), exist_ok = True)
+
+    # Stubs win over the repo, the repo wins over the standard library
+    for p in (REPO, STUBS):
+        if p in sys.path:
+            sys.path.remove(p)
+        sys.path.insert(0, p)
+    if "datetime" in sys.modules and not sys.modules["datetime"].__file__.startswith(REPO):
+        del sys.modules["datetime"]
+
+    time.ticks_ms = ticks_ms
+    time.ticks_us = ticks_us
+    time.ticks_diff = ticks_diff
+    time.ticks_add = ticks_add
+    time.sleep_ms = lambda ms: time.sleep(ms / 1000)
+    time.sleep_us = lambda us: time.sleep(us / 1000000)
+    time.time = _time
+    # MicroPython keeps no timezone, local time is UTC
+    time.gmtime = _gm
+    time.localtime = _gm
+    gc.mem_alloc = _mem_alloc
+    gc.mem_free = _mem_free
+
+    def _open_mapped(file, *args, **kwargs):
+        return _open(path(file), *args, **kwargs)
+    builtins.open = _open_mapped
+    for name in ("stat", "remove", "mkdir", "listdir"):
+        _wrap(name)
+    _os["rename"] = os.rename
+    os.rename = _rename
+    os.mount = lambda *args: None
+    os.sync = lambda: None
+
+    os.chdir(root)
+    return root
+
+
+class Socket:
+    # MicroPython style stream socket (read, readline, write) over a host one
+    def __init__(self, *args):
+        self.sock = socket.socket(*args)
+        self.file = None
+
+    def settimeout(self, seconds):
+        self.sock.settimeout(seconds)
+
+    def connect(self, addr):
+        self.sock.connect(addr)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.file = self.sock.makefile("rwb", buffering = 0)
+
+    def read(self, n = -1):
+        if n < 0:
+            return self.file.read()
+        return self.sock.recv(n)
+
+    def readline(self):
+        # Byte at a time like MicroPython, so nothing past the line is consumed
+        line = bytearray()
+        while not line.endswith(b"\n"):
+            c = self.sock.recv(1)
+            if not c:
+                break
+            line += c
+        return bytes(line)
+
+    def write(self, data):
+        self.sock.sendall(data)
+        return len(data)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        self.sock.close()
+
+
+# Stand-in for the socket module as httpc uses it: httpc.socket = emu.sockets
+sockets = types.SimpleNamespace(getaddrinfo = socket.getaddrinfo, SOCK_STREAM = socket.SOCK_STREAM, socket = Socket)
+
+
+def fixture(name):
+    with _open(os.path.join(HOST, "fixtures", name), "rb") as f:
+        return f.read()
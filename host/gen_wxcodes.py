@@ -0,0 +1,65 @@
+# Builds wxcodes.py from weathercodes.json. Only the day and night
+# descriptions are kept, the image URLs are dropped.
+#
+#   python3 host/gen_wxcodes.py           rewrite wxcodes.py
+#   python3 host/gen_wxcodes.py --check   exit 1 if wxcodes.py is out of date
+
+import argparse
+import json
+import os
+import sys
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE = os.path.join(REPO, "weathercodes.json")
+TARGET = os.path.join(REPO, "wxcodes.py")
+
+HEADER = """# WMO weather code -> (day description, night description).
+# Generated from weathercodes.json with the image URLs dropped, so looking a
+# code up needs no file read or JSON parse on the render path.
+"""
+
+FOOTER = '''
+
+def describe(code, is_day=True):
+    entry = CODES.get(code)
+    if entry is None:
+        return "Unknown"
+    if is_day:
+        return entry[0]
+    return entry[1]
+'''
+
+
+def generate():
+    with open(SOURCE, "r") as f:
+        codes = json.loads(f.read())
+    lines = [HEADER, "CODES = {"]
+    for code in sorted(codes, key = int):
+        entry = codes[code]
+        lines.append("    {}: ({}, {}),".format(int(code), json.dumps(entry["day"]["description"]),
+                                               json.dumps(entry["night"]["description"])))
+    lines.append("}")
+    return "\n".join(lines) + "\n" + FOOTER
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Build wxcodes.py from weathercodes.json")
+    parser.add_argument("--check", action = "store_true", help = "only check wxcodes.py is up to date")
+    args = parser.parse_args()
+    text = generate()
+    with open(TARGET, "r") as f:
+        current = f.read()
+    if args.check:
+        if current != text:
+            print("wxcodes.py is out of date, run host/gen_wxcodes.py")
+            return 1
+        return 0
+    if current != text:
+        with open(TARGET, "w") as f:
+            f.write(text)
+        print("Wrote", TARGET)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+# Page switch latency on the host emulator. Drives router.run() with a
+# scripted series of nav presses that takes every page to every other
+# page, and times each switch from the press being read to the next page
+# being drawn and waiting for input again. The 0.5 s LED hold after a press
+# is left out. For comparison it then times what a press used to cost, a
+# reset: init() with the Wi-Fi join and NTP sync the old boot always did,
+# against stubbed join and NTP latencies, followed by drawing the page.
+#
+#   python3 host/pageswitch.py
+#   python3 host/pageswitch.py --rounds 5 --join-ms 4000 --ntp-ms 800
+
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+
+HOST = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HOST)
+import bench
+
+# Nav buttons to press from home, each of the 12 switches between the four
+# data pages once. The settings page runs the web server, so it is left out.
+TOUR = (1, 2, 3, 0, 2, 0, 3, 1, 3, 2, 1, 0)
+
+
+class Done(Exception):
+    pass
+
+
+def resident(main, rounds):
+    # ms per switch, keyed by (from page, to page)
+    import inputs
+    import router
+    main.register_pages()
+    presses = list(TOUR) * rounds
+    times = {}
+    # The page the last press was made on and when it was read
+    pressed = [None, None]
+
+    def wait(timeout_ms):
+        # Called once the page router.current is drawn
+        if pressed[0] is not None:
+            key = (pressed[0], router.current)
+            times.setdefault(key, []).append((time.perf_counter() - pressed[1]) * 1000)
+        if not presses:
+            raise Done()
+        pressed[0] = router.current
+        pressed[1] = time.perf_counter()
+        return presses.pop(0)
+
+    sleep = time.sleep
+    inputs.wait = wait
+    time.sleep = lambda s: None
+    try:
+        router.run("home")
+    except Done:
+        pass
+    finally:
+        time.sleep = sleep
+    return times
+
+
+def reset(main, page):
+    # ms for init() with a full Wi-Fi join and NTP sync, then drawing page
+    import datetime
+    import helper as ih
+    import netman
+    datetime.needs_sync = lambda now = None: True
+    netman.radio_off()
+    netman.state["retry_at"] = 0
+    t = time.perf_counter()
+    main.graphics, main.sd, main.bme, main.wifi, main.sensor = main.init(ih.cfg["WIFI_PASSWORD"], ih.cfg["WIFI_SSID"], page)
+    if page == "home":
+        main.dashboard()
+    else:
+        main.draw_weather(page[3:])
+    return (time.perf_counter() - t) * 1000
+
+
+def main_():
+    parser = argparse.ArgumentParser(description = "Page switch latency, router against reset")
+    parser.add_argument("--rounds", type = int, default = 3, help = "times to repeat the tour of switches")
+    parser.add_argument("--join-ms", type = int, default = 3000, help = "stubbed Wi-Fi join time")
+    parser.add_argument("--ntp-ms", type = int, default = 500, help = "stubbed NTP round trip")
+    args = parser.parse_args()
+
+    main = bench.setup()
+    import helper as ih
+    import network
+    import ntptime
+    import router
+    ih.cfg.update({"WIFI_SSID": "HOME", "WIFI_PASSWORD": "password"})
+    network.online = True
+    network.join_ms = args.join_ms
+    ntptime.delay_ms = args.ntp_ms
+
+    out = sys.stdout
+    # The pages print a line per refresh, keep the table readable
+    sys.stdout = io.StringIO()
+    try:
+        times = resident(main, args.rounds)
+        resets = {page: reset(main, page) for page in router.NAV[:4]}
+    finally:
+        sys.stdout = out
+
+    print("{:<22} {:>8} {:>8}".format("switch", "median", "max"))
+    every = []
+    for (a, b), ms in sorted(times.items()):
+        every += ms
+        print("{:<22} {:>6.1f}ms {:>6.1f}ms".format(a + " -> " + b, statistics.median(ms), max(ms)))
+    print("{:<22} {:>6.1f}ms {:>6.1f}ms".format("all switches", statistics.median(every), max(every)))
+    print()
+    print("{:<22} {:>8} {:>8}".format("reset into", "ms", "x"))
+    for page, ms in resets.items():
+        into = [t for (a, b), v in times.items() if b == page for t in v]
+        print("{:<22} {:>6.0f}ms {:>7.0f}x".format(page, ms, ms / statistics.median(into)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
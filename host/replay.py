@@ -0,0 +1,332 @@
+# Record / replay harness for the data fetches. Real responses are
+# recorded once into host/fixtures, then served from a local mock server
+# that can add latency, limit bandwidth, split the body into chunks and
+# inject failures. wxdata.fetch and news.fetch run against it unchanged
+# through httpc, and each request reports wall time, parse CPU time, peak
+# allocation and the connections it opened. A last table fetches each
+# source with jsonpull and again with json.loads on the whole body, as
+# response.json() used to, to compare their peak heap.
+#
+#   python3 host/replay.py record --api-key KEY    refresh the fixtures
+#   python3 host/replay.py                         run every scenario
+#   python3 host/replay.py slow truncated          run some of them
+#   python3 host/replay.py --list                  list the scenarios
+#
+# Each source gets its own mock server process, so the sources sit on
+# different hosts as they do for real and the server work does not show
+# up in the parse times.
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import time
+import tracemalloc
+# Imported before emu.install() replaces the standard datetime
+import urllib.request
+
+HOST = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(HOST, "fixtures")
+INDEX = os.path.join(FIXTURES, "index.json")
+
+LOCATION = [51.5, -0.12]
+
+# Served content-length, full speed, unless a scenario says otherwise:
+#   latency_ms   wait before the response headers
+#   bandwidth    bytes per second for the body
+#   chunk        bytes per write, sent chunked when "chunked" is set
+#   fail         "truncate" (close half way), "status" (HTTP 500),
+#                "oversize" (pad the body past httpc.MAX_BODY)
+#   etag         honour If-None-Match with the recorded ETag
+SCENARIOS = {
+    "fast": {},
+    "slow": {"latency_ms": 400, "bandwidth": 16 * 1024, "chunk": 536},
+    "chunked": {"chunked": True, "chunk": 128},
+    "tiny_chunks": {"chunked": True, "chunk": 7},
+    "not_modified": {"etag": True},
+    "truncated": {"fail": "truncate"},
+    "server_error": {"fail": "status"},
+    "oversize": {"fail": "oversize"},
+    "stall": {"latency_ms": 3000},
+}
+# httpc timeouts while replaying, so "stall" trips them quickly
+READ_TIMEOUT = 2
+# Each source is fetched this many times per scenario, so the second run
+# revalidates the first one's ETag
+REPEATS = 2
+
+
+def load_index():
+    with open(INDEX, "r") as f:
+        return json.loads(f.read())
+
+
+# Mock server, run in a child process by "serve"
+
+class Handler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        # Headers and body go out in separate writes, do not let Nagle hold them
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        try:
+            self.requests()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up, as it should in the stall scenarios
+            pass
+
+    def requests(self):
+        # Keep-alive loop, one request per pass
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            method, target, _ = line.decode().split(" ", 2)
+            headers = {}
+            while True:
+                h = self.rfile.readline()
+                if h in (b"\r\n", b"\n", b""):
+                    break
+                k, _, v = h.decode().partition(":")
+                headers[k.strip().lower()] = v.strip()
+            body = self.rfile.read(int(headers.get("content-length", 0)))
+            if target == "/_scenario":
+                self.server.scenario = json.loads(body)
+                self.reply(200, {}, b"ok", {})
+                continue
+            if not self.serve(target, headers):
+                return
+
+    def reply(self, status, headers, body, scenario):
+        head = ["HTTP/1.1 {} {}".format(status, "OK" if status < 400 else "Error")]
+        chunked = scenario.get("chunked") and status == 200
+        if chunked:
+            head.append("Transfer-Encoding: chunked")
+        else:
+            length = len(body)
+            if scenario.get("fail") == "truncate":
+                body = body[:len(body) // 2]
+            head.append("Content-Length: {}".format(length))
+        for k, v in headers.items():
+            head.append("{}: {}".format(k, v))
+        time.sleep(scenario.get("latency_ms", 0) / 1000)
+        self.wfile.write(("\r\n".join(head) + "\r\n\r\n").encode())
+        step = scenario.get("chunk", 1460)
+        rate = scenario.get("bandwidth")
+        for i in range(0, len(body), step):
+            part = body[i:i + step]
+            if chunked:
+                part = "{:x}\r\n".format(len(part)).encode() + part + b"\r\n"
+            self.wfile.write(part)
+            self.wfile.flush()
+            if rate:
+                time.sleep(len(part) / rate)
+        if chunked:
+            self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def serve(self, target, headers):
+        # Returns False when the connection should close
+        scenario = self.server.scenario
+        path = target.split("?", 1)[0]
+        for name, entry in self.server.index.items():
+            if path == entry["path"]:
+                break
+        else:
+            self.reply(404, {}, b"", {})
+            return True
+        if scenario.get("fail") == "status":
+            self.reply(500, {}, b"{}", scenario)
+            return True
+        etag = entry["headers"].get("ETag")
+        if scenario.get("etag") and etag and headers.get("if-none-match") == etag:
+            self.reply(304, {"ETag": etag}, b"", scenario)
+            return True
+        with open(os.path.join(FIXTURES, entry["file"]), "rb") as f:
+            body = f.read()
+        if scenario.get("fail") == "oversize":
+            body = body[:-1] + b"," + b" " * (64 * 1024) + b"}"
+        self.reply(200, entry["headers"], body, scenario)
+        return scenario.get("fail") != "truncate" and headers.get("connection") != "close"
+
+
+class Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve(port):
+    server = Server(("127.0.0.1", port), Handler)
+    server.scenario = {}
+    server.index = load_index()
+    print(server.server_address[1], flush = True)
+    server.serve_forever()
+
+
+# Client side, run under the emulator
+
+def start_server():
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve", "--port", "0"],
+                            stdout = subprocess.PIPE, text = True)
+    port = int(proc.stdout.readline())
+    return proc, port
+
+
+def set_scenario(port, scenario):
+    body = json.dumps(scenario).encode()
+    with socket.create_connection(("127.0.0.1", port)) as s:
+        s.sendall("POST /_scenario HTTP/1.1\r\nHost: mock\r\nContent-Length: {}\r\n\r\n".format(len(body)).encode() + body)
+        s.recv(1024)
+
+
+def json_loads(stream, spec = True, chunk = None):
+    # Stand-in for jsonpull.load that parses the way the fetches did before
+    # it, like urequests' response.json(): the whole body read into RAM and
+    # a dict tree built for all of it. spec is ignored.
+    parts = []
+    while True:
+        data = stream.read()
+        if not data:
+            break
+        parts.append(data)
+    return json.loads(b"".join(parts))
+
+
+def measure(fetch, parser = None):
+    # Runs one fetch, returning (result, wall ms, parse cpu ms, peak bytes).
+    # parser replaces jsonpull.load for the fetch when given.
+    import jsonpull
+    parse = [0.0]
+    real_load = jsonpull.load
+    load = parser or real_load
+
+    def timed_load(*args, **kwargs):
+        start = time.process_time()
+        try:
+            return load(*args, **kwargs)
+        finally:
+            parse[0] += time.process_time() - start
+    jsonpull.load = timed_load
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        fetch()
+        result = "ok"
+    except Exception as e:
+        result = "{}: {}".format(type(e).__name__, e)
+    finally:
+        wall = (time.perf_counter() - start) * 1000
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        jsonpull.load = real_load
+    return result, wall, parse[0] * 1000, peak
+
+
+def replay(names):
+    import emu
+    emu.install()
+    import httpc
+    import news
+    import wxdata
+
+    servers = [start_server(), start_server()]
+    import membudget
+    httpc.socket = emu.sockets
+    httpc.READ_TIMEOUT = READ_TIMEOUT
+    # The probe allocation would swamp the peak figures, the host never runs short
+    membudget.largest_free = lambda limit = membudget.TIGHT_BELOW: limit
+    wxdata.URL = "http://127.0.0.1:{}".format(servers[0][1]) + wxdata.URL.split("open-meteo.com", 1)[1]
+    news.URL = "http://127.0.0.1:{}".format(servers[1][1]) + news.URL.split("guardianapis.com", 1)[1]
+    sources = (("weather", lambda: wxdata.fetch(LOCATION)), ("news", lambda: news.fetch("test")))
+
+    print("{:<13} {:<8} {:>8} {:>9} {:>9} {:>10} {:>4}  {}".format(
+        "scenario", "source", "run", "ms", "parse ms", "peak KB", "hs", "result"))
+    try:
+        for name in names:
+            for _, port in servers:
+                set_scenario(port, SCENARIOS[name])
+            wxdata.etag = news.etag = None
+            for source, fetch in sources:
+                for run in range(REPEATS):
+                    hs = httpc.handshakes
+                    result, wall, parse_ms, peak = measure(fetch)
+                    print("{:<13} {:<8} {:>8} {:>9.1f} {:>9.2f} {:>10.1f} {:>4}  {}".format(
+                        name, source, run + 1, wall, parse_ms, peak / 1024,
+                        httpc.handshakes - hs, result))
+        compare(servers, sources)
+    finally:
+        for proc, _ in servers:
+            proc.terminate()
+            proc.wait()
+
+
+def compare(servers, sources):
+    # Peak heap of each source's fetch, parsed with jsonpull and with json.loads
+    import news
+    import wxdata
+    for _, port in servers:
+        set_scenario(port, SCENARIOS["fast"])
+    print()
+    print("{:<8} {:<11} {:>9} {:>10}  {}".format("source", "parser", "parse ms", "peak KB", "result"))
+    for source, fetch in sources:
+        for name, parser in (("jsonpull", None), ("json.loads", json_loads)):
+            wxdata.etag = news.etag = None
+            result, wall, parse_ms, peak = measure(fetch, parser)
+            print("{:<8} {:<11} {:>9.2f} {:>10.1f}  {}".format(source, name, parse_ms, peak / 1024, result))
+
+
+def record(api_key):
+    # Fetches the live responses and writes them as fixtures
+    import emu
+    emu.install()
+    import news
+    import wxdata
+    index = {}
+    for name, path, url in (("open-meteo", "/v1/forecast", wxdata.URL.format(*LOCATION)),
+                            ("guardian", "/search", news.URL.format(api_key))):
+        with urllib.request.urlopen(url, timeout = 20) as response:
+            body = response.read()
+            kept = {k: v for k, v in response.getheaders() if k.lower() in ("content-type", "etag", "last-modified")}
+        with open(os.path.join(FIXTURES, name + ".json"), "wb") as f:
+            f.write(body)
+        index[name] = {"path": path, "file": name + ".json", "headers": kept}
+        print("Recorded {} bytes for {}".format(len(body), name))
+    with open(INDEX, "w") as f:
+        f.write(json.dumps(index, indent = 2, sort_keys = True) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Replay recorded API responses through the fetch code")
+    parser.add_argument("command", nargs = "*", help = "scenarios to run, or record / serve")
+    parser.add_argument("--api-key", help = "Guardian API key for record")
+    parser.add_argument("--port", type = int, default = 0)
+    parser.add_argument("--list", action = "store_true")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, scenario in SCENARIOS.items():
+            print("{:<13} {}".format(name, json.dumps(scenario)))
+        return 0
+    if args.command[:1] == ["serve"]:
+        serve(args.port)
+        return 0
+    if args.command[:1] == ["record"]:
+        if not args.api_key:
+            parser.error("record needs --api-key")
+        record(args.api_key)
+        return 0
+    names = args.command or list(SCENARIOS)
+    for name in names:
+        if name not in SCENARIOS:
+            parser.error("unknown scenario {}".format(name))
+    replay(names)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
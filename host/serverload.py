@@ -0,0 +1,112 @@
+# Load test for the settings server. Runs pico_server.handle_client under
+# CPython asyncio on a local port and has several keep-alive clients send
+# requests over their own connections at once, a mix of the form page, the
+# stylesheet (revalidated with its ETag) and /metrics, the way a phone
+# loads the page. Reports requests per second and latency percentiles for
+# each number of clients. The clients share the server's event loop, as
+# the device has one core, so the figures are for comparing changes on the
+# host rather than device throughput. Past MAX_CONNECTIONS clients some are
+# turned away with a 503, counted under "refused".
+#
+#   python3 host/serverload.py                      1, 2, 4 and 8 clients
+#   python3 host/serverload.py --clients 4 --requests 500
+
+import argparse
+import asyncio
+import io
+import os
+import statistics
+import sys
+import time
+
+HOST = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HOST)
+import bench
+
+PATHS = ("/", "/style.css", "/metrics")
+
+
+async def request(reader, writer, path, etag):
+    # Sends one GET and reads the response, returns (status, headers)
+    head = "GET {} HTTP/1.1\r\nHost: 192.168.4.1\r\nConnection: keep-alive\r\n".format(path)
+    if etag is not None and path == "/style.css":
+        head += "If-None-Match: {}\r\n".format(etag)
+    writer.write((head + "\r\n").encode())
+    await writer.drain()
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("closed")
+    status = int(line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        key, value = line.decode().split(":", 1)
+        headers[key.strip().lower()] = value.strip()
+    await reader.readexactly(int(headers.get("content-length", 0)))
+    return status, headers
+
+
+async def client(port, count, latencies, refused):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    etag = None
+    try:
+        for i in range(count):
+            t = time.perf_counter()
+            status, headers = await request(reader, writer, PATHS[i % len(PATHS)], etag)
+            if status == 503:
+                refused.append(1)
+                return
+            latencies.append((time.perf_counter() - t) * 1000)
+            etag = headers.get("etag", etag)
+    finally:
+        writer.close()
+
+
+async def run(clients, requests):
+    import pico_server
+    pico_server.server_task = True
+    server = await asyncio.start_server(pico_server.handle_client, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    latencies = []
+    refused = []
+    t = time.perf_counter()
+    await asyncio.gather(*(client(port, requests // clients, latencies, refused) for _ in range(clients)))
+    elapsed = time.perf_counter() - t
+    pico_server.server_task = False
+    server.close()
+    await server.wait_closed()
+    return latencies, len(refused), elapsed
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Settings server throughput and tail latency")
+    parser.add_argument("--clients", type = int, nargs = "*", default = [1, 2, 4, 8])
+    parser.add_argument("--requests", type = int, default = 600, help = "requests per run, split between the clients")
+    args = parser.parse_args()
+
+    bench.setup()
+    print("{:>7} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8}".format(
+        "clients", "requests", "refused", "req/s", "p50 ms", "p95 ms", "p99 ms", "max ms"))
+    out = sys.stdout
+    for clients in args.clients:
+        # The server prints a line per request, keep the table readable
+        sys.stdout = io.StringIO()
+        try:
+            latencies, refused, elapsed = asyncio.run(run(clients, args.requests))
+        finally:
+            sys.stdout = out
+        print("{:>7} {:>8} {:>8} {:>8.0f} {:>8.2f} {:>8.2f} {:>8.2f} {:>8.2f}".format(
+            clients, len(latencies), refused, len(latencies) / elapsed, statistics.median(latencies),
+            percentile(latencies, 95), percentile(latencies, 99), max(latencies)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
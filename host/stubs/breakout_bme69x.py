@@ -0,0 +1,24 @@
+# Host stand-in for the BME69X breakout. read() returns the values in
+# reading, which tests can change.
+
+STATUS_HEATER_STABLE = 0x10
+FILTER_COEFF_3 = 2
+STANDBY_TIME_1000_MS = 5
+OVERSAMPLING_1X = 1
+OVERSAMPLING_2X = 2
+OVERSAMPLING_16X = 5
+
+# temperature C, pressure Pa, humidity %, gas resistance ohms
+reading = [21.4, 101325.0, 48.2, 52000.0]
+
+
+class BreakoutBME69X:
+    def __init__(self, i2c, address = 0x76):
+        self.address = address
+
+    def configure(self, *args):
+        pass
+
+    def read(self, *args):
+        temp, press, humid, gas = reading
+        return temp, press, humid, gas, STATUS_HEATER_STABLE, 0, 0
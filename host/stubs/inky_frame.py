@@ -0,0 +1,74 @@
+# Host stand-in for the Inky Frame support module. Buttons read whatever
+# the test set with press(), and the wake flags are plain module values.
+
+BLACK = 0
+WHITE = 1
+GREEN = 2
+BLUE = 3
+RED = 4
+YELLOW = 5
+ORANGE = 6
+TAUPE = 7
+
+# "button", "rtc", "ext" or None for a power-on boot
+wake = None
+
+
+class Button:
+    def __init__(self, name):
+        self.name = name
+        # Reads left that return True
+        self.held = 0
+        self.led = False
+
+    def read(self):
+        if self.held > 0:
+            self.held -= 1
+            return True
+        return False
+
+    def led_on(self):
+        self.led = True
+
+    def led_off(self):
+        self.led = False
+
+
+class LED:
+    def __init__(self):
+        self.value = 0.0
+        self.level = 1.0
+
+    def brightness(self, level):
+        self.level = level
+
+    def on(self):
+        self.value = self.level
+
+    def off(self):
+        self.value = 0.0
+
+
+button_a = Button("a")
+button_b = Button("b")
+button_c = Button("c")
+button_d = Button("d")
+button_e = Button("e")
+led_busy = LED()
+
+
+def press(i, reads = 4):
+    # Holds button i down for the next reads polls
+    (button_a, button_b, button_c, button_d, button_e)[i].held = reads
+
+
+def woken_by_button():
+    return wake == "button"
+
+
+def woken_by_rtc():
+    return wake == "rtc"
+
+
+def woken_by_ext_trigger():
+    return wake == "ext"
@@ -0,0 +1,89 @@
+# Host stand-in for the MicroPython machine module, enough for the pins,
+# PWM, timers, RTC and buses the firmware touches.
+
+import time
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    PULL_UP = 2
+    PULL_DOWN = 3
+
+    def __init__(self, pin, mode = IN, pull = None, value = None):
+        self.pin = pin
+        self.mode = mode
+        self.level = value or 0
+
+    def init(self, mode = IN, pull = None, value = None):
+        self.mode = mode
+
+    def value(self, level = None):
+        if level is None:
+            return self.level
+        self.level = level
+
+    def on(self):
+        self.level = 1
+
+    def off(self):
+        self.level = 0
+
+
+class PWM:
+    def __init__(self, pin):
+        self.pin = pin
+        self.duty = 0
+
+    def freq(self, hz = None):
+        return 1000
+
+    def duty_u16(self, value = None):
+        if value is None:
+            return self.duty
+        self.duty = value
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id = -1, **kwargs):
+        pass
+
+    def init(self, period = None, mode = PERIODIC, callback = None, freq = None):
+        pass
+
+    def deinit(self):
+        pass
+
+
+class RTC:
+    # (year, month, day, weekday, hour, minute, second, subsecond) from time.time()
+    def datetime(self, value = None):
+        if value is not None:
+            return
+        t = time.gmtime(time.time())
+        return (t[0], t[1], t[2], t[6], t[3], t[4], t[5], 0)
+
+
+class I2C:
+    def __init__(self, id = 0, **kwargs):
+        pass
+
+
+class SPI:
+    def __init__(self, id = 0, **kwargs):
+        pass
+
+
+class ResetError(SystemExit):
+    pass
+
+
+def reset():
+    raise ResetError("machine.reset()")
+
+
+def freq(hz = None):
+    return 125000000
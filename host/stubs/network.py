@@ -0,0 +1,74 @@
+# Host stand-in for the CYW43 network module. A join succeeds when online
+# is True, otherwise it ends with status fail_status, after join_ms of
+# STAT_CONNECTING either way. The link itself is not real, httpc goes
+# through the host socket module.
+
+import time
+
+STA_IF = 0
+AP_IF = 1
+
+STAT_IDLE = 0
+STAT_CONNECTING = 1
+STAT_WRONG_PASSWORD = -3
+STAT_NO_AP_FOUND = -2
+STAT_CONNECT_FAIL = -1
+STAT_GOT_IP = 3
+
+online = False
+fail_status = STAT_NO_AP_FOUND
+joins = 0
+# How long a join stays connecting, 0 for at once
+join_ms = 0
+
+
+class WLAN:
+    def __init__(self, interface = STA_IF):
+        self.interface = interface
+        self._active = False
+        self._status = STAT_IDLE
+        self._joined_at = 0
+        self._ifconfig = ("0.0.0.0", "0.0.0.0", "0.0.0.0", "0.0.0.0")
+
+    def active(self, value = None):
+        if value is None:
+            return self._active
+        self._active = value
+        if not value:
+            self._status = STAT_IDLE
+
+    def config(self, *args, **kwargs):
+        if args:
+            return {"essid": "PICO_W", "ssid": "PICO_W", "mac": b"\x28\xcd\xc1\x00\x00\x01"}.get(args[0])
+
+    def connect(self, ssid = None, key = None, bssid = None):
+        global joins
+        joins += 1
+        self._joined_at = time.perf_counter()
+        self._status = STAT_GOT_IP if online else fail_status
+        if online and self._ifconfig[0] == "0.0.0.0":
+            self._ifconfig = ("192.168.1.50", "255.255.255.0", "192.168.1.1", "192.168.1.1")
+
+    def disconnect(self):
+        self._status = STAT_IDLE
+
+    def status(self, param = None):
+        if param == "rssi":
+            return -55
+        if self._status != STAT_IDLE and (time.perf_counter() - self._joined_at) * 1000 < join_ms:
+            return STAT_CONNECTING
+        return self._status
+
+    def isconnected(self):
+        return self.status() == STAT_GOT_IP
+
+    def ifconfig(self, value = None):
+        if value is None:
+            if self.interface == AP_IF:
+                return ("192.168.4.1", "255.255.255.0", "192.168.4.1", "0.0.0.0")
+            return self._ifconfig
+        if value != "dhcp":
+            self._ifconfig = tuple(value)
+
+    def scan(self):
+        return [(b"HOME", b"\x00\x11\x22\x33\x44\x55", 6, -55, 3, False)]
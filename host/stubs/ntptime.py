@@ -0,0 +1,16 @@
+# Host stand-in for ntptime, answers with the host clock after delay_ms.
+
+timeout = 1
+# Round trip to the NTP server
+delay_ms = 0
+
+
+def time():
+    import time as _time
+    if delay_ms:
+        _time.sleep(delay_ms / 1000)
+    return int(_time.time())
+
+
+def settime():
+    pass
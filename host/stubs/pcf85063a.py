@@ -0,0 +1,27 @@
+# Host stand-in for the PCF85063A RTC. Keeps time with the host clock and
+# remembers the timer it was asked for.
+
+import time
+
+
+class PCF85063A:
+    TIMER_TICK_1_OVER_60HZ = 3
+
+    def __init__(self, i2c):
+        self.timer = None
+
+    def datetime(self, value = None):
+        # (year, month, day, hour, minute, second, weekday)
+        if value is not None:
+            return
+        t = time.gmtime(time.time())
+        return (t[0], t[1], t[2], t[3], t[4], t[5], t[6])
+
+    def clear_timer_flag(self):
+        pass
+
+    def set_timer(self, ticks, ttp = TIMER_TICK_1_OVER_60HZ):
+        self.timer = ticks
+
+    def enable_timer_interrupt(self, enable):
+        pass
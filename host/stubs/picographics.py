@@ -0,0 +1,153 @@
+# Host stand-in for the Pimoroni picographics module. Draws into a 640x400
+# buffer of palette indexes, counts every call, and can write the buffer
+# out as a PNG. Text is drawn as solid blocks per character cell and
+# measured with a fixed per-character width table close to bitmap8.
+
+import struct
+import zlib
+
+DISPLAY_INKY_FRAME_4 = 4
+
+WIDTH = 640
+HEIGHT = 400
+
+# Inky Frame palette, in pen order
+PALETTE = ((0, 0, 0), (255, 255, 255), (0, 160, 0), (0, 0, 200),
+           (220, 0, 0), (240, 220, 0), (240, 130, 0), (180, 160, 120))
+
+# Advance in pixels at scale 1 for bitmap8 characters that are not 6 wide
+_NARROW = {" ": 3, "i": 2, "l": 3, "!": 2, ".": 2, ",": 3, ":": 2, ";": 3, "'": 2,
+           "|": 2, "(": 4, ")": 4, "[": 4, "]": 4, "1": 4, "I": 4, "j": 4, "t": 5,
+           "f": 5, "r": 5, "M": 7, "W": 7, "m": 7, "w": 7, "%": 7}
+
+# Every PicoGraphics made, newest last, for the benchmarks to read counts from
+instances = []
+
+
+def char_width(c):
+    return _NARROW.get(c, 6)
+
+
+class PicoGraphics:
+    def __init__(self, display = DISPLAY_INKY_FRAME_4, **kwargs):
+        self.buf = bytearray(WIDTH * HEIGHT)
+        self.pen = 0
+        self.font = "bitmap8"
+        self.thickness = 1
+        self.counts = {}
+        self.updates = 0
+        instances.append(self)
+
+    def _count(self, name):
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def reset_counts(self):
+        self.counts = {}
+
+    def get_bounds(self):
+        return WIDTH, HEIGHT
+
+    def set_pen(self, pen):
+        self._count("set_pen")
+        self.pen = pen & 7
+
+    def set_font(self, font):
+        self._count("set_font")
+        self.font = font
+
+    def set_thickness(self, thickness):
+        self._count("set_thickness")
+        self.thickness = thickness
+
+    def _fill(self, x, y, w, h):
+        x0 = max(0, int(x))
+        y0 = max(0, int(y))
+        x1 = min(WIDTH, int(x + w))
+        y1 = min(HEIGHT, int(y + h))
+        if x1 <= x0:
+            return
+        row = bytes([self.pen]) * (x1 - x0)
+        for yy in range(y0, y1):
+            self.buf[yy * WIDTH + x0:yy * WIDTH + x1] = row
+
+    def clear(self):
+        self._count("clear")
+        self._fill(0, 0, WIDTH, HEIGHT)
+
+    def pixel(self, x, y):
+        self._count("pixel")
+        self._fill(x, y, 1, 1)
+
+    def pixel_span(self, x, y, length):
+        self._count("pixel_span")
+        self._fill(x, y, length, 1)
+
+    def rectangle(self, x, y, w, h):
+        self._count("rectangle")
+        self._fill(x, y, w, h)
+
+    def line(self, x1, y1, x2, y2, thickness = None):
+        self._count("line")
+        t = self.thickness if thickness is None else thickness
+        steps = max(abs(x2 - x1), abs(y2 - y1), 1)
+        for i in range(steps + 1):
+            x = x1 + (x2 - x1) * i // steps
+            y = y1 + (y2 - y1) * i // steps
+            self._fill(x - t // 2, y - t // 2, t, t)
+
+    def circle(self, x, y, r):
+        self._count("circle")
+        for dy in range(-r, r + 1):
+            dx = int((r * r - dy * dy) ** 0.5)
+            self._fill(x - dx, y + dy, 2 * dx + 1, 1)
+
+    def measure_text(self, text, scale = 2, spacing = 1, fixed_width = False):
+        self._count("measure_text")
+        if not text:
+            return 0
+        return (sum(char_width(c) for c in text) + spacing * (len(text) - 1)) * scale
+
+    def _glyphs(self, text, x, y, scale):
+        for c in text:
+            w = char_width(c)
+            if c != " ":
+                self._fill(x + scale, y + scale, (w - 1) * scale, 6 * scale)
+            x += (w + 1) * scale
+
+    def text(self, text, x, y, wordwrap = None, scale = 2, angle = 0, spacing = 1):
+        self._count("text")
+        if wordwrap is None:
+            self._glyphs(text, x, y, scale)
+            return
+        # Word wrap the way PicoGraphics does, breaking at spaces
+        line = ""
+        for word in text.split(" "):
+            trial = word if not line else line + " " + word
+            if line and (sum(char_width(c) + 1 for c in trial) - 1) * scale > wordwrap:
+                self._glyphs(line, x, y, scale)
+                y += 8 * scale
+                line = word
+            else:
+                line = trial
+        self._glyphs(line, x, y, scale)
+
+    def character(self, char, x, y, scale = 2):
+        self._count("character")
+        self._glyphs(chr(char) if isinstance(char, int) else char, x, y, scale)
+
+    def update(self):
+        self._count("update")
+        self.updates += 1
+
+    def save_png(self, path):
+        # Palette PNG of the buffer
+        def chunk(kind, data):
+            body = kind + data
+            return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body) & 0xffffffff)
+        raw = b"".join(b"\x00" + bytes(self.buf[y * WIDTH:(y + 1) * WIDTH]) for y in range(HEIGHT))
+        with open(path, "wb") as f:
+            f.write(b"\x89PNG\r\n\x1a\n")
+            f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", WIDTH, HEIGHT, 8, 3, 0, 0, 0)))
+            f.write(chunk(b"PLTE", b"".join(bytes(c) for c in PALETTE)))
+            f.write(chunk(b"IDAT", zlib.compress(raw, 9)))
+            f.write(chunk(b"IEND", b""))
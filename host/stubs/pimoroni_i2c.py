@@ -0,0 +1,6 @@
+# Host stand-in for pimoroni_i2c.
+
+
+class PimoroniI2C:
+    def __init__(self, sda, scl, baudrate = 100000):
+        pass
@@ -0,0 +1,7 @@
+# Host stand-in for the sdcard driver. The emulator maps /sd onto a host
+# directory, so there is nothing to drive.
+
+
+class SDCard:
+    def __init__(self, spi, cs, baudrate = None):
+        pass
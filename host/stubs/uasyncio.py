@@ -0,0 +1,8 @@
+# Host stand-in for uasyncio on top of asyncio.
+
+from asyncio import *  # noqa: F401,F403
+import asyncio as _asyncio
+
+
+async def sleep_ms(ms):
+    await _asyncio.sleep(ms / 1000)
@@ -0,0 +1,98 @@
+# Long range query benchmark for tsdb. Fills the store with a synthetic
+# multi-month dataset of 5 minute samples, then queries windows from a few
+# hours up to the whole range for a chart of the given width. For each
+# window it reports the rollup level used, records read (tsdb.last_reads),
+# raw samples covered, query time and the largest error of the column
+# means against the raw samples, in fixed point units. Records read should
+# stay within a small multiple of the pixel count however long the window.
+#
+#   python3 host/tsdb_range.py                    120 days, 640 px
+#   python3 host/tsdb_range.py --days 365 --pixels 200
+
+import argparse
+import math
+import os
+import sys
+import time
+
+HOST = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HOST)
+import emu
+
+SAMPLE_S = 300
+WINDOWS = (("6h", 6 * 3600), ("1d", 86400), ("3d", 3 * 86400), ("1w", 7 * 86400), ("2w", 14 * 86400),
+           ("30d", 30 * 86400), ("60d", 60 * 86400), ("90d", 90 * 86400))
+
+
+def sample(i):
+    # Daily and slower seasonal swings with some jitter, in sensorlog's fixed point
+    day = i * SAMPLE_S / 86400
+    temp = int(1800 + 500 * math.sin(2 * math.pi * day) + 300 * math.sin(2 * math.pi * day / 60) + (i * 7919) % 41)
+    press = int(10130 + 150 * math.sin(2 * math.pi * day / 5) + (i * 104729) % 9)
+    humid = int(5000 + 1500 * math.sin(2 * math.pi * day + 1))
+    gas = int(30000 + 20000 * math.sin(2 * math.pi * day / 3))
+    return temp, press, humid, gas
+
+
+def fill(tsdb, start, count):
+    values = []
+    for i in range(count):
+        v = sample(i)
+        tsdb.append(start + i * SAMPLE_S, v)
+        values.append(v)
+    return values
+
+
+def exact(values, start, t0, t1, pixels, k, bucket):
+    # Column means straight from the raw samples. Each sample goes to the
+    # column of its rollup bucket, as query() places whole buckets.
+    span = t1 - t0
+    sums = [0] * pixels
+    counts = [0] * pixels
+    first = max(0, -(-(t0 - start) // SAMPLE_S))
+    for i in range(first, len(values)):
+        stamp = start + i * SAMPLE_S
+        if stamp >= t1:
+            break
+        col = min(pixels - 1, (stamp - stamp % bucket - t0) * pixels // span)
+        sums[col] += values[i][k]
+        counts[col] += 1
+    return [sums[c] / counts[c] if counts[c] else None for c in range(pixels)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "tsdb query cost against window length")
+    parser.add_argument("--days", type = int, default = 120)
+    parser.add_argument("--pixels", type = int, default = 640)
+    parser.add_argument("--field", default = "temp")
+    args = parser.parse_args()
+
+    emu.install()
+    import tsdb
+    tsdb.open_store()
+    end = time.time() - time.time() % 86400
+    start = end - args.days * 86400
+    count = args.days * 86400 // SAMPLE_S
+    t = time.perf_counter()
+    values = fill(tsdb, start, count)
+    print("Stored {} samples over {} days in {:.1f}s".format(count, args.days, time.perf_counter() - t))
+
+    k = tsdb.FIELDS.index(args.field)
+    windows = [w for w in WINDOWS if w[1] <= args.days * 86400] + [("all", args.days * 86400)]
+    print("{:<6} {:>7} {:>9} {:>9} {:>9} {:>10}".format("window", "level", "reads", "samples", "ms", "max err"))
+    for name, span in windows:
+        t0 = end - span
+        level = tsdb.level_for(span, args.pixels)
+        t = time.perf_counter()
+        cols = tsdb.query(args.field, t0, end, args.pixels)
+        ms = (time.perf_counter() - t) * 1000
+        bucket = 1 if level is None else tsdb.LEVELS[level][0]
+        want = exact(values, start, t0, end, args.pixels, k, bucket)
+        err = max((abs(c[2] - w) for c, w in zip(cols, want) if c is not None and w is not None), default = 0)
+        print("{:<6} {:>7} {:>9} {:>9} {:>9.1f} {:>10.2f}".format(
+            name, "raw" if level is None else bucket, tsdb.last_reads, span // SAMPLE_S, ms, err))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
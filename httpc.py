@@ -0,0 +1,188 @@
+import time
+
+import socket
+import ssl
+
+# Small HTTP/1.1 client for the data fetches. Compared to urequests it
+# sends conditional GETs so an unchanged resource comes back as an empty
+# 304, puts timeouts on connect and every read, and refuses bodies larger
+# than a cap.
+#
+# Each request gets its own connection. A page fetches from one host at
+# most once per update interval, so a kept connection would never be used
+# again before the radio goes off, and an idle TLS session costs tens of KB
+# of RAM on the RP2040. Response.raw is a stream for jsonpull.
+
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 10
+MAX_BODY = 64 * 1024
+MAX_HEADERS = 32
+# Counters for the fetch cost
+handshakes = 0
+not_modified = 0
+# Milliseconds from the last get() call to its response headers
+last_ms = None
+
+
+class Body:
+    # Reads a response body sized by Content-Length, chunked encoding, or
+    # the connection closing, whichever the server used
+    def __init__(self, sock, length, chunked):
+        self.sock = sock
+        self.left = length
+        self.chunked = chunked
+        self.chunk_left = 0
+        self.read_total = 0
+        self.done = length == 0
+
+    def _next_chunk(self):
+        if self.read_total:
+            # CRLF after the previous chunk
+            self.sock.readline()
+        line = self.sock.readline()
+        if not line:
+            raise OSError("Connection closed in chunked body")
+        self.chunk_left = int(line.split(b";")[0], 16)
+        if self.chunk_left == 0:
+            # Trailers end with an empty line
+            while self.sock.readline() not in (b"\r\n", b""):
+                pass
+            self.done = True
+
+    def read(self, n = -1):
+        if self.done:
+            return b""
+        if n < 0:
+            n = MAX_BODY
+        if self.chunked:
+            if self.chunk_left == 0:
+                self._next_chunk()
+                if self.done:
+                    return b""
+            n = min(n, self.chunk_left)
+        elif self.left is not None:
+            n = min(n, self.left)
+        data = self.sock.read(n)
+        if not data:
+            if self.chunked or self.left is not None:
+                raise OSError("Connection closed in body")
+            self.done = True
+            return b""
+        self.read_total += len(data)
+        if self.read_total > MAX_BODY:
+            raise OSError("Response body over {} bytes".format(MAX_BODY))
+        if self.chunked:
+            self.chunk_left -= len(data)
+        elif self.left is not None:
+            self.left -= len(data)
+            self.done = self.left == 0
+        return data
+
+
+class Response:
+    def __init__(self, status, headers, raw):
+        self.status = status
+        self.headers = headers
+        self.raw = raw
+
+    @property
+    def etag(self):
+        return self.headers.get("etag")
+
+    @property
+    def modified(self):
+        return self.headers.get("last-modified")
+
+    def close(self):
+        try:
+            self.raw.sock.close()
+        except OSError:
+            pass
+
+
+def _split(url):
+    proto, _, rest = url.split("/", 2)
+    if "/" in rest:
+        host, path = rest.split("/", 1)
+        path = "/" + path
+    else:
+        host, path = rest, "/"
+    tls = proto == "https:"
+    port = 443 if tls else 80
+    if ":" in host:
+        host, port = host.split(":", 1)
+        port = int(port)
+    return tls, host, port, path
+
+
+def _open(tls, host, port):
+    global handshakes
+    addr = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0][-1]
+    sock = socket.socket()
+    try:
+        sock.settimeout(CONNECT_TIMEOUT)
+        sock.connect(addr)
+        sock.settimeout(READ_TIMEOUT)
+        if tls:
+            sock = ssl.wrap_socket(sock, server_hostname = host)
+    except Exception:
+        sock.close()
+        raise
+    handshakes += 1
+    return sock
+
+
+def _request(sock, host, path, headers):
+    lines = ["GET {} HTTP/1.1".format(path), "Host: {}".format(host), "Connection: close"]
+    for k, v in headers.items():
+        lines.append("{}: {}".format(k, v))
+    sock.write(("\r\n".join(lines) + "\r\n\r\n").encode())
+    line = sock.readline()
+    if not line:
+        raise OSError("Connection closed before response")
+    status = int(line.split(None, 2)[1])
+    found = {}
+    for _ in range(MAX_HEADERS + 1):
+        line = sock.readline()
+        if line in (b"\r\n", b""):
+            break
+        k, _, v = line.decode().partition(":")
+        found[k.strip().lower()] = v.strip()
+    else:
+        raise OSError("Too many response headers")
+    return status, found
+
+
+def get(url, etag = None, modified = None, headers = None):
+    # Sends a GET, conditional on etag / modified if given. Read the body from
+    # response.raw and always close() the response. A status of 304 means
+    # the copy with that etag is still current and there is no body.
+    global not_modified, last_ms
+    start = time.ticks_ms()
+    tls, host, port, path = _split(url)
+    send = {}
+    if headers:
+        send.update(headers)
+    if etag:
+        send["If-None-Match"] = etag
+    if modified:
+        send["If-Modified-Since"] = modified
+    sock = _open(tls, host, port)
+    try:
+        status, found = _request(sock, host, path, send)
+        length = found.get("content-length")
+        if length is not None:
+            length = int(length)
+            if length > MAX_BODY:
+                raise OSError("Response body over {} bytes".format(MAX_BODY))
+    except Exception:
+        sock.close()
+        raise
+    chunked = "chunked" in found.get("transfer-encoding", "")
+    if status in (204, 304) or status < 200:
+        length = 0
+    if status == 304:
+        not_modified += 1
+    last_ms = time.ticks_diff(time.ticks_ms(), start)
+    return Response(status, found, Body(sock, length, chunked))
+
@@ -0,0 +1,97 @@
+import time
+
+import inky_frame
+
+# Button input for the nav bar. The Inky Frame buttons sit behind a shift
+# register, so there are no pin interrupts to hook. Instead the buttons are
+# polled on a schedule with idle sleeps in between, and a press only counts
+# once it has been read on DEBOUNCE polls in a row.
+
+BUTTONS = [inky_frame.button_a, inky_frame.button_b, inky_frame.button_c, inky_frame.button_d, inky_frame.button_e]
+
+POLL_MS = 50
+DEBOUNCE = 2
+
+# Clock functions, swapped out to run the loop against a simulated clock
+ticks_ms = time.ticks_ms
+ticks_diff = time.ticks_diff
+sleep_ms = time.sleep_ms
+
+# Called on every poll when set, for cheap periodic work such as sensor sampling
+idle_hook = None
+
+# Time spent polling vs sleeping, used for the idle duty cycle figure
+busy_ms = 0
+idle_ms = 0
+
+
+def duty_cycle():
+    # Fraction of the waiting time the core spent awake polling
+    total = busy_ms + idle_ms
+    if total == 0:
+        return 0.0
+    return busy_ms / total
+
+
+def reset_stats():
+    global busy_ms, idle_ms
+    busy_ms = 0
+    idle_ms = 0
+
+
+def poll():
+    for i in range(5):
+        if BUTTONS[i].read():
+            return i
+    return None
+
+
+def _step(state):
+    # state is [last button, consecutive reads], returns a debounced press or None
+    pressed = poll()
+    if pressed is None or pressed != state[0]:
+        state[0] = pressed
+        state[1] = 0 if pressed is None else 1
+    else:
+        state[1] += 1
+    if state[1] >= DEBOUNCE:
+        return pressed
+    return None
+
+
+def wait(timeout_ms, poll_ms = POLL_MS):
+    # Returns the index of the button pressed, or None once timeout_ms has passed
+    global busy_ms, idle_ms
+    start = ticks_ms()
+    state = [None, 0]
+    while True:
+        t = ticks_ms()
+        pressed = _step(state)
+        if idle_hook is not None:
+            idle_hook()
+        busy_ms += ticks_diff(ticks_ms(), t)
+        if pressed is not None:
+            return pressed
+        remaining = timeout_ms - ticks_diff(ticks_ms(), start)
+        if remaining <= 0:
+            return None
+        nap = min(poll_ms, remaining)
+        sleep_ms(nap)
+        idle_ms += nap
+
+
+async def wait_async(poll_ms = POLL_MS):
+    # Same as wait() without a timeout, yielding to other tasks between polls
+    import uasyncio as asyncio
+    global busy_ms, idle_ms
+    state = [None, 0]
+    while True:
+        t = ticks_ms()
+        pressed = _step(state)
+        if idle_hook is not None:
+            idle_hook()
+        busy_ms += ticks_diff(ticks_ms(), t)
+        if pressed is not None:
+            return pressed
+        await asyncio.sleep_ms(poll_ms)
+        idle_ms += poll_ms
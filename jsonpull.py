@@ -0,0 +1,173 @@
+# Streaming JSON extraction. Reads a JSON document from a stream in small
+# chunks and only builds Python objects for the parts named in a spec, so a
+# large API response never sits in RAM as a whole body plus a full dict tree.
+#
+# A spec is a dict of key -> what to keep for that key:
+#   True                 keep the whole value
+#   {...}                the value is an object, apply this spec to it
+#   (start, stop)        the value is an array, keep items start to stop-1
+#   (start, stop, spec)  as above, applying spec to each kept item
+# Anything not named in the spec is skipped without being built.
+
+CHUNK = 256
+
+_WS = b" \t\r\n"
+_ESCAPES = {ord("n"): "\n", ord("t"): "\t", ord("r"): "\r", ord("b"): "\b", ord("f"): "\f"}
+
+
+class Reader:
+    def __init__(self, stream, chunk=CHUNK):
+        self.stream = stream
+        self.chunk = chunk
+        self.buf = b""
+        self.pos = 0
+
+    def _fill(self):
+        self.buf = self.stream.read(self.chunk)
+        self.pos = 0
+        if not self.buf:
+            raise ValueError("Unexpected end of JSON")
+
+    def next(self):
+        if self.pos >= len(self.buf):
+            self._fill()
+        c = self.buf[self.pos]
+        self.pos += 1
+        return c
+
+    def peek(self):
+        # Next non-whitespace byte, left unread
+        while True:
+            if self.pos >= len(self.buf):
+                self._fill()
+            c = self.buf[self.pos]
+            if c not in _WS:
+                return c
+            self.pos += 1
+
+    def expect(self, c):
+        if self.peek() != c:
+            raise ValueError("Expected {} in JSON".format(chr(c)))
+        self.pos += 1
+
+    def string(self, keep=True):
+        self.expect(0x22)  # "
+        out = bytearray() if keep else None
+        while True:
+            c = self.next()
+            if c == 0x22:
+                break
+            if c == 0x5C:  # backslash
+                c = self.next()
+                if not keep:
+                    continue
+                if c == 0x75:  # \uXXXX
+                    code = self._hex4()
+                    if 0xD800 <= code < 0xDC00:
+                        # Surrogate pair, the low half follows as another \uXXXX
+                        self.next()
+                        self.next()
+                        code = 0x10000 + ((code - 0xD800) << 10) + (self._hex4() - 0xDC00)
+                    out.extend(chr(code).encode())
+                elif c in _ESCAPES:
+                    out.extend(_ESCAPES[c].encode())
+                else:
+                    out.append(c)
+            elif keep:
+                out.append(c)
+        if keep:
+            return out.decode()
+        return None
+
+    def _hex4(self):
+        return int(bytes([self.next(), self.next(), self.next(), self.next()]), 16)
+
+    def scalar(self, keep=True):
+        # Numbers, true, false and null
+        out = bytearray()
+        while True:
+            c = self.peek() if not out else self._raw_peek()
+            if c in b",]}" or c in _WS:
+                break
+            out.append(c)
+            self.pos += 1
+        if not keep:
+            return None
+        if out == b"true":
+            return True
+        if out == b"false":
+            return False
+        if out == b"null":
+            return None
+        if b"." in out or b"e" in out or b"E" in out:
+            return float(out)
+        return int(out)
+
+    def _raw_peek(self):
+        if self.pos >= len(self.buf):
+            self._fill()
+        return self.buf[self.pos]
+
+    def value(self, spec=True):
+        # Reads one value, building only what spec asks for
+        c = self.peek()
+        if c == 0x7B:  # {
+            return self.obj(spec)
+        if c == 0x5B:  # [
+            return self.array(spec)
+        if c == 0x22:
+            return self.string(spec is not None)
+        return self.scalar(spec is not None)
+
+    def obj(self, spec=True):
+        self.expect(0x7B)
+        out = {} if spec is not None else None
+        if self.peek() == 0x7D:
+            self.pos += 1
+            return out
+        while True:
+            key = self.string()
+            self.expect(0x3A)  # :
+            if spec is True:
+                out[key] = self.value(True)
+            elif spec is not None and key in spec:
+                out[key] = self.value(spec[key])
+            else:
+                self.value(None)
+            c = self.peek()
+            self.pos += 1
+            if c == 0x7D:
+                return out
+            if c != 0x2C:
+                raise ValueError("Bad JSON object")
+
+    def array(self, spec=True):
+        self.expect(0x5B)
+        if spec is None:
+            start, stop, item = 0, 0, None
+        elif spec is True:
+            start, stop, item = 0, None, True
+        else:
+            start, stop = spec[0], spec[1]
+            item = spec[2] if len(spec) > 2 else True
+        out = [] if spec is not None else None
+        if self.peek() == 0x5D:
+            self.pos += 1
+            return out
+        i = 0
+        while True:
+            if i >= start and (stop is None or i < stop):
+                out.append(self.value(item))
+            else:
+                self.value(None)
+            i += 1
+            c = self.peek()
+            self.pos += 1
+            if c == 0x5D:
+                return out
+            if c != 0x2C:
+                raise ValueError("Bad JSON array")
+
+
+def load(stream, spec=True, chunk=CHUNK):
+    return Reader(stream, chunk).value(spec)
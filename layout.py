@@ -0,0 +1,175 @@
+import time
+
+import font
+
+# Small retained layout engine. A page is built as a tree of Text, Stack and
+# Columns nodes, laid out in one pass into a flat list of draw ops, and the
+# ops are then drawn in one batch. Text is measured and wrapped with the
+# bitmap8 metrics in font, so laying out a page makes no native calls.
+
+FONT_HEIGHT = 8
+# Nothing is laid out below this line, the nav bar starts here
+NAV_TOP = 370
+
+MAX_MEASURED = 128
+_measured = {}
+
+
+def measure(gfx, text, scale):
+    if font.advances is not None:
+        return font.measure(text, scale)
+    # No font table yet, fall back to memoised native measuring
+    key = (text, scale)
+    width = _measured.get(key)
+    if width is None:
+        if len(_measured) >= MAX_MEASURED:
+            _measured.clear()
+        width = gfx.measure_text(text, scale)
+        _measured[key] = width
+    return width
+
+
+def wrap(gfx, text, scale, width):
+    # Lines of text when wrapped to width
+    if font.advances is not None:
+        return font.lines(text, scale, width)
+    # Without a font table, break on width alone
+    text_w = measure(gfx, text, scale)
+    if text_w <= width or width <= 0:
+        return [text]
+    count = (text_w + width - 1) // width
+    step = (len(text) + count - 1) // count
+    return [text[i:i + step] for i in range(0, len(text), step)]
+
+
+class Text:
+    # A filled box with text in it, as drawn by textbox() in main.py.
+    # Centring applies to each line.
+    def __init__(self, text, fg, bg, scale = 4, align = "left", offset = (5, 5), font_size = FONT_HEIGHT):
+        self.text = text
+        self.fg = fg
+        self.bg = bg
+        self.scale = scale
+        self.align = align
+        self.offset = offset
+        self.font_size = font_size
+
+    def place(self, gfx, ops, x, y, w, limit):
+        wrap_w = w - 2 * self.offset[0]
+        lines = wrap(gfx, self.text, self.scale, wrap_w)
+        count = len(lines)
+        height = (count * self.font_size * self.scale) + (2 * self.offset[1]) + (count - 1) * self.scale
+        if y + height > limit:
+            return 0
+        ops.append(("rect", self.bg, x, y, w, height))
+        ty = y + self.offset[1]
+        for line in lines:
+            if self.align == "center":
+                tx = x + (w - measure(gfx, line, self.scale)) // 2
+            else:
+                tx = x + self.offset[0]
+            # Each line is already wrapped, draw it without wrapping again
+            ops.append(("text", self.fg, line, tx, ty, w, self.scale))
+            ty += (self.font_size + 1) * self.scale
+        return height
+
+
+class Stack:
+    # Children placed top to bottom, each given as (node, gap after it)
+    def __init__(self, children):
+        self.children = children
+
+    def place(self, gfx, ops, x, y, w, limit):
+        top = y
+        for node, gap in self.children:
+            y += node.place(gfx, ops, x, y, w, limit) + gap
+        return y - top
+
+
+class Pad:
+    # Insets a child horizontally by x on each side
+    def __init__(self, node, x):
+        self.node = node
+        self.x = x
+
+    def place(self, gfx, ops, x, y, w, limit):
+        return self.node.place(gfx, ops, x + self.x, y, w - 2 * self.x, limit)
+
+
+class Columns:
+    # Children side by side in equal width columns, with optional divider lines
+    def __init__(self, children, divider = None):
+        self.children = children
+        self.divider = divider
+
+    def place(self, gfx, ops, x, y, w, limit):
+        col_w = w // len(self.children)
+        height = 0
+        for i in range(len(self.children)):
+            height = max(height, self.children[i].place(gfx, ops, x + i * col_w, y, col_w, limit))
+        if self.divider is not None:
+            for i in range(1, len(self.children)):
+                ops.append(("line", self.divider, x + i * col_w, y - 10, x + i * col_w, limit))
+        return height
+
+
+def place(gfx, node, x, y, w, limit = NAV_TOP):
+    # Lays node out, returning (height, draw ops)
+    ops = []
+    height = node.place(gfx, ops, x, y, w, limit)
+    return height, ops
+
+
+def render(gfx, ops):
+    pen = None
+    for op in ops:
+        if op[1] != pen:
+            pen = op[1]
+            gfx.set_pen(pen)
+        kind = op[0]
+        if kind == "rect":
+            gfx.rectangle(op[2], op[3], op[4], op[5])
+        elif kind == "text":
+            gfx.text(op[2], op[3], op[4], wordwrap = op[5], scale = op[6])
+        elif kind == "line":
+            gfx.line(op[2], op[3], op[4], op[5], 2)
+
+
+def draw(gfx, node, x, y, w, limit = NAV_TOP):
+    height, ops = place(gfx, node, x, y, w, limit)
+    render(gfx, ops)
+    return height
+
+
+class Headless:
+    # Stand-in for PicoGraphics that records draw calls instead of drawing,
+    # for snapshot checks and timing of layouts off the device. Text is
+    # measured as bitmap8 at its widest, 6 px per character per scale.
+    def __init__(self, char_width = 6):
+        self.char_width = char_width
+        self.calls = []
+        self.measure_calls = 0
+
+    def measure_text(self, text, scale = 2):
+        self.measure_calls += 1
+        return len(text) * self.char_width * scale
+
+    def set_pen(self, pen):
+        self.calls.append(("set_pen", pen))
+
+    def rectangle(self, x, y, w, h):
+        self.calls.append(("rectangle", x, y, w, h))
+
+    def text(self, text, x, y, wordwrap = None, scale = 2):
+        self.calls.append(("text", text, x, y, wordwrap, scale))
+
+    def line(self, x1, y1, x2, y2, thickness = 1):
+        self.calls.append(("line", x1, y1, x2, y2, thickness))
+
+
+def time_layout(gfx, node, x, y, w, runs = 10):
+    # Average microseconds to lay out and draw node
+    start = time.ticks_us()
+    for _ in range(runs):
+        draw(gfx, node, x, y, w)
+    return time.ticks_diff(time.ticks_us(), start) // runs
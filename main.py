@@ -1,4 +1,5 @@
 #import gc
+import machine
 from machine import Pin, SPI, reset
 import time
 import inky_frame
@@ -9,82 +10,162 @@ import os
 import gc
 import qrcode
 import network
-import urequests
-import json
+import netman
+import membudget
+import metrics
 import pico_server as server
+import router
+import wxdata
+import wxcodes
+import news
+import sdcache
+import frame
+import layout
+import font
+import fmt
+import inputs
+import scheduler
+import pipeline
+import sensorlog
+import tsdb
 import uasyncio as asyncio
 
 from picographics import PicoGraphics, DISPLAY_INKY_FRAME_4 as DISPLAY  # 4.0"
 from breakout_bme69x import BreakoutBME69X, STATUS_HEATER_STABLE, FILTER_COEFF_3, STANDBY_TIME_1000_MS, OVERSAMPLING_16X, OVERSAMPLING_2X, OVERSAMPLING_1X
 
-# A short delay to give USB chance to initialise
-time.sleep(0.5)
+# Timeout for the Wi-Fi stage of init(), in seconds. Only stages that await
+# can time out, the blocking ones are bounded by their own socket timeouts
+# (datetime.NTP_TIMEOUT, httpc.CONNECT_TIMEOUT and READ_TIMEOUT).
+WIFI_TIMEOUT = netman.BUDGET_MS // 1000 + 5
 
-def init(WIFI_PASSWORD, WIFI_SSID):
-    inky_frame.led_busy.brightness(1.0)
-    inky_frame.led_busy.on()
-    ih.clear_button_leds()
-    
-    try:
-        ih.network_connect(WIFI_SSID, WIFI_PASSWORD)
-        print("Connected to {}".format(WIFI_SSID))
-        wifi = True
-    except ImportError:
-        print("Create secrets.py with your WiFi credentials")
-        wifi = False
 
+def setup_sensor():
     #Initialise BME690
     try:
         bme = BreakoutBME69X(machine.I2C(), 0x76)
         bme.configure(FILTER_COEFF_3, STANDBY_TIME_1000_MS, OVERSAMPLING_16X, OVERSAMPLING_2X, OVERSAMPLING_1X)
-        sensor = True
+        return bme
     except:
-        sensor = False
         print("No sensor detected")
+        return None
+
 
+def setup_graphics():
     #Colours are BLACK, WHITE, GREEN, BLUE, RED, YELLOW, ORANGE, TAUPE
-    graphics = PicoGraphics(DISPLAY)
-    WIDTH, HEIGHT = graphics.get_bounds()
+    graphics = frame.Frame(PicoGraphics(DISPLAY))
     graphics.set_pen(inky_frame.WHITE)
     graphics.clear()
     graphics.set_font("bitmap8")
-    inky_frame.led_busy.off()
+    font.load(graphics)
+    return graphics
+
 
+def setup_storage():
     #Initialise storage
-    sd_spi = SPI(0, sck=Pin(18, Pin.OUT), mosi=Pin(19, Pin.OUT), miso=Pin(16, Pin.OUT))
-    sd = sdcard.SDCard(sd_spi, Pin(22))
+    try:
+        sd_spi = SPI(0, sck=Pin(18, Pin.OUT), mosi=Pin(19, Pin.OUT), miso=Pin(16, Pin.OUT))
+        sd = sdcard.SDCard(sd_spi, Pin(22))
+        sdcache.mount(sd)
+        tsdb.open_store()
+        frame.path = "/sd/frame.json"
+        return sd
+    except Exception as e:
+        print("No SD card, caching disabled: ", e)
+        return None
+
+
+def online():
+    # Brings Wi-Fi up when a fetch needs it, see netman for the backoff.
+    # Only for pages drawn outside an event loop, init awaits netman itself.
+    return netman.ensure(ih.cfg["WIFI_SSID"], ih.cfg["WIFI_PASSWORD"])
+
+
+def sources_due(page):
+    # Loads the cached data the page shows, returns True if any of it needs fetching
+    sources = scheduler.PAGE_SOURCES.get(page, ())
+    due = False
+    if "weather" in sources and location is not None:
+        wxdata.load_cached(location)
+        due = not wxdata.fresh(location, update_interval)
+    if "news" in sources:
+        news.load_cached()
+        due = due or not news.fresh(update_interval)
+    return due
+
+
+async def prefetch(page):
+    # Warms the caches for the first page while we are still in init, once
+    # sources_due() has said it needs to. init has already joined Wi-Fi, so
+    # the fetches only check the link. They block, so this stage is bounded
+    # by the httpc socket timeouts rather than a stage timeout.
+    sources = scheduler.PAGE_SOURCES[page]
+    if "weather" in sources and location is not None:
+        wxdata.get(location, update_interval, netman.connected)
+    if "news" in sources:
+        news.get(ih.cfg["API_KEY"], update_interval, netman.connected)
+
+
+async def init_async(WIFI_PASSWORD, WIFI_SSID, page):
+    boot = metrics.begin()
+    pipeline.start()
+    #The PCF85063A keeps time through sleep, so this is usually all the clock needs
+    await pipeline.stage("rtc", pipeline.call(datetime.seed))
+    #The SD card holds the caches that say whether this wake needs the network
+    sd = await pipeline.stage("storage", pipeline.call(setup_storage))
+    netman.load_state()
+    if scheduler.wake_reason() in ("button", "power"):
+        netman.retry_now()
+    wifi_task = None
+    ntp = datetime.needs_sync()
+    due = sources_due(page)
+    #A wake with a good clock and fresh caches never joins the network at all
+    if ntp or due:
+        #The radio associates while the sensor and display are set up
+        wifi_task = asyncio.create_task(pipeline.stage("wifi", netman.connect(WIFI_SSID, WIFI_PASSWORD), WIFI_TIMEOUT))
+    bme = await pipeline.stage("sensor", pipeline.call(setup_sensor))
+    graphics = await pipeline.stage("graphics", pipeline.call(setup_graphics))
+    inky_frame.led_busy.off()
+    graphics.load()
+    metrics.load()
+    membudget.load()
     
     #Initialise time
-    if wifi:
-        datetime.update()
-        print("Time synced with NTP server")
-    else:
-        print("Unable to update machine RTC")
+    if wifi_task is not None:
+        if await wifi_task is True:
+            print("Connected to {}".format(WIFI_SSID))
+            if ntp and await pipeline.stage("ntp", pipeline.call(datetime.update)):
+                print("Time synced with NTP server")
+        else:
+            print("No connection, Wi-Fi {}".format(netman.describe()))
     
-    gc.collect()
-    return(graphics, sd, bme, wifi, sensor)
+    if bme is not None:
+        sensorlog.bme = bme
+        sensorlog.heater_stable = STATUS_HEATER_STABLE
+        sensorlog.load()
+        inputs.idle_hook = sensorlog.maybe_sample
+    
+    if due:
+        await pipeline.stage("prefetch", prefetch(page))
+    pipeline.report()
+    metrics.end(metrics.BOOT, boot)
+    return(graphics, sd, bme, netman.connected(), bme is not None)
 
 
-def textbox(gfx, text, x1, y1, w, text_colour, box_colour, text_size = 4, align = "left", offset = [5,5], font_size = 8, draw = True): #Multiline does not support alignments
-    tex_len = gfx.measure_text(text, text_size)
-    if (w - 2 * offset[0]) % tex_len == 0:
-        lines = (tex_len // (w - 2 * offset[0]))
-    else:
-        lines = (tex_len // (w - 2 * offset[0])) + 1
-    height = (lines * font_size * text_size) + (2 * offset[1]) + (lines - 1) * text_size
+def init(WIFI_PASSWORD, WIFI_SSID, page = "home"):
+    inky_frame.led_busy.brightness(1.0)
+    inky_frame.led_busy.on()
+    ih.clear_button_leds()
     
-    #Do not draw into nav menu
-    if y1 + height > 370:
-        return(0)
-    #Draw Box
+    result = asyncio.run(init_async(WIFI_PASSWORD, WIFI_SSID, page))
+    gc.collect()
+    return result
+
+
+def textbox(gfx, text, x1, y1, w, text_colour, box_colour, text_size = 4, align = "left", offset = [5,5], font_size = 8, draw = True):
+    #Returns the box height, or 0 if it would run into the nav menu
+    height, ops = layout.place(gfx, layout.Text(text, text_colour, box_colour, text_size, align, offset, font_size), x1, y1, w)
     if draw:
-        gfx.set_pen(box_colour)
-        gfx.rectangle(x1, y1, w, height)
-        gfx.set_pen(text_colour)
-        if align == "center" and lines == 1:
-            gfx.text(text, x1 + (w - tex_len)//2, y1 + offset[1], wordwrap = w - 2 * offset[0], scale = text_size)
-        else:
-            gfx.text(text, x1 + offset[0], y1 + offset[1], wordwrap = w - 2 * offset[0], scale = text_size)      
+        layout.render(gfx, ops)
     return(height)
 
 
@@ -99,7 +180,7 @@ def nav_buttons(gfx, arr = [None, None, None, None, None], c_sec = None): #Array
         if arr[i] is None:
             continue
         else:
-            text_len = gfx.measure_text(arr[i], 3)
+            text_len = font.measure(arr[i], 3)
             if c_sec == arr[i]:
                 gfx.set_pen(inky_frame.BLACK)
                 gfx.rectangle(x_vals[i] - 64, 370, 128, 30)
@@ -109,75 +190,107 @@ def nav_buttons(gfx, arr = [None, None, None, None, None], c_sec = None): #Array
             gfx.text(arr[i], x_vals[i] - (text_len // 2), 378, wordwrap = text_len + 10, scale = 3)
 
 
-def measure_qr_code(size, code):
+def stamp_text(stamp):
+    # HH:MM for a time.time() stamp
+    t = datetime.localtime(stamp)
+    return fmt.clock(t[3], t[4])
+
+
+# text -> (modules per side, dark runs per row) for QR codes that are drawn repeatedly
+qr_cache = {}
+
+
+def qr_runs(text, cache = False):
+    # Builds the QR code for text as rows of (start, length) runs of dark modules
+    if text in qr_cache:
+        return qr_cache[text]
+    code = qrcode.QRCode()
+    code.set_text(text)
     w, h = code.get_size()
+    rows = []
+    for y in range(h):
+        runs = []
+        x = 0
+        while x < w:
+            if code.get_module(x, y):
+                start = x
+                while x < w and code.get_module(x, y):
+                    x += 1
+                runs.append((start, x - start))
+            else:
+                x += 1
+        rows.append(runs)
+    if cache:
+        qr_cache[text] = (w, rows)
+    return w, rows
+
+
+def measure_qr_code(size, w):
     module_size = int(size / w)
     return module_size * w, module_size
 
 
-def draw_qr_code(ox, oy, size, code):
-    size, module_size = measure_qr_code(size, code)
-    graphics.set_pen(1)
-    graphics.rectangle(ox, oy, size, size)
-    graphics.set_pen(0)
-    for x in range(size):
-        for y in range(size):
-            if code.get_module(x, y):
-                graphics.rectangle(ox + x * module_size, oy + y * module_size, module_size, module_size)
+def draw_qr_code(gfx, ox, oy, size, text, cache = False):
+    w, rows = qr_runs(text, cache)
+    size, module_size = measure_qr_code(size, w)
+    gfx.set_pen(1)
+    gfx.rectangle(ox, oy, size, size)
+    gfx.set_pen(0)
+    #One rectangle per horizontal run of dark modules
+    for y in range(len(rows)):
+        for start, length in rows[y]:
+            gfx.rectangle(ox + start * module_size, oy + y * module_size, length * module_size, module_size)
+
+
+# Height of the sensor trend lines on the Home page
+SPARK_HEIGHT = 30
 
 
 def dashboard():
     WIDTH = 640
     HEIGHT = 400
     global sensor
+    #Page time includes any fetch the page has to make, see the weather and news spans for those
+    page = metrics.begin()
     
-    year, month, day, dow, hour, minute, second, _ = machine.RTC().datetime()
-    days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-    months = ["January","February","March","April","May","June","July","August","September","October","November","December"]
+    year, month, day, dow, hour, minute, second, _ = datetime.now()
     
-    if minute < 10:
-        minute = "0" + str(minute)
-    else:
-        minute = str(minute)
-        
     graphics.set_pen(inky_frame.WHITE)
     graphics.clear()
     
-    height = textbox(graphics, "{}:{}  {}, {} {}".format(hour, minute, days[dow], day, months[month-1]), 0, 0, WIDTH, inky_frame.BLACK, inky_frame.YELLOW) + 5
+    #Only the date, a refresh can be skipped when nothing else changed and a clock would go stale on the panel
+    height = textbox(graphics, fmt.date(dow, day, month), 0, 0, WIDTH, inky_frame.BLACK, inky_frame.YELLOW) + 5
     
     #Read values from BME690
     if sensor:
         try:
-            temp, press, humid, _, _, _, _ = bme.read()
-            height_2 = textbox(graphics, "{} C".format(round(temp,1)), 0, height, WIDTH, inky_frame.WHITE, inky_frame.GREEN) + 5
+            temp, press, humid = sensorlog.sample()
+            scheduler.sensor_read = time.time()
+            height_2 = textbox(graphics, fmt.fixed(temp, 1, b" C"), 0, height, WIDTH, inky_frame.WHITE, inky_frame.GREEN) + 5
             graphics.set_pen(inky_frame.WHITE)
-            offset = graphics.measure_text("{} hPa".format(round(press / 100, 1)), 4) // 2
-            graphics.text("{} hPa".format(round(press / 100, 1)), (WIDTH // 2) - offset , height + 5, WIDTH, scale = 4)
-            offset = graphics.measure_text("{}%".format(round(humid, 1)), 4)
-            graphics.text("{}%".format(round(humid, 1)), WIDTH - offset - 5 , height + 5, WIDTH, scale = 4)
+            press_text = fmt.fixed(press / 100, 1, b" hPa")
+            offset = font.measure(press_text, 4) // 2
+            graphics.text(press_text, (WIDTH // 2) - offset , height + 5, WIDTH, scale = 4)
+            humid_text = fmt.fixed(humid, 1, b"%")
+            offset = font.measure(humid_text, 4)
+            graphics.text(humid_text, WIDTH - offset - 5 , height + 5, WIDTH, scale = 4)
             height += height_2
+            #24h trends for temperature, pressure and humidity under the readings
+            for i, field in enumerate(("temp", "press", "humid")):
+                sensorlog.sparkline(graphics, field, 10 + i * (WIDTH // 3), height, WIDTH // 3 - 20, SPARK_HEIGHT, inky_frame.GREEN)
+            height += SPARK_HEIGHT + 5
         except Exception as e:
             height += textbox(graphics, "Sensor Error", 0, height, WIDTH, inky_frame.WHITE, inky_frame.RED) + 5
             print("Error reading sensor data: ", e)          
             
     nav_buttons(graphics, ["Home", "WX: Now", "Hourly", "Daily", "Settings"], "Home")
     
-    ih.pulse_network_led()
     try:
-        url = "https://content.guardianapis.com/search?page-size=3&section=world|politics|business&api-key={}".format(ih.cfg["API_KEY"])
-        response = urequests.get(url)
-        news_data = response.json()
-        response.close()
-        news_size = news_data["response"]["pageSize"]
-        for i in range(news_size):
-            c_title = (
-                news_data["response"]["results"][i]["webTitle"]
-                    .replace("‘","\'")
-                    .replace("’","\'")
-                    .replace("–","-")
-                    .replace("€", "EUR")
-            )
-            c_draw_size = textbox(graphics, "{}".format(c_title), 0, height, WIDTH, inky_frame.WHITE, inky_frame.BLUE, text_size = 3)
+        headlines = news.get(ih.cfg["API_KEY"], update_interval, online)
+        if news.stale:
+            height += textbox(graphics, "Offline, news from {}".format(stamp_text(news.fetched)), 0, height, WIDTH, inky_frame.BLACK, inky_frame.WHITE, text_size = 2)
+        for c_title in headlines:
+            c_draw_size = textbox(graphics, c_title, 0, height, WIDTH, inky_frame.WHITE, inky_frame.BLUE, text_size = 3)
             if c_draw_size == 0:
                 break
             else:
@@ -190,76 +303,58 @@ def dashboard():
     ih.network_led_pwm.duty_u16(30000)
     ih.clear_button_leds()
     ih.led_warn.on()
+    metrics.end(metrics.PAGE, page)
+    membudget.check("home")
     graphics.update()
     gc.collect()
     ih.led_warn.off()
     
     
-def home():
-    
-    last_update = None
-    global update_interval
+# Time to wait for a button press after drawing a page before sleeping on the RTC timer
+IDLE_SLEEP_MS = 60000
 
-    while True:
-        if last_update is None:
-            _, _, _, dow, hour, minute, second, _ = machine.RTC().datetime()
-            last_update = second + 60 * (minute + 60 * (hour + 24 * dow)) 
-            dashboard()
-            time.sleep(0.5)
-        if ih.inky_frame.button_a.read():
-            ih.inky_frame.button_a.led_on()
-            ih.update_cfg("run", "Home")
-            time.sleep(0.5)
-            reset()
-        if ih.inky_frame.button_b.read():
-            ih.inky_frame.button_b.led_on()
-            ih.update_cfg("run", "wx_now")
-            time.sleep(0.5)
-            reset()
-        if ih.inky_frame.button_c.read():
-            ih.inky_frame.button_c.led_on()
-            ih.update_cfg("run", "wx_hourly")
-            time.sleep(0.5)
-            reset()
-        if ih.inky_frame.button_d.read():
-            ih.inky_frame.button_d.len_on()
-            ih.update_cfg("run", "wx_daily")
-            time.sleep(0.5)
-            reset()
-        if ih.inky_frame.button_e.read():
-            ih.inky_frame.button_e.led_on()
-            ih.update_cfg("run", "settings")
-            time.sleep(0.5)
-            reset()
-            
-        _, _, _, dow, hour, minute, second, _ = machine.RTC().datetime()
-        cur_time = second + 60 * (minute + 60 * (hour + 24 * dow))
-        if abs(cur_time - last_update) > update_interval:
-            reset()
+
+def wait_for_input(page):
+    # Returns the page picked with the nav buttons, or the current page once its data is due a refresh
+    #The page is drawn, so the radio is done until the next fetch
+    netman.radio_off()
+    remaining = scheduler.next_wake(page, update_interval) * 1000
+    #Nobody is at the frame after a timer wake, and the buttons wake it from sleep anyway
+    idle = 0 if scheduler.wake_reason() == "rtc" else min(remaining, IDLE_SLEEP_MS)
+    pressed = None
+    if idle:
+        pressed = inputs.wait(idle)
+    if pressed is None and remaining > idle:
+        #Nothing pressed, sleep until the next refresh. On battery this powers off and we boot back into this page.
+        print("Idle, awake {}% of the time".format(round(inputs.duty_cycle() * 100, 1)))
+        pressed = scheduler.sleep(page, (remaining - idle) // 1000)
+    if pressed is None:
+        return page
+    inputs.BUTTONS[pressed].led_on()
+    time.sleep(0.5)
+    return router.NAV[pressed]
+
+
+def home():
+    dashboard()
+    return wait_for_input("home")
             
        
-def weather(state = "now"):
-    global wifi
+def draw_weather(state = "now"):
     global location
     global location_name
     global update_interval
     WIDTH = 640
     HEIGHT = 400
+    page = metrics.begin()
     
-    _, month, day, dow, hour, minute, second, _ = machine.RTC().datetime()
-    days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-    months = ["January","February","March","April","May","June","July","August","September","October","November","December"]
-    last_update = second + 60 * (minute + 60 * (hour + 24 * dow)) 
+    _, month, day, dow, hour, minute, second, _ = datetime.now()
     
-    if minute < 10:
-        minute = "0" + str(minute)
-    else:
-        minute = str(minute)
-        
     graphics.set_pen(inky_frame.WHITE)
     graphics.clear()
     
-    height = textbox(graphics, "{}:{}  {}, {} {}".format(hour, minute, days[dow], day, months[month-1]), 0, 0, WIDTH, inky_frame.BLACK, inky_frame.YELLOW) + 5
+    #Only the date, a refresh can be skipped when nothing else changed and a clock would go stale on the panel
+    height = textbox(graphics, fmt.date(dow, day, month), 0, 0, WIDTH, inky_frame.BLACK, inky_frame.YELLOW) + 5
     
     if state == "now":
         c_sec = "WX: Now"
@@ -275,21 +370,27 @@ def weather(state = "now"):
     if location is None:
         height += textbox(graphics, "No Location", 0, height, WIDTH, inky_frame.WHITE, inky_frame.BLUE) + 5
     else:
-        height += textbox(graphics, "{}".format(location_name), 0, height, WIDTH, inky_frame.WHITE, inky_frame.BLUE) + 5
+        height += textbox(graphics, str(location_name), 0, height, WIDTH, inky_frame.WHITE, inky_frame.BLUE) + 5
         
-    if not(wifi):
-        height += textbox(graphics, "No network connection", 0, height, WIDTH, inky_frame.BLACK, inky_frame.WHITE) + 5
+    data = None
+    if not(location is None):
+        try:
+            data = wxdata.get(location, update_interval, online)
+        except Exception as e:
+            print("Error fetching weather: ", e)
+        
+    if data is None and membudget.level == membudget.CRITICAL:
+        textbox(graphics, "Not enough memory to load weather data, try restarting", 0, height, WIDTH, inky_frame.WHITE, inky_frame.RED, 4)
+    elif data is None and not(netman.connected()):
+        height += textbox(graphics, "Wifi: {}".format(netman.describe()), 0, height, WIDTH, inky_frame.BLACK, inky_frame.WHITE) + 5
+    elif data is None:
+        textbox(graphics, "Error loading weather data, try restarting", 0, height, WIDTH, inky_frame.WHITE, inky_frame.RED, 4)
     else:
+        if wxdata.stale:
+            height += textbox(graphics, "Offline, weather from {}".format(stamp_text(wxdata.fetched)), 0, height, WIDTH, inky_frame.BLACK, inky_frame.WHITE, text_size = 2)
         height += 10
         if state == "now":
             try:
-                ih.pulse_network_led()
-                url = "https://api.open-meteo.com/v1/forecast?latitude={}&longitude={}&current=temperature_2m,apparent_temperature,wind_direction_10m,wind_speed_10m,weather_code,is_day&timezone=auto".format(location[0], location[1])
-                response = urequests.get(url)
-                data = response.json()
-                response.close()
-                ih.stop_network_led()
-                ih.network_led_pwm.duty_u16(30000)
         
                 temperature = data["current"]["temperature_2m"]
                 apparent = data["current"]["apparent_temperature"]
@@ -299,24 +400,14 @@ def weather(state = "now"):
                 
                 wspeed = data["current"]["wind_speed_10m"]
                 winddir = data["current"]["wind_direction_10m"]
-                dirs = ["N", "NNE", "NE", "ENE", "E", "ESE", "SE", "SSE", "S", "SSW", "SW", "WSW", "W", "WNW", "NW", "NNW"]
-                ix = int((winddir + 11.25)/22.5)
-                direction = dirs[ix % 16]
             
-                height += textbox(graphics, "{} C".format(temperature), 10, height, WIDTH, inky_frame.BLACK, inky_frame.WHITE) + 5
+                height += textbox(graphics, fmt.fixed(temperature, 1, b" C"), 10, height, WIDTH, inky_frame.BLACK, inky_frame.WHITE) + 5
                 
-                try:
-                    w_data = json.loads(open("/weathercodes.json", "r").read())
-                    if tod == 1:
-                        description = w_data[str(code)]["day"]["description"]
-                    else:
-                        description = w_data[str(code)]["night"]["description"]
-                    height += textbox(graphics, "{}".format(description), 10, height, WIDTH, inky_frame.BLACK, inky_frame.WHITE) + 5
-                except Exception as e_2:
-                    print("Error parsing weather code:", e_2)
+                description = wxcodes.describe(code, tod == 1)
+                height += textbox(graphics, description, 10, height, WIDTH, inky_frame.BLACK, inky_frame.WHITE) + 5
                     
-                height += textbox(graphics, "Feels like {} C".format(apparent), 10, height, WIDTH, inky_frame.BLACK, inky_frame.WHITE) + 5
-                height += textbox(graphics, "{} km/h from {}".format(wspeed, direction), 10, height, WIDTH, inky_frame.BLACK, inky_frame.WHITE) + 5
+                height += textbox(graphics, fmt.fixed(apparent, 1, b" C", b"Feels like "), 10, height, WIDTH, inky_frame.BLACK, inky_frame.WHITE) + 5
+                height += textbox(graphics, fmt.wind(wspeed, winddir), 10, height, WIDTH, inky_frame.BLACK, inky_frame.WHITE) + 5
             except Exception as e:
                 textbox(graphics, "Error loading weather data, try restarting", 0, height, WIDTH, inky_frame.WHITE, inky_frame.RED, 4)
                 print("Error fetching current weather: ", e)
@@ -324,45 +415,47 @@ def weather(state = "now"):
                 
         elif state == "hourly":
             try:
-                ih.pulse_network_led()
-                url = "https://api.open-meteo.com/v1/forecast?latitude={}&longitude={}&hourly=temperature_2m,precipitation_probability,wind_speed_10m,wind_direction_10m,weather_code&forecast_days=2&timezone=auto".format(location[0], location[1])
-                response = urequests.get(url)
-                data = response.json()
-                response.close()
-                ih.stop_network_led()
-                ih.network_led_pwm.duty_u16(30000)
                 
                 temps = data["hourly"]["temperature_2m"]
                 precip_prob = data["hourly"]["precipitation_probability"]
                 wind_speeds = data["hourly"]["wind_speed_10m"]
                 wind_dirs = data["hourly"]["wind_direction_10m"]
-                dirs = ["N", "NNE", "NE", "ENE", "E", "ESE", "SE", "SSE", "S", "SSW", "SW", "WSW", "W", "WNW", "NW", "NNW"]
                 
-                if int(minute) > 50:
-                    hour += 1
+                times = data["hourly"]["time"]
                 
-                for i in range(5):
-                    if i == 0:
-                        disp_t = "Now"
-                    else:
-                        disp_t = "{}:00".format((hour + i) % 24)
-                    ix = int((wind_dirs[hour + i] + 11.25)/22.5)
-                    disp_dir = dirs[ix % 16]
+                now = wxdata.hour_index(data, day, hour)
+                if now is not None and minute > 50:
+                    now += 1
+                if now is None or now >= len(temps):
+                    #The kept hours are all in the past, wait for a refetch
+                    textbox(graphics, "No forecast for this hour yet", 0, height, WIDTH, inky_frame.BLACK, inky_frame.WHITE, 4)
+                else:
+                    #Near the end of the kept hours the columns start before now,
+                    #so each is labelled from its own entry
+                    start = max(0, min(now, len(temps) - 5))
+                
+                    cols = []
+                    for i in range(min(5, len(temps) - start)):
+                        if start + i == now:
+                            disp_t = "Now"
+                        else:
+                            # Times look like "2024-05-01T13:00"
+                            disp_t = fmt.clock(int(times[start + i][11:13]), 0)
+                        disp_dir = fmt.compass(wind_dirs[start + i])
+                        if precip_prob[start + i] > 0:
+                            r_col = inky_frame.BLUE
+                        else:
+                            r_col = inky_frame.BLACK
                     
-                    stackheight = height + textbox(graphics, "{}".format(disp_t), 128 * i, height, 128, inky_frame.BLACK, inky_frame.WHITE, 4, align = "center") + 10
-                    stackheight += textbox(graphics, "{} C".format(temps[hour + i]), 128 * i, stackheight, 128, inky_frame.RED, inky_frame.WHITE, 3, align = "center") + 5
-                    if precip_prob[hour + i] > 0:
-                        r_col = inky_frame.BLUE
-                    else:
-                        r_col = inky_frame.BLACK
-                    stackheight += textbox(graphics, "{}% Rain".format(precip_prob[hour + i]), 128 * i, stackheight, 128, r_col, inky_frame.WHITE, 3, align = "center") + 10
-                    stackheight += textbox(graphics, "{}".format(wind_speeds[hour + i]), 128 * i, stackheight, 128, inky_frame.BLACK, inky_frame.WHITE, 3, align = "center") + 5
-                    stackheight += textbox(graphics, "km/h", 128 * i, stackheight, 128, inky_frame.BLACK, inky_frame.WHITE, 3, align = "center") + 5
-                    stackheight += textbox(graphics, "{}".format(disp_dir), 128 * i, stackheight, 128, inky_frame.BLACK, inky_frame.WHITE, 3, align = "center") + 5
-                graphics.line(128 , height - 10, 128, 370, 2)
-                graphics.line(256 , height - 10, 256, 370, 2)
-                graphics.line(384 , height - 10, 384, 370, 2)
-                graphics.line(512 , height - 10, 512, 370, 2)
+                        cols.append(layout.Stack([
+                            (layout.Text(disp_t, inky_frame.BLACK, inky_frame.WHITE, 4, align = "center"), 10),
+                            (layout.Text(fmt.fixed(temps[start + i], 1, b" C"), inky_frame.RED, inky_frame.WHITE, 3, align = "center"), 5),
+                            (layout.Text(fmt.number(precip_prob[start + i], b"% Rain"), r_col, inky_frame.WHITE, 3, align = "center"), 10),
+                            (layout.Text(fmt.fixed(wind_speeds[start + i], 1), inky_frame.BLACK, inky_frame.WHITE, 3, align = "center"), 5),
+                            (layout.Text("km/h", inky_frame.BLACK, inky_frame.WHITE, 3, align = "center"), 5),
+                            (layout.Text(disp_dir, inky_frame.BLACK, inky_frame.WHITE, 3, align = "center"), 5),
+                        ]))
+                    layout.draw(graphics, layout.Columns(cols, divider = inky_frame.BLACK), 0, height, WIDTH)
                 
             except Exception as e:
                 textbox(graphics, "Error loading weather data, try restarting", 0, height, WIDTH, inky_frame.WHITE, inky_frame.RED, 4)
@@ -371,46 +464,28 @@ def weather(state = "now"):
     
         elif state == "daily":
             try:
-                ih.pulse_network_led()
-                url = "https://api.open-meteo.com/v1/forecast?latitude={}&longitude={}&daily=weather_code,temperature_2m_max,temperature_2m_min,rain_sum&timezone=auto".format(location[0], location[1])
-                response = urequests.get(url)
-                data = response.json()
-                response.close()
-                ih.stop_network_led()
-                ih.network_led_pwm.duty_u16(30000)
                 
                 t_max = data["daily"]["temperature_2m_max"]
                 t_min = data["daily"]["temperature_2m_min"]
                 w_code = data["daily"]["weather_code"]
                 rain_sum = data["daily"]["rain_sum"]
-                days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
                 
+                cols = []
                 for i in range(5):
                     if i == 0:
                         disp_t = "Today"
                     else:
-                        disp_t = "{}".format(days[(dow + i) % 7])
+                        disp_t = fmt.DAYS[(dow + i) % 7]
                     
-
-                        
-                    stackheight = height + textbox(graphics, "{}".format(disp_t), 128 * i, height, 128, inky_frame.BLACK, inky_frame.WHITE, 3, align = "center", offset = [2,5]) + 10
-                    stackheight += textbox(graphics, "{} C".format(t_max[i]), 128 * i, stackheight, 128, inky_frame.GREEN, inky_frame.WHITE, 3, align = "center") + 5
-                    stackheight += textbox(graphics, "{} C".format(t_min[i]), 128 * i, stackheight, 128, inky_frame.RED, inky_frame.WHITE, 3, align = "center") + 10
-                    stackheight += textbox(graphics, "{}mm".format(rain_sum[i]), 128 * i, stackheight, 128, inky_frame.BLUE, inky_frame.WHITE, 3, align = "center") + 5
-                    stackheight += textbox(graphics, "Rain", 128 * i, stackheight, 128, inky_frame.BLUE, inky_frame.WHITE, 3, align = "center") + 10
-                    
-                    code = w_code[i]
-                    try:
-                        w_data = json.loads(open("/weathercodes.json", "r").read())
-                        description = w_data[str(code)]["day"]["description"]
-                        textbox(graphics, "{}".format(description), 128 * i + 10, stackheight, 108, inky_frame.BLACK, inky_frame.WHITE, 2)
-                    except Exception as e_2:
-                        print("Error parsing weather code:", e_2)
-                    
-                graphics.line(128 , height - 10, 128, 370, 2)
-                graphics.line(256 , height - 10, 256, 370, 2)
-                graphics.line(384 , height - 10, 384, 370, 2)
-                graphics.line(512 , height - 10, 512, 370, 2)
+                    cols.append(layout.Stack([
+                        (layout.Text(disp_t, inky_frame.BLACK, inky_frame.WHITE, 3, align = "center", offset = [2,5]), 10),
+                        (layout.Text(fmt.fixed(t_max[i], 1, b" C"), inky_frame.GREEN, inky_frame.WHITE, 3, align = "center"), 5),
+                        (layout.Text(fmt.fixed(t_min[i], 1, b" C"), inky_frame.RED, inky_frame.WHITE, 3, align = "center"), 10),
+                        (layout.Text(fmt.fixed(rain_sum[i], 1, b"mm"), inky_frame.BLUE, inky_frame.WHITE, 3, align = "center"), 5),
+                        (layout.Text("Rain", inky_frame.BLUE, inky_frame.WHITE, 3, align = "center"), 10),
+                        (layout.Pad(layout.Text(wxcodes.describe(w_code[i]), inky_frame.BLACK, inky_frame.WHITE, 2), 10), 0),
+                    ]))
+                layout.draw(graphics, layout.Columns(cols, divider = inky_frame.BLACK), 0, height, WIDTH)
                 
             except Exception as e:
                 textbox(graphics, "Error loading weather data, try restarting", 0, height, WIDTH, inky_frame.WHITE, inky_frame.RED, 4)
@@ -422,49 +497,22 @@ def weather(state = "now"):
     ih.network_led_pwm.duty_u16(30000)            
     ih.clear_button_leds()
     ih.led_warn.on()
+    metrics.end(metrics.PAGE, page)
+    membudget.check("wx_" + state)
     graphics.update()
     ih.led_warn.off()
     gc.collect()
-    
-    ih.load_cfg()
-    while True:
-        if ih.inky_frame.button_a.read():
-            ih.inky_frame.button_a.led_on()
-            ih.update_cfg("run", "Home")
-            time.sleep(0.5)
-            reset()
-        if ih.inky_frame.button_b.read():
-            ih.inky_frame.button_b.led_on()
-            ih.update_cfg("run", "wx_now")
-            time.sleep(0.5)
-            reset()
-        if ih.inky_frame.button_c.read():
-            ih.inky_frame.button_c.led_on()
-            ih.update_cfg("run", "wx_hourly")
-            time.sleep(0.5)
-            reset()
-        if ih.inky_frame.button_d.read():
-            ih.inky_frame.button_d.led_on()
-            ih.update_cfg("run", "wx_daily")
-            time.sleep(0.5)
-            reset()
-        if ih.inky_frame.button_e.read():
-            ih.inky_frame.button_e.led_on()
-            ih.update_cfg("run", "settings")
-            time.sleep(0.5)
-            reset()
-        
-        _, _, _, dow, hour, minute, second, _ = machine.RTC().datetime()
-        cur_time = second + 60 * (minute + 60 * (hour + 24 * dow))
-        if abs(cur_time - last_update) > update_interval:
-            reset()
+
+
+def weather(state = "now"):
+    draw_weather(state)
+    return wait_for_input("wx_" + state)
          
          
 async def settings():
     graphics.set_pen(inky_frame.WHITE)
     graphics.clear()
     nav_buttons(graphics, ["Home", "WX: Now", "Hourly", "Daily", "Refresh"], "Refresh")
-    global wifi
     global sensor
     global location
     global update_interval
@@ -474,6 +522,10 @@ async def settings():
     pico_encryption = "WPA"
     
     
+    #The server and its sockets are the biggest allocation on this page
+    membudget.prepare("settings", gc.mem_free())
+    server.server_task = None
+    server.changed = False
     asyncio.create_task(server.start_server(pico_SSID, pico_pass))
     
     while server.server_task is None:
@@ -485,13 +537,9 @@ async def settings():
     graphics.set_pen(inky_frame.BLACK)
     
     if not(ip is None):
-        wifi = f"WIFI:T:{pico_encryption};S:{pico_SSID};P:{pico_pass};;"
-        code = qrcode.QRCode()
-        code.set_text(wifi)
-        draw_qr_code(430, 10, 200, code)
-        code_2 = qrcode.QRCode()
-        code_2.set_text(ip)
-        draw_qr_code(430, 225, 120, code_2)
+        wifi_qr = f"WIFI:T:{pico_encryption};S:{pico_SSID};P:{pico_pass};;"
+        draw_qr_code(graphics, 430, 10, 200, wifi_qr, cache = True)
+        draw_qr_code(graphics, 430, 225, 120, ip)
     else:
         graphics.line(430, 10, 630, 10, 2)
         graphics.line(430, 210, 630, 210, 2)
@@ -499,10 +547,10 @@ async def settings():
         graphics.line(630, 10, 630, 210, 2)
         graphics.text("Server Error", 437, 96, scale = 3)
         
-    if wifi:
-        graphics.text("Wifi: {}".format(ih.cfg["WIFI_SSID"]), 5, 5, scale = 3)
+    if netman.connect_ms is not None or netman.connected():
+        graphics.text("Wifi: {} {}".format(ih.cfg["WIFI_SSID"], netman.describe()), 5, 5, scale = 3)
     else:
-        graphics.text("Wifi: No Connection", 5, 5, scale = 3)
+        graphics.text("Wifi: {}".format(netman.describe()), 5, 5, scale = 3)
     if ih.cfg["API_KEY"] is None:
         graphics.text("API_Key: None", 5, 35, scale = 3)
     else:
@@ -523,8 +571,8 @@ async def settings():
         graphics.text(ih.cfg["LOCATION_NAME"], 5, 125, scale = 3)	
         
     graphics.text("Update Interval: {} mins".format(update_interval // 60), 5, 155, scale = 3)
-    graphics.text("RAM: {}/{}KB".format(gc.mem_alloc()//1024, (gc.mem_alloc() + gc.mem_free())//1024), 5, 185, scale = 3)
-    graphics.text("Scan the upper QR code to connect to pico, then scan the lower QR code to change settings. Or go to {}".format(ip), 5, 215, wordwrap = 400, scale = 3)
+    graphics.text("RAM: {}/{}KB  Block: {}KB  Skipped: {}/{}".format(gc.mem_alloc()//1024, (gc.mem_alloc() + gc.mem_free())//1024, membudget.last_largest//1024, graphics.skipped, graphics.skipped + graphics.refreshed), 5, 185, scale = 3)
+    graphics.text("Scan the upper QR code to connect to pico, then scan the lower QR code to change settings. Or go to {} (stats on /metrics)".format(ip), 5, 215, wordwrap = 400, scale = 3)
     
     
     
@@ -534,61 +582,55 @@ async def settings():
     gc.collect()
     ih.led_warn.off()
     
-    while True:
-        if ih.inky_frame.button_a.read():
-            ih.inky_frame.button_a.led_on()
-            ih.update_cfg("run", "home")
-            await server.stop_server()
-            time.sleep(0.5)
-            reset()
-        if ih.inky_frame.button_b.read():
-            ih.inky_frame.button_b.led_on()
-            ih.update_cfg("run", "wx_now")
-            await server.stop_server()
-            time.sleep(0.5)
-            reset()
-        if ih.inky_frame.button_c.read():
-            ih.inky_frame.button_c.led_on()
-            ih.update_cfg("run", "wx_hourly")
-            await server.stop_server()
-            time.sleep(0.5)
-            reset()
-        if ih.inky_frame.button_d.read():
-            ih.inky_frame.button_d.led_on()
-            ih.update_cfg("run", "wx_daily")
-            await server.stop_server()
-            time.sleep(0.5)
-            reset()
-        if ih.inky_frame.button_e.read():
-            ih.inky_frame.button_e.led_on()
-            await server.stop_server()
-            time.sleep(0.5)
-            reset()
-
-#Initialise
-ih.led_warn.on()
-ih.load_cfg()
-location_name = ih.cfg["LOCATION_NAME"]
-location = ih.cfg["LOCATION"]
-update_interval = ih.cfg["UPDATE_INTERVAL"]
-graphics, sd, bme, wifi, sensor = init(ih.cfg["WIFI_PASSWORD"], ih.cfg["WIFI_SSID"])
-
-#Main Loop
-while True:
-    if ih.file_exists("config.json"):
-        ih.load_cfg()
-        if ih.cfg["run"] == "home" or ih.cfg["run"] is None:
-            home()
-        elif ih.cfg["run"] == "settings":
-            asyncio.run(settings())
-        elif ih.cfg["run"] == "wx_now":
-            weather("now")
-        elif ih.cfg["run"] == "wx_hourly":
-            weather("hourly")
-        elif ih.cfg["run"] == "wx_daily":
-            weather("daily")
-        else:
-            ih.update_cfg("run", "home")
-    else:
-        ih.update_cfg("run", "home")
-    gc.collect()
\ No newline at end of file
+    i = await inputs.wait_async()
+    inputs.BUTTONS[i].led_on()
+    await server.stop_server()
+    time.sleep(0.5)
+    #Any exit after the config changed reboots so init() picks up the new settings,
+    #into the page that was picked. Refresh with nothing changed just redraws.
+    if server.changed:
+        ih.update_cfg("run", router.NAV[i])
+        reset()
+    return router.NAV[i]
+
+
+def settings_page():
+    return asyncio.run(settings())
+
+
+def register_pages():
+    router.register("home", home)
+    router.register("wx_now", lambda: weather("now"))
+    router.register("wx_hourly", lambda: weather("hourly"))
+    router.register("wx_daily", lambda: weather("daily"))
+    router.register("settings", settings_page)
+
+#Off the device host/ imports this module to render pages, so only start up when run as the program
+if __name__ == "__main__":
+    # A short delay to give USB chance to initialise
+    time.sleep(0.5)
+    
+    #Initialise
+    ih.led_warn.on()
+    if not ih.file_exists("config.json"):
+        ih.save_cfg(ih.cfg)
+    ih.load_cfg()
+    metrics.enabled = ih.cfg.get("METRICS", True)
+    location_name = ih.cfg["LOCATION_NAME"]
+    location = ih.cfg["LOCATION"]
+    update_interval = ih.cfg["UPDATE_INTERVAL"]
+    #A button press that woke us from sleep picks the page to start on
+    start_page = ih.cfg["run"]
+    if inky_frame.woken_by_button():
+        pressed = inputs.poll()
+        if pressed is not None:
+            start_page = router.NAV[pressed]
+
+    graphics, sd, bme, wifi, sensor = init(ih.cfg["WIFI_PASSWORD"], ih.cfg["WIFI_SSID"], start_page)
+    scheduler.load_log()
+    scheduler.log("boot {}".format(scheduler.wake_reason()))
+    metrics.count(metrics.WAKES)
+
+    #Main Loop
+    register_pages()
+    router.run(start_page)
@@ -0,0 +1,132 @@
+import gc
+import time
+
+# Memory budget. The RP2040 heap is small and fragments, so before a big
+# allocation like a TLS fetch the heap is compacted and the largest free
+# block is measured with a probe allocation. When that block is short the
+# callers degrade in steps instead of failing half way through:
+#
+#   NORMAL    everything as usual
+#   TIGHT     keep less of each response (fewer headlines, fewer hours)
+#   CRITICAL  do not fetch, draw from cached data
+#
+# Free memory and the largest block are recorded per page and per fetch,
+# and level changes and out of memory errors are logged, so the budgets
+# can be tuned from what devices in the field actually see. Blocks of
+# TIGHT_BELOW or more are all recorded as TIGHT_BELOW, which keeps the
+# probe to one allocation while the heap is healthy.
+
+NORMAL, TIGHT, CRITICAL = range(3)
+# Largest free block, in bytes, below which each level starts. A TLS
+# handshake alone wants around 30 KB.
+TIGHT_BELOW = 48 * 1024
+CRITICAL_BELOW = 32 * 1024
+# Precision of the largest block probe
+PROBE_STEP = 512
+
+LOG_PATH = "/sd/mem.log"
+LOG_LINES = 30
+
+level = NORMAL
+# Largest block found by the last check
+last_largest = None
+# name -> [times recorded, lowest free bytes, lowest largest block]
+stats = {}
+events = []
+
+
+def largest_free(limit = TIGHT_BELOW):
+    # Largest block that can be allocated now, up to limit, found by binary
+    # search. Probes that fit become garbage straight away, and a later
+    # probe that does not fit makes the allocator collect them first.
+    try:
+        bytearray(limit)
+        return limit
+    except MemoryError:
+        pass
+    lo = 0
+    hi = min(limit, gc.mem_free())
+    while hi - lo > PROBE_STEP:
+        mid = (lo + hi) // 2
+        try:
+            bytearray(mid)
+            lo = mid
+        except MemoryError:
+            hi = mid
+    return lo
+
+
+def _level(largest):
+    if largest < CRITICAL_BELOW:
+        return CRITICAL
+    if largest < TIGHT_BELOW:
+        return TIGHT
+    return NORMAL
+
+
+def event(text):
+    line = "{} {}".format(time.time(), text)
+    print("Memory:", line)
+    events.append(line)
+    if len(events) > LOG_LINES:
+        events.pop(0)
+
+
+def _record(name, free, largest):
+    entry = stats.get(name)
+    if entry is None:
+        stats[name] = [1, free, largest]
+    else:
+        entry[0] += 1
+        entry[1] = min(entry[1], free)
+        entry[2] = min(entry[2], largest)
+
+
+def check(name, limit = TIGHT_BELOW):
+    # Records free memory as name left it, then compacts and records the
+    # largest block up to limit. Returns the level that leaves us at.
+    global level, last_largest
+    free = gc.mem_free()
+    gc.collect()
+    largest = largest_free(limit)
+    last_largest = largest
+    _record(name, free, largest)
+    new = _level(largest)
+    if new != level:
+        event("{} level {} -> {}, {} free, largest {}".format(name, level, new, free, largest))
+        level = new
+    return level
+
+
+def prepare(name, limit = TIGHT_BELOW):
+    # Call before a big allocation, returns the level to work at
+    return check(name, limit)
+
+
+def save():
+    try:
+        with open(LOG_PATH, "w") as f:
+            f.write("\n".join(events))
+            for name in stats:
+                runs, free, largest = stats[name]
+                f.write("\n# {} {} {} {}".format(name, runs, free, largest))
+    except OSError:
+        pass
+
+
+def load():
+    # Picks up the log and lows from before the last sleep
+    global events
+    try:
+        with open(LOG_PATH, "r") as f:
+            lines = f.read().split("\n")
+    except OSError:
+        return
+    events = [l for l in lines if l and not l.startswith("#")][-LOG_LINES:]
+    for l in lines:
+        if l.startswith("# "):
+            try:
+                name, runs, free, largest = l[2:].split(" ")
+                stats[name] = [int(runs), int(free), int(largest)]
+            except ValueError:
+                pass
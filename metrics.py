@@ -0,0 +1,136 @@
+import os
+import struct
+import time
+from array import array
+
+# Timing spans and counters for profiling devices in the field. Every span
+# and counter has a fixed slot in preallocated arrays, so recording one is a
+# couple of array writes and never allocates. With enabled False, begin()
+# and end() return straight away. Totals survive sleep in a small file on
+# the SD card and are served as plain text on /metrics by pico_server.
+#
+#   t = metrics.begin()
+#   ...
+#   metrics.end(metrics.WEATHER, t)
+
+SPANS = ("boot", "wifi", "ntp", "weather", "news", "page", "panel")
+BOOT, WIFI, NTP, WEATHER, NEWS, PAGE, PANEL = range(len(SPANS))
+COUNTERS = ("wakes", "fetch_errors", "refreshes", "skips", "cfg_writes")
+WAKES, FETCH_ERRORS, REFRESHES, SKIPS, CFG_WRITES = range(len(COUNTERS))
+
+PATH = "/sd/metrics.bin"
+# Span and counter slots, then since
+_HEADER = "<HHL"
+
+enabled = True
+# Per span: times recorded, total ms, slowest, last and moving average in us
+counts = array("L", [0] * len(SPANS))
+totals = array("L", [0] * len(SPANS))
+peaks = array("L", [0] * len(SPANS))
+lasts = array("L", [0] * len(SPANS))
+averages = array("L", [0] * len(SPANS))
+counters = array("L", [0] * len(COUNTERS))
+# time.time() the totals started from, for rates across sleeps
+since = None
+dirty = False
+
+
+def begin():
+    if not enabled:
+        return 0
+    return time.ticks_us()
+
+
+def end(slot, start):
+    global dirty
+    if not enabled:
+        return
+    us = time.ticks_diff(time.ticks_us(), start)
+    if us < 0:
+        return
+    n = counts[slot]
+    counts[slot] = n + 1
+    totals[slot] += us // 1000
+    lasts[slot] = us
+    if us > peaks[slot]:
+        peaks[slot] = us
+    # Moving average over roughly the last 8
+    averages[slot] = us if n == 0 else averages[slot] + (us - averages[slot]) // 8
+    dirty = True
+
+
+def count(slot, n = 1):
+    global dirty
+    if not enabled:
+        return
+    counters[slot] += n
+    dirty = True
+
+
+def reset():
+    global dirty, since
+    for a in (counts, totals, peaks, lasts, averages, counters):
+        for i in range(len(a)):
+            a[i] = 0
+    since = time.time()
+    dirty = True
+
+
+def per_hour(slot):
+    # Counter slot per hour since the totals started
+    if since is None:
+        return 0
+    hours = (time.time() - since) / 3600
+    if hours <= 0:
+        return 0
+    return counters[slot] / hours
+
+
+def save():
+    # Writes the totals to the SD card if they changed
+    global dirty
+    if not dirty:
+        return
+    tmp = PATH + ".tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(struct.pack(_HEADER, len(SPANS), len(COUNTERS), since or time.time()))
+            for a in (counts, totals, peaks, lasts, averages, counters):
+                f.write(a)
+        try:
+            os.rename(tmp, PATH)
+        except OSError:
+            os.remove(PATH)
+            os.rename(tmp, PATH)
+        dirty = False
+    except OSError as e:
+        print("Error saving metrics: ", e)
+
+
+def load():
+    global since
+    since = time.time()
+    try:
+        with open(PATH, "rb") as f:
+            header = struct.unpack(_HEADER, f.read(struct.calcsize(_HEADER)))
+            if header[:2] != (len(SPANS), len(COUNTERS)):
+                # Written by a build with other slots
+                return
+            for a in (counts, totals, peaks, lasts, averages, counters):
+                f.readinto(a)
+            since = header[2]
+    except (OSError, ValueError) as e:
+        print("No saved metrics: ", e)
+
+
+def text():
+    # Plain text report, one span or counter per line
+    lines = ["# span count avg_ms recent_ms max_ms last_ms"]
+    for i in range(len(SPANS)):
+        n = counts[i]
+        lines.append("{} {} {} {} {} {}".format(SPANS[i], n, totals[i] // n if n else 0,
+                     averages[i] // 1000, peaks[i] // 1000, lasts[i] // 1000))
+    lines.append("# counter value per_hour, since {}".format(since))
+    for i in range(len(COUNTERS)):
+        lines.append("{} {} {}".format(COUNTERS[i], counters[i], round(per_hour(i), 2)))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,232 @@
+import json
+import time
+
+import network
+import uasyncio as asyncio
+
+import helper as ih
+import metrics
+
+# Wi-Fi connection manager. Remembers the BSSID and channel of the last
+# good access point and the DHCP lease it handed out, so a reconnect can
+# skip the scan and DHCP. Failed joins are retried with exponential backoff
+# inside a time budget, and after a failed cycle the next cycles skip Wi-Fi
+# for a growing while instead of burning battery on a dead network. The
+# radio is dropped once a cycle's fetches are done.
+
+STATE_PATH = "/wifi.json"
+# One join attempt, and all attempts in a cycle including backoff waits
+ATTEMPT_MS = 8000
+BUDGET_MS = 25000
+BACKOFF_MS = 1000
+# Reuse the last DHCP lease for this long before asking again
+LEASE_S = 12 * 3600
+# Longest a failed network is left alone between cycles
+MAX_SKIP_S = 3600
+POLL_MS = 100
+
+STATUS_TEXT = {
+    network.STAT_IDLE: "idle",
+    network.STAT_CONNECTING: "connecting",
+    network.STAT_WRONG_PASSWORD: "wrong password",
+    network.STAT_NO_AP_FOUND: "network not found",
+    network.STAT_CONNECT_FAIL: "connect failed",
+    network.STAT_GOT_IP: "connected",
+}
+
+wlan = None
+state = {"ssid": None, "bssid": None, "channel": None, "ip": None, "ip_at": None, "fails": 0, "retry_at": 0}
+# "off", "connected", "backoff" or the last failure from STATUS_TEXT
+link = "off"
+# Time to connected of the last successful join, and the last few of them
+connect_ms = None
+history = []
+# STATE_PATH as last read or written, so an unchanged state is not rewritten
+_saved = None
+
+
+def load_state():
+    global _saved
+    try:
+        with open(STATE_PATH, "r") as f:
+            state.update(json.loads(f.read()))
+        _saved = json.dumps(state)
+    except (OSError, ValueError):
+        pass
+
+
+def save_state():
+    # Writes to internal flash only when something changed, a join with the
+    # remembered AP and lease changes nothing
+    global _saved
+    text = json.dumps(state)
+    if text == _saved:
+        return
+    try:
+        with open(STATE_PATH, "w") as f:
+            f.write(text)
+        _saved = text
+    except OSError as e:
+        print("Error saving Wi-Fi state: ", e)
+
+
+def connected():
+    return wlan is not None and wlan.isconnected()
+
+
+def rssi():
+    try:
+        return wlan.status("rssi")
+    except Exception:
+        return None
+
+
+def describe():
+    if link == "connected":
+        strength = rssi()
+        if strength is not None:
+            return "Connected ({} dBm)".format(strength)
+        return "Connected"
+    if link == "backoff":
+        return "Offline, retrying in {} min".format(max(1, (state["retry_at"] - time.time()) // 60))
+    if link == "off":
+        if connect_ms is not None:
+            return "Radio off, joined in {}ms".format(connect_ms)
+        return "Radio off"
+    return "No connection ({})".format(link)
+
+
+def _lease_valid():
+    return state["ip"] is not None and 0 <= time.time() - (state["ip_at"] or 0) < LEASE_S
+
+
+def retry_now():
+    # Drops the backoff, for wakes the user asked for
+    state["retry_at"] = 0
+
+
+async def _attempt(ssid, psk, fast, timeout_ms):
+    # One join, using the remembered AP and lease when fast is set
+    if fast and _lease_valid():
+        wlan.ifconfig(tuple(state["ip"]))
+    else:
+        wlan.ifconfig("dhcp")
+    if fast and state["bssid"] is not None:
+        wlan.connect(ssid, psk, bssid = bytes(state["bssid"]))
+    else:
+        wlan.connect(ssid, psk)
+    start = time.ticks_ms()
+    while time.ticks_diff(time.ticks_ms(), start) < timeout_ms:
+        status = wlan.status()
+        if status < 0 or status >= network.STAT_GOT_IP:
+            return status
+        await asyncio.sleep_ms(POLL_MS)
+    return network.STAT_CONNECTING
+
+
+def _remember(ssid, leased):
+    # Finds the AP we joined so the next boot can go straight to it. leased
+    # is set when the address came from DHCP just now.
+    if state["bssid"] is None:
+        try:
+            best = None
+            for net in wlan.scan():
+                if net[0].decode() == ssid and (best is None or net[3] > best[3]):
+                    best = net
+            if best is not None:
+                state["bssid"] = list(best[1])
+                state["channel"] = best[2]
+        except Exception as e:
+            print("Wi-Fi scan failed: ", e)
+    if leased:
+        state["ip"] = list(wlan.ifconfig())
+        state["ip_at"] = time.time()
+
+
+async def connect(ssid, psk):
+    global wlan, link, connect_ms
+    if state["ssid"] != ssid:
+        # New network, forget everything about the old one
+        state.update({"ssid": ssid, "bssid": None, "channel": None, "ip": None, "ip_at": None, "fails": 0, "retry_at": 0})
+    if connected():
+        link = "connected"
+        return True
+    if time.time() < state["retry_at"]:
+        link = "backoff"
+        return False
+
+    wlan = network.WLAN(network.STA_IF)
+    wlan.active(True)
+    ih.pulse_network_led()
+    t = metrics.begin()
+    start = time.ticks_ms()
+    attempt = 0
+    leased = True
+    status = network.STAT_IDLE
+    try:
+        while True:
+            # First try the remembered AP with power saving left on, then do
+            # a full join with power saving off for slow APs
+            fast = attempt == 0
+            leased = not (fast and _lease_valid())
+            if not fast:
+                wlan.config(pm = 0xa11140)
+            left = BUDGET_MS - time.ticks_diff(time.ticks_ms(), start)
+            status = await _attempt(ssid, psk, fast, min(ATTEMPT_MS, left))
+            if status == network.STAT_GOT_IP:
+                break
+            wlan.disconnect()
+            if fast and state["bssid"] is not None:
+                # The AP may have moved channel or been replaced
+                state["bssid"] = None
+            attempt += 1
+            wait = BACKOFF_MS * (1 << (attempt - 1))
+            if status == network.STAT_WRONG_PASSWORD or time.ticks_diff(time.ticks_ms(), start) + wait >= BUDGET_MS:
+                break
+            await asyncio.sleep_ms(wait)
+    finally:
+        ih.stop_network_led()
+        metrics.end(metrics.WIFI, t)
+
+    if status == network.STAT_GOT_IP:
+        connect_ms = time.ticks_diff(time.ticks_ms(), start)
+        history.append(connect_ms)
+        if len(history) > 10:
+            history.pop(0)
+        print("Wi-Fi connected in {}ms".format(connect_ms))
+        ih.network_led_pwm.duty_u16(30000)
+        link = "connected"
+        state["fails"] = 0
+        state["retry_at"] = 0
+        _remember(ssid, leased)
+        save_state()
+        return True
+
+    state["fails"] += 1
+    state["retry_at"] = time.time() + min(MAX_SKIP_S, 60 * (1 << min(state["fails"], 6)))
+    save_state()
+    ih.led_warn.on()
+    radio_off()
+    # radio_off leaves "off", keep the reason the join failed
+    link = STATUS_TEXT.get(status, "failed")
+    return False
+
+
+def ensure(ssid, psk):
+    # Connects from plain code if we are not connected already. Only for
+    # callers outside an event loop, coroutines await connect() instead.
+    if connected():
+        return True
+    return asyncio.run(connect(ssid, psk))
+
+
+def radio_off():
+    global link
+    if wlan is not None:
+        try:
+            wlan.disconnect()
+            wlan.active(False)
+        except Exception:
+            pass
+    ih.network_led_pwm.duty_u16(0)
+    link = "off"
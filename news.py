@@ -0,0 +1,115 @@
+import time
+
+import helper as ih
+import httpc
+import jsonpull
+import membudget
+import metrics
+import sdcache
+
+# Guardian headlines for the Home page, cached in RAM and on the SD card
+# the same way as wxdata so the page still has headlines when offline.
+# Refetches are conditional GETs like wxdata.
+
+URL = "https://content.guardianapis.com/search?page-size=3&section=world|politics|business&api-key={}"
+CACHE_KEY = "news"
+# Only the headline of each result is pulled out of the response, see jsonpull
+SPEC = {"response": {"pageSize": True, "results": (0, 3, {"webTitle": True})}}
+# One headline when memory is tight
+SPEC_SHORT = {"response": {"pageSize": True, "results": (0, 1, {"webTitle": True})}}
+
+headlines = None
+fetched = None
+stale = False
+etag = None
+modified = None
+
+
+def clean(title):
+    # Swap characters the bitmap8 font cannot draw
+    return (
+        title
+            .replace("‘","\'")
+            .replace("’","\'")
+            .replace("–","-")
+            .replace("€", "EUR")
+    )
+
+
+def fetch(api_key):
+    global headlines, fetched, stale, etag, modified
+    budget = membudget.prepare("news")
+    if budget == membudget.CRITICAL:
+        raise MemoryError("Not enough memory to fetch news")
+    ih.pulse_network_led()
+    t = metrics.begin()
+    try:
+        response = httpc.get(URL.format(api_key), etag if headlines else None, modified if headlines else None)
+        try:
+            if response.status == 200:
+                news_data = jsonpull.load(response.raw, SPEC if budget == membudget.NORMAL else SPEC_SHORT)
+            elif response.status != 304:
+                raise OSError("News fetch failed, HTTP {}".format(response.status))
+            # As in wxdata, a short copy is not revalidated
+            short = budget != membudget.NORMAL and response.status == 200
+            etag = None if short else response.etag
+            modified = None if short else response.modified
+        finally:
+            response.close()
+    finally:
+        ih.stop_network_led()
+        ih.network_led_pwm.duty_u16(30000)
+        metrics.end(metrics.NEWS, t)
+    if response.status == 200:
+        results = news_data["response"]["results"]
+        headlines = [clean(results[i]["webTitle"]) for i in range(min(news_data["response"]["pageSize"], len(results)))]
+    fetched = time.time()
+    stale = False
+    sdcache.save(CACHE_KEY, {"headlines": headlines, "etag": etag, "modified": modified}, fetched)
+    return headlines
+
+
+def fresh(max_age):
+    return headlines is not None and time.time() - fetched < max_age
+
+
+def load_cached():
+    # Pull the last headlines off the SD card if RAM is empty
+    global headlines, fetched, etag, modified
+    if headlines is not None:
+        return
+    entry = sdcache.load(CACHE_KEY)
+    if entry is None:
+        return
+    fetched, payload = entry
+    # Entries from before validators were kept are a bare list
+    if isinstance(payload, list):
+        payload = {"headlines": payload}
+    headlines = payload["headlines"]
+    etag = payload.get("etag")
+    modified = payload.get("modified")
+
+
+def get(api_key, max_age, online=True):
+    # Same contract as wxdata.get
+    global stale
+    load_cached()
+    if fresh(max_age):
+        stale = False
+        return headlines
+    try:
+        # online may be a function that brings the link up on demand
+        if callable(online):
+            online = online()
+        if not online:
+            raise OSError("No network connection")
+        return fetch(api_key)
+    except Exception as e:
+        metrics.count(metrics.FETCH_ERRORS)
+        if isinstance(e, MemoryError):
+            membudget.event("news fetch: {}".format(e))
+        if headlines is None:
+            raise
+        print("Using cached news: ", e)
+        stale = True
+        return headlines
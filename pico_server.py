@@ -1,171 +1,199 @@
 import network
 import time
-import socket
 import helper as ih
+import metrics
+import webpage
 import machine
-import ure
-import json
 import uasyncio as asyncio
 
 server_task = None
 ip = None
-s = None
+server = None
+changed = False
+
+# Keep-alive connections are closed after this long without a request
+KEEPALIVE_S = 10
+# Connections served at once, more get a 503
+MAX_CONNECTIONS = 4
+MAX_LINE = 2048
+MAX_HEADERS = 32
+PORT = 80
+connections = 0
+
 
 def urldecode(s):
-    return s.replace("%20", " ").replace("%2C", ",")
-
-
-def urlspace(s):
-    return s.replace("+", " ")
-
-
-def web_page():
-    ih.load_cfg()
-    net_ssid = ih.cfg["WIFI_SSID"]
-    net_pass = ih.cfg["WIFI_PASSWORD"]
-    api_key = ih.cfg["API_KEY"]
-    loc_name = ih.cfg["LOCATION_NAME"]
-    lat = ih.cfg["LOCATION"][0]
-    long = ih.cfg["LOCATION"][1]
-    interval = str(ih.cfg["UPDATE_INTERVAL"])
-    html = """
-    <html lang="en">
-<head>
-  <meta charset="UTF-8">
-  <title>Settings Form</title>
-  <style>
-    body {
-      font-family: Arial, sans-serif;
-      margin: 40px;
-      background-color: #f9f9f9;
-    }
-    h1 {
-      color: #333;
-    }
-    form {
-      max-width: 400px;
-      padding: 20px;
-      background: #fff;
-      border: 1px solid #ccc;
-      border-radius: 8px;
-    }
-    label {
-      display: block;
-      margin-top: 15px;
-      font-weight: bold;
-    }
-    input[type="text"] {
-      width: 100%;
-      padding: 8px;
-      margin-top: 5px;
-      border: 1px solid #ccc;
-      border-radius: 4px;
-    }
-    button {
-      margin-top: 20px;
-      padding: 10px 15px;
-      background: #0078d7;
-      color: white;
-      border: none;
-      border-radius: 4px;
-      cursor: pointer;
-    }
-    button:hover {
-      background: #005a9e;
-    }
-  </style>
-</head>
-""" + """
-<body>
-  <h1>Device Settings</h1>
-  <form method="GET" action="/">
-  <label>Wifi SSID:</label>
-  <input type="text" name="wifi_ssid" value="{net_ssid}">
-
-  <label>Wifi Password:</label>
-  <input type="text" name="wifi_password" value = "{net_pass}">
-
-  <label>API Key:</label>
-  <input type="text" name="api_key" value = "{api_key}">
-
-  <label>Latitude:</label>
-  <input type="text" name="loc_lat" value="{lat}">
-
-  <label>Longitude:</label>
-  <input type="text" name="loc_lon" value="{long}">
-
-  <label>Location Name:</label>
-  <input type="text" name="loc_name" value="{loc_name}">
-
-  <label>Update Interval (Seconds):</label>
-  <input type="text" name="upd_int" value="{interval}">
-
-  <button type="submit">Submit</button>
-</form>
-<form method="GET" action="/reset">
-  <button type="submit">Restart Device</button>
-</form>
-</body>
-</html>
-""".format(net_ssid = net_ssid, lat = lat, long = long, loc_name = loc_name, interval = interval, net_pass = net_pass, api_key = api_key)
-    return html
-
-
-async def handle_client(conn):
-    request = conn.recv(1024)
-    request_str = request.decode()
-    print("Request: ", request_str)
-    
-    if "GET /reset" in request_str:
-        await conn.send("HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n")
-        await conn.send("<html><body><h1>Resetting...</h1></body></html>")
-        await conn.close()
-        machine.reset()  # <-- triggers Pico reset
-    elif "GET /?" in request_str:
-        query_part = request_str.split("GET /?")[1]
-        query_string = query_part.split(" ")[0]
-            
-        params = query_string.split("&")
-             
-        settings = {}
-        for p in params:
-            if "=" in p:
-                key, value = p.split("=", 1)
-                settings[key] = urldecode(value)
-                    
-        settings["loc_name"] = urlspace(settings["loc_name"])
-        print("Parsed settings:", settings)
-            
-        if not(settings["loc_lon"] is None) and not(settings["loc_lat"] is None):
-            try:
-                temp = [float(settings["loc_lat"]), float(settings["loc_lon"])]
-                ih.update_cfg("LOCATION", temp)
-            except:
-                print("Error parsing Location Data")
-        if settings["loc_name"] != "":
-            ih.update_cfg("LOCATION_NAME", settings["loc_name"])
-        if settings["wifi_ssid"] != "":
-            ih.update_cfg("WIFI_SSID", settings["wifi_ssid"])
-            ih.update_cfg("WIFI_PASSWORD", settings["wifi_password"])
-        if settings["api_key"] != "":
-            ih.update_cfg("API_KEY", settings["api_key"])
-        if settings["upd_int"] != "":
-            try:
-                ih.update_cfg("UPDATE_INTERVAL", int(settings["upd_int"]))
-            except:
-                print("Error parsing update interval")
-                    
-        print(ih.cfg)
+    # Decodes a form value, + is a space and %XX an escaped byte
+    s = s.replace("+", " ")
+    if "%" not in s:
+        return s
+    out = bytearray()
+    parts = s.split("%")
+    out.extend(parts[0].encode())
+    for part in parts[1:]:
+        try:
+            out.append(int(part[:2], 16))
+            out.extend(part[2:].encode())
+        except ValueError:
+            out.extend(b"%" + part.encode())
+    return out.decode()
+
+
+def parse_query(query):
+    params = {}
+    for p in query.split("&"):
+        if "=" in p:
+            key, value = p.split("=", 1)
+            params[urldecode(key)] = urldecode(value)
+    return params
+
+
+def apply_settings(settings):
+    global changed
+    print("Parsed settings:", settings)
+
+    fields = {}
+    if settings.get("loc_lon", "") != "" and settings.get("loc_lat", "") != "":
+        try:
+            fields["LOCATION"] = [float(settings["loc_lat"]), float(settings["loc_lon"])]
+        except:
+            print("Error parsing Location Data")
+    if settings.get("loc_name", "") != "":
+        fields["LOCATION_NAME"] = settings["loc_name"]
+    if settings.get("wifi_ssid", "") != "":
+        fields["WIFI_SSID"] = settings["wifi_ssid"]
+        fields["WIFI_PASSWORD"] = settings.get("wifi_password", "")
+    if settings.get("api_key", "") != "":
+        fields["API_KEY"] = settings["api_key"]
+    if settings.get("upd_int", "") != "":
+        try:
+            fields["UPDATE_INTERVAL"] = int(settings["upd_int"])
+        except:
+            print("Error parsing update interval")
+    # Only a real change needs a reboot to apply
+    if ih.update_cfgs(fields):
+        changed = True
+    print(ih.cfg, "config writes/hour:", ih.cfg_writes_per_hour())
+
+
+async def read_request(reader):
+    # Returns (method, path, query, headers), or None when the client has gone
+    line = await asyncio.wait_for(reader.readline(), KEEPALIVE_S)
+    if not line:
+        return None
+    if len(line) > MAX_LINE:
+        raise ValueError("Request line too long")
+    parts = line.decode().split()
+    if len(parts) != 3:
+        raise ValueError("Bad request line")
+    method, target, _ = parts
+
+    headers = {}
+    while True:
+        line = await asyncio.wait_for(reader.readline(), KEEPALIVE_S)
+        if not line or line == b"\r\n" or line == b"\n":
+            break
+        if len(headers) >= MAX_HEADERS or len(line) > MAX_LINE:
+            raise ValueError("Headers too large")
+        if b":" in line:
+            key, value = line.decode().split(":", 1)
+            headers[key.strip().lower()] = value.strip()
+
+    # Bodies are not used, but must be read to keep the connection in step
+    length = int(headers.get("content-length", 0))
+    if length:
+        await reader.readexactly(length)
+
+    if "?" in target:
+        path, query = target.split("?", 1)
+    else:
+        path, query = target, ""
+    return method, path, query, headers
+
+
+def send_head(writer, status, length, content_type = "text/html", keep_alive = True, extra = ""):
+    writer.write("HTTP/1.1 {}\r\nContent-Type: {}\r\nContent-Length: {}\r\nConnection: {}\r\n{}\r\n".format(
+        status, content_type, length, "keep-alive" if keep_alive else "close", extra).encode())
+
+
+async def send(writer, status, body = b"", content_type = "text/html", keep_alive = True, extra = ""):
+    if isinstance(body, str):
+        body = body.encode()
+    send_head(writer, status, len(body), content_type, keep_alive, extra)
+    if body:
+        writer.write(body)
+    await writer.drain()
+
+
+async def send_page(writer, keep_alive):
+    vals = webpage.values()
+    send_head(writer, "200 OK", webpage.length(vals), "text/html; charset=utf-8", keep_alive)
+    await webpage.write_page(writer, vals)
+
+
+async def send_css(writer, headers, keep_alive):
+    cache = "ETag: {}\r\nCache-Control: max-age=86400\r\n".format(webpage.CSS_ETAG)
+    if headers.get("if-none-match") == webpage.CSS_ETAG:
+        await send(writer, "304 Not Modified", keep_alive = keep_alive, extra = cache)
     else:
-        response = web_page()
-        conn.send("HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n")
-        conn.send(response)
-        conn.close()
+        await send(writer, "200 OK", webpage.CSS, "text/css", keep_alive, cache)
+
+
+async def handle_client(reader, writer):
+    global connections
+    connections += 1
+    try:
+        if connections > MAX_CONNECTIONS:
+            await send(writer, "503 Service Unavailable", keep_alive = False)
+            return
+        while server_task:
+            try:
+                request = await read_request(reader)
+            except asyncio.TimeoutError:
+                break
+            except ValueError as e:
+                print("Bad request: ", e)
+                await send(writer, "400 Bad Request", keep_alive = False)
+                break
+            if request is None:
+                break
+            method, path, query, headers = request
+            print("Request: ", method, path)
+            keep_alive = headers.get("connection", "").lower() != "close"
+
+            if method != "GET":
+                await send(writer, "405 Method Not Allowed", keep_alive = keep_alive)
+            elif path == "/reset":
+                await send(writer, "200 OK", "<html><body><h1>Resetting...</h1></body></html>", keep_alive = False)
+                writer.close()
+                await asyncio.sleep(0.5)
+                machine.reset()  # <-- triggers Pico reset
+            elif path == "/" and query:
+                apply_settings(parse_query(query))
+                # Back to the form so a refresh does not submit again
+                await send(writer, "303 See Other", keep_alive = keep_alive, extra = "Location: /\r\n")
+            elif path == "/":
+                await send_page(writer, keep_alive)
+            elif path == "/style.css":
+                await send_css(writer, headers, keep_alive)
+            elif path == "/metrics":
+                await send(writer, "200 OK", metrics.text(), "text/plain", keep_alive)
+            else:
+                await send(writer, "404 Not Found", keep_alive = keep_alive)
+            if not keep_alive:
+                break
+    except OSError as e:
+        print("Connection error: ", e)
+    finally:
+        connections -= 1
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
 
 
 async def start_server(ssid, password):
-    global server_task, ip
-    ih.load_cfg()
+    global server_task, ip, server
     # Just making our internet connection
     ap = network.WLAN(network.AP_IF)
     ap.config(essid = ssid, password = password.encode())
@@ -177,23 +205,15 @@ async def start_server(ssid, password):
     print('IP Address To Connect to:: ' + ap.ifconfig()[0])
     ip = ap.ifconfig()[0]
     
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)   #creating socket object
-    s.bind(('', 80))
-    s.listen(5)
-    s.settimeout(0.5)
-    
+    server = await asyncio.start_server(handle_client, "0.0.0.0", PORT)
     server_task = True
     while server_task:
-        print("Awaiting connection...")
-        try:
-            conn, addr = s.accept()
-            print("Connected to:", addr)
-            await handle_client(conn)
-        except:
-            pass
-        await asyncio.sleep(0)
+        await asyncio.sleep(0.1)
+    # Free port 80 so the settings page can start the server again in-process
+    server.close()
+    await server.wait_closed()
+
 
-   
 async def stop_server():
     global server_task
     server_task = False
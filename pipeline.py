@@ -0,0 +1,59 @@
+import time
+
+import uasyncio as asyncio
+
+# Runs boot and refresh work as uasyncio stages and keeps a timing trace.
+# Waiting stages such as the Wi-Fi join only poll, so the setup stages
+# started next to them run while the radio associates.
+#
+# A stage timeout can only fire while the stage awaits. Plain functions run
+# through call() and blocking work like an httpc fetch or the NTP request
+# run to completion once started, so they are bounded by their own socket
+# timeouts, not by stage(). They overlap a polling stage, not each other.
+
+# (name, start ms, end ms, status) relative to start()
+trace = []
+t0 = None
+
+
+def start():
+    global t0
+    t0 = time.ticks_ms()
+    del trace[:]
+
+
+def _now():
+    return time.ticks_diff(time.ticks_ms(), t0)
+
+
+async def stage(name, coro, timeout = None):
+    # Awaits coro, returning its result or None on timeout or error
+    begin = _now()
+    status = "ok"
+    result = None
+    try:
+        if timeout is None:
+            result = await coro
+        else:
+            result = await asyncio.wait_for(coro, timeout)
+    except asyncio.TimeoutError:
+        status = "timeout"
+    except Exception as e:
+        status = "error"
+        print("Stage {} failed: {}".format(name, e))
+    trace.append((name, begin, _now(), status))
+    return result
+
+
+async def call(fn, *args):
+    # Wraps a plain function so it can run as a stage. It yields once before
+    # the call and never during it, so a timeout on the stage has no effect.
+    await asyncio.sleep(0)
+    return fn(*args)
+
+
+def report():
+    for name, begin, end, status in trace:
+        print("{:>10} {:>6}ms {:>6}ms {}".format(name, begin, end - begin, status))
+    if trace:
+        print("{:>10} {:>6}ms".format("total", max(t[2] for t in trace)))
@@ -0,0 +1,40 @@
+import gc
+
+# Resident page router. Pages run in-process so the network, sensor, SD card
+# and graphics objects created in init() survive a page change instead of
+# being rebuilt by machine.reset().
+
+# Page names in nav button order (button A to E)
+NAV = ["home", "wx_now", "wx_hourly", "wx_daily", "settings"]
+
+# Older config.json files may contain these run values
+ALIASES = {None: "home", "Home": "home"}
+
+pages = {}
+current = None
+switches = 0
+
+
+def register(name, page):
+    # page() draws the page, waits for input and returns the next page name
+    pages[name] = page
+
+
+def resolve(name):
+    name = ALIASES.get(name, name)
+    if name not in pages:
+        return "home"
+    return name
+
+
+def run(start):
+    global current, switches
+    current = resolve(start)
+    while True:
+        nxt = pages[current]()
+        if nxt is not None:
+            nxt = resolve(nxt)
+            if nxt != current:
+                switches += 1
+            current = nxt
+        gc.collect()
@@ -0,0 +1,115 @@
+import time
+
+import helper as ih
+import inky_frame
+import inputs
+import membudget
+import metrics
+import news
+import sensorlog
+import wxdata
+
+# Refresh scheduler. Works out when the page on screen next needs redrawing
+# from how fresh its data is, and sleeps on the PCF85063A timer until then.
+# On battery that powers the board down until the timer or a button wakes
+# it. Wake reasons are logged to the SD card.
+
+# Sensor readings on the Home page are redrawn at least this often
+SENSOR_S = 1800
+# Never wake more often than this, even if a source is already stale
+MIN_WAKE_S = 60
+# ih.sleep takes minutes and the RTC timer counts to 255
+MAX_SLEEP_MIN = 255
+
+# Data each page shows
+PAGE_SOURCES = {
+    "home": ("news", "sensor"),
+    "wx_now": ("weather",),
+    "wx_hourly": ("weather",),
+    "wx_daily": ("weather",),
+}
+
+# time.time() of the last sensor reading drawn
+sensor_read = None
+
+LOG_PATH = "/sd/wake.log"
+LOG_LINES = 50
+wakes = []
+
+
+def fetched(source):
+    if source == "news":
+        return news.fetched
+    if source == "weather":
+        return wxdata.fetched
+    if source == "sensor":
+        return sensor_read
+    return None
+
+
+def ttl(source, interval):
+    if source == "sensor":
+        return min(SENSOR_S, interval)
+    return interval
+
+
+def next_wake(page, interval, now = None):
+    # Seconds until the page needs redrawing
+    if now is None:
+        now = time.time()
+    wait = interval
+    for source in PAGE_SOURCES.get(page, ()):
+        stamp = fetched(source)
+        if stamp is None:
+            continue
+        wait = min(wait, stamp + ttl(source, interval) - now)
+    return max(MIN_WAKE_S, wait)
+
+
+def wake_reason():
+    if inky_frame.woken_by_button():
+        return "button"
+    if inky_frame.woken_by_rtc():
+        return "rtc"
+    if inky_frame.woken_by_ext_trigger():
+        return "ext"
+    return "power"
+
+
+def log(event):
+    # Keeps the last LOG_LINES events in RAM and on the SD card if there is one
+    line = "{} {}".format(time.time(), event)
+    print("Scheduler:", line)
+    wakes.append(line)
+    if len(wakes) > LOG_LINES:
+        wakes.pop(0)
+    try:
+        with open(LOG_PATH, "w") as f:
+            f.write("\n".join(wakes))
+    except OSError:
+        pass
+
+
+def load_log():
+    global wakes
+    try:
+        with open(LOG_PATH, "r") as f:
+            wakes = f.read().split("\n")[-LOG_LINES:]
+    except OSError:
+        pass
+
+
+def sleep(page, seconds):
+    # Sleeps until the next refresh, returns a button pressed while on USB power or None.
+    # Rounded up, waking before the data is due only costs a second wake.
+    minutes = max(1, min(MAX_SLEEP_MIN, (seconds + 59) // 60))
+    ih.update_cfg("run", page)
+    # RAM is lost when the board powers down on battery
+    if sensorlog.unflushed:
+        sensorlog.flush()
+    metrics.save()
+    membudget.save()
+    log("sleep {} {}m".format(page, minutes))
+    pressed = ih.sleep(minutes, inputs.wait)
+    log("wake {}".format("timer" if pressed is None else "button"))
+    return pressed
@@ -0,0 +1,148 @@
+import json
+import os
+import time
+
+# Small response cache on the SD card. Each entry is one file holding the
+# save time on the first line and the JSON payload after it. Files are
+# written to a temp name and renamed over the entry, so a power cut leaves
+# the old entry or the new one and never half of one. Where the rename
+# cannot replace a file, the old entry is removed first, and a temp file
+# found without its entry is renamed into place if it is complete. Wear and
+# space are bounded: identical payloads and writes closer together than
+# MIN_WRITE_S are skipped, and the oldest entries are evicted once there are
+# more than MAX_ENTRIES or MAX_BYTES on the card.
+
+ROOT = "/sd/cache"
+MAX_ENTRIES = 8
+MAX_BYTES = 64 * 1024
+MAX_ENTRY_BYTES = 16 * 1024
+MIN_WRITE_S = 300
+
+enabled = False
+# key -> (saved at, hash of payload) for the entries written this boot
+written = {}
+
+
+def mount(sd):
+    global enabled
+    try:
+        os.mount(sd, "/sd")
+    except OSError as e:
+        # Already mounted
+        print("SD mount: ", e)
+    try:
+        os.mkdir(ROOT)
+    except OSError:
+        pass
+    enabled = True
+
+
+def _path(key):
+    return "{}/{}.json".format(ROOT, key)
+
+
+def _read_stamp(path):
+    with open(path, "r") as f:
+        return int(f.readline())
+
+
+def _exists(path):
+    try:
+        os.stat(path)
+        return True
+    except OSError:
+        return False
+
+
+def _recover(path):
+    # Finishes a save cut off between removing the old entry and the rename.
+    # The first save of a key has no old entry, so the temp file may also be
+    # half written, only a complete one is kept.
+    tmp = path + ".tmp"
+    if _exists(path) or not _exists(tmp):
+        return
+    try:
+        with open(tmp, "r") as f:
+            int(f.readline())
+            json.loads(f.read())
+    except (OSError, ValueError):
+        os.remove(tmp)
+        return
+    os.rename(tmp, path)
+
+
+def load(key):
+    # Returns (saved at, payload) or None
+    if not enabled:
+        return None
+    try:
+        _recover(_path(key))
+        with open(_path(key), "r") as f:
+            stamp = int(f.readline())
+            payload = json.loads(f.read())
+        return stamp, payload
+    except (OSError, ValueError) as e:
+        print("Cache miss for {}: {}".format(key, e))
+        return None
+
+
+def save(key, payload, stamp=None):
+    if not enabled:
+        return False
+    if stamp is None:
+        stamp = time.time()
+    text = json.dumps(payload)
+    if len(text) > MAX_ENTRY_BYTES:
+        print("Not caching {}, {} bytes".format(key, len(text)))
+        return False
+    digest = hash(text)
+    last = written.get(key)
+    if last is not None and (last[1] == digest or stamp - last[0] < MIN_WRITE_S):
+        return False
+
+    path = _path(key)
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, "w") as f:
+            f.write(str(stamp))
+            f.write("\n")
+            f.write(text)
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            os.remove(path)
+            os.rename(tmp, path)
+    except OSError as e:
+        print("Error writing cache: ", e)
+        return False
+    written[key] = (stamp, digest)
+    evict()
+    return True
+
+
+def evict():
+    entries = []
+    total = 0
+    for name in os.listdir(ROOT):
+        path = "{}/{}".format(ROOT, name)
+        if name.endswith(".tmp"):
+            target = path[:-4]
+            if _exists(target):
+                # Left over from a write cut off before the rename
+                os.remove(path)
+                continue
+            _recover(target)
+            if not _exists(target):
+                continue
+            path = target
+        try:
+            size = os.stat(path)[6]
+            entries.append((_read_stamp(path), size, path))
+            total += size
+        except (OSError, ValueError):
+            os.remove(path)
+    entries.sort()
+    while entries and (len(entries) > MAX_ENTRIES or total > MAX_BYTES):
+        _, size, path = entries.pop(0)
+        os.remove(path)
+        total -= size
@@ -0,0 +1,183 @@
+import os
+import struct
+import time
+from array import array
+
+import tsdb
+
+# BME69X history in a fixed-size ring buffer. Samples are stored as fixed
+# point integers in preallocated arrays, so memory use is the same however
+# long the device runs:
+#   temperature  0.01 C      array('h')
+#   pressure     10 Pa       array('h')
+#   humidity     0.01 %      array('h')
+#   gas          100 ohm     array('H'), 0 until the heater is stable
+# The ring is flushed to the SD card in binary every FLUSH_EVERY samples and
+# before sleeping, and read back at boot. Every sample is also passed to
+# tsdb for history beyond the last 24 hours.
+
+CAPACITY = 288
+# Seconds between samples, 288 samples at 5 minutes covers 24 hours
+SAMPLE_S = 300
+FLUSH_EVERY = 12
+PATH = "/sd/sensor.bin"
+# head, count, cadence
+_HEADER = "<HHH"
+
+FIELDS = ("temp", "press", "humid", "gas")
+SCALE = {"temp": 100, "press": 0.1, "humid": 100, "gas": 0.01}
+
+times = array("L", [0] * CAPACITY)
+data = {
+    "temp": array("h", [0] * CAPACITY),
+    "press": array("h", [0] * CAPACITY),
+    "humid": array("h", [0] * CAPACITY),
+    "gas": array("H", [0] * CAPACITY),
+}
+head = 0
+count = 0
+unflushed = 0
+
+bme = None
+heater_stable = 0
+last_sample = None
+
+
+def _clamp(value, low, high):
+    return max(low, min(high, int(value)))
+
+
+def add(stamp, temp, press, humid, gas = 0):
+    global head, count, unflushed
+    times[head] = stamp
+    data["temp"][head] = _clamp(temp * 100, -32768, 32767)
+    data["press"][head] = _clamp(press / 10, -32768, 32767)
+    data["humid"][head] = _clamp(humid * 100, -32768, 32767)
+    data["gas"][head] = _clamp(gas / 100, 0, 65535)
+    # Long range history and rollups go to the SD card store
+    try:
+        tsdb.append(stamp, (data["temp"][head], data["press"][head], data["humid"][head], data["gas"][head]))
+    except OSError as e:
+        print("Error writing sensor history: ", e)
+    head = (head + 1) % CAPACITY
+    count = min(count + 1, CAPACITY)
+    unflushed += 1
+    if unflushed >= FLUSH_EVERY:
+        flush()
+
+
+def sample(now = None):
+    # Reads the sensor and stores it. Returns (temp, press, humid) or None.
+    global last_sample
+    if bme is None:
+        return None
+    if now is None:
+        now = time.time()
+    temp, press, humid, gas, status, _, _ = bme.read()
+    if not (status & heater_stable):
+        gas = 0
+    add(now, temp, press, humid, gas)
+    last_sample = now
+    return temp, press, humid
+
+
+def maybe_sample():
+    # Cheap enough to call from the input polling loop
+    if bme is None:
+        return
+    now = time.time()
+    if last_sample is None or now - last_sample >= SAMPLE_S:
+        try:
+            sample(now)
+        except Exception as e:
+            print("Error sampling sensor: ", e)
+
+
+def _index(i):
+    # Ring position of the i-th oldest sample
+    return (head - count + i) % CAPACITY
+
+
+def value(field, i):
+    return data[field][_index(i)] / SCALE[field]
+
+
+def series(field, points, span_s = 24 * 3600, now = None):
+    # Mean of field in each of points equal buckets covering the last
+    # span_s seconds, None for buckets without samples
+    if now is None:
+        now = time.time()
+    start = now - span_s
+    sums = [0] * points
+    counts = [0] * points
+    arr = data[field]
+    for i in range(count):
+        j = _index(i)
+        t = times[j]
+        if t < start:
+            continue
+        b = min(points - 1, (t - start) * points // span_s)
+        sums[b] += arr[j]
+        counts[b] += 1
+    scale = SCALE[field]
+    return [sums[b] / counts[b] / scale if counts[b] else None for b in range(points)]
+
+
+def flush():
+    global unflushed
+    tmp = PATH + ".tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(struct.pack(_HEADER, head, count, SAMPLE_S))
+            f.write(times)
+            for field in FIELDS:
+                f.write(data[field])
+        try:
+            os.rename(tmp, PATH)
+        except OSError:
+            os.remove(PATH)
+            os.rename(tmp, PATH)
+        unflushed = 0
+    except OSError as e:
+        print("Error saving sensor history: ", e)
+
+
+def load():
+    global head, count
+    try:
+        with open(PATH, "rb") as f:
+            h, c, _ = struct.unpack(_HEADER, f.read(struct.calcsize(_HEADER)))
+            if h >= CAPACITY or c > CAPACITY:
+                return
+            f.readinto(times)
+            for field in FIELDS:
+                f.readinto(data[field])
+        head = h
+        count = c
+    except (OSError, ValueError) as e:
+        print("No sensor history: ", e)
+
+
+def sparkline(gfx, field, x, y, w, h, pen, span_s = 24 * 3600):
+    # Draws the last span_s seconds of field as a line w px wide, one point per 4 px
+    points = max(2, w // 4)
+    values = series(field, points, span_s)
+    known = [v for v in values if v is not None]
+    if len(known) < 2:
+        return False
+    low = min(known)
+    high = max(known)
+    rng = (high - low) or 1
+    gfx.set_pen(pen)
+    last = None
+    for i in range(points):
+        v = values[i]
+        if v is None:
+            last = None
+            continue
+        px = x + i * (w - 1) // (points - 1)
+        py = y + h - 1 - int((v - low) * (h - 1) / rng)
+        if last is not None:
+            gfx.line(last[0], last[1], px, py, 2)
+        last = (px, py)
+    return True
@@ -0,0 +1,214 @@
+import os
+import struct
+import time
+
+# Time-series store for sensor history on the SD card. Raw samples go into
+# one segment file per day, and every sample also updates min/max/sum
+# rollups at 5 minute, hour and day resolution. All records are fixed
+# width, so a window is found by binary search on record times, and a chart
+# query reads from the coarsest level that still gives each pixel a
+# bucket. Levels are 12 and 24 times apart, so a query reads at most 24
+# records per pixel and usually a few: a week for a 640 px chart is 2016
+# 5 minute records, a month 720 hourly ones, rather than every raw sample.
+# The binary search needs times in order, so a sample older than the
+# newest one stored, as after the clock is set back, is dropped.
+#
+# Values are the fixed point integers used by sensorlog, in FIELDS order.
+# Rollups keep the sum of each field rather than the mean, so merging a
+# sample is exact and means are only divided out in query().
+
+ROOT = "/sd/ts"
+FIELDS = ("temp", "press", "humid", "gas")
+
+# time, temp, press, humid, gas. Gas is unsigned like sensorlog's array.
+RAW = "<LhhhH"
+RAW_SIZE = struct.calcsize(RAW)
+# bucket start, sample count, then min, max, sum for each field
+ROLLUP = "<LH" + "hhl" * (len(FIELDS) - 1) + "HHl"
+ROLLUP_SIZE = struct.calcsize(ROLLUP)
+
+# (bucket seconds, segment file naming) coarsest last
+LEVELS = ((300, "month"), (3600, "year"), (86400, "all"))
+
+enabled = False
+# Records read by the last query, to check queries stay O(pixels)
+last_reads = 0
+# Time of the newest raw sample stored
+newest = None
+
+
+def _mkdir(path):
+    try:
+        os.mkdir(path)
+    except OSError:
+        pass
+
+
+def open_store(root = ROOT):
+    global ROOT, enabled, newest
+    ROOT = root
+    _mkdir(ROOT)
+    _mkdir(ROOT + "/raw")
+    for bucket, _ in LEVELS:
+        _mkdir("{}/r{}".format(ROOT, bucket))
+    # Day segments are named by date, so the last name holds the newest sample
+    newest = None
+    names = sorted(os.listdir(ROOT + "/raw"))
+    if names:
+        path = "{}/raw/{}".format(ROOT, names[-1])
+        size = _size(path)
+        if size >= RAW_SIZE:
+            with open(path, "rb") as f:
+                f.seek(size - size % RAW_SIZE - RAW_SIZE)
+                newest = struct.unpack("<L", f.read(4))[0]
+    enabled = True
+
+
+def _segment(level, stamp):
+    t = time.gmtime(stamp)
+    if level is None:
+        return "{}/raw/{:04d}{:02d}{:02d}.bin".format(ROOT, t[0], t[1], t[2])
+    bucket, naming = LEVELS[level]
+    if naming == "month":
+        name = "{:04d}{:02d}".format(t[0], t[1])
+    elif naming == "year":
+        name = "{:04d}".format(t[0])
+    else:
+        name = "all"
+    return "{}/r{}/{}.bin".format(ROOT, bucket, name)
+
+
+def _size(path):
+    try:
+        return os.stat(path)[6]
+    except OSError:
+        return 0
+
+
+def append(stamp, values):
+    global newest
+    if not enabled:
+        return
+    if newest is not None and stamp < newest:
+        print("Dropped sample from {}, older than the last one stored".format(stamp))
+        return
+    newest = stamp
+    with open(_segment(None, stamp), "ab") as f:
+        f.write(struct.pack(RAW, stamp, *values))
+    for level in range(len(LEVELS)):
+        _roll(level, stamp, values)
+
+
+def _roll(level, stamp, values):
+    # Merges a sample into the last record of the level, or starts a new one
+    bucket = LEVELS[level][0]
+    start = stamp - stamp % bucket
+    path = _segment(level, start)
+    size = _size(path)
+    last = None
+    if size >= ROLLUP_SIZE:
+        with open(path, "rb") as f:
+            f.seek(size - ROLLUP_SIZE)
+            last = struct.unpack(ROLLUP, f.read(ROLLUP_SIZE))
+    if last is not None and last[0] == start:
+        n = last[1]
+        rec = [start, n + 1]
+        for i in range(len(FIELDS)):
+            lo, hi, total = last[2 + 3 * i: 5 + 3 * i]
+            v = values[i]
+            rec += [min(lo, v), max(hi, v), total + v]
+        with open(path, "r+b") as f:
+            f.seek(size - ROLLUP_SIZE)
+            f.write(struct.pack(ROLLUP, *rec))
+    elif last is None or last[0] < start:
+        rec = [start, 1]
+        for v in values:
+            rec += [v, v, v]
+        with open(path, "ab") as f:
+            f.write(struct.pack(ROLLUP, *rec))
+
+
+def _find(f, size, rec_size, stamp):
+    # Index of the first record at or after stamp
+    lo = 0
+    hi = size // rec_size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        f.seek(mid * rec_size)
+        if struct.unpack("<L", f.read(4))[0] < stamp:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _segments(level, start, end):
+    # Segment paths covering start to end, oldest first
+    step = 86400 if level is None else LEVELS[level][0]
+    step = max(step, 86400)
+    paths = []
+    t = start - start % 86400
+    while t <= end:
+        path = _segment(level, t)
+        if not paths or paths[-1] != path:
+            paths.append(path)
+        t += step
+    return paths
+
+
+def _records(level, start, end):
+    # Yields unpacked records of a level with start <= time < end
+    global last_reads
+    fmt = RAW if level is None else ROLLUP
+    rec_size = RAW_SIZE if level is None else ROLLUP_SIZE
+    for path in _segments(level, start, end):
+        size = _size(path)
+        if size == 0:
+            continue
+        with open(path, "rb") as f:
+            i = _find(f, size, rec_size, start)
+            f.seek(i * rec_size)
+            while i < size // rec_size:
+                rec = struct.unpack(fmt, f.read(rec_size))
+                if rec[0] >= end:
+                    break
+                last_reads += 1
+                yield rec
+                i += 1
+
+
+def level_for(span, pixels):
+    # Coarsest level with at least one bucket per pixel, None for raw samples
+    per_pixel = span / pixels
+    best = None
+    for level in range(len(LEVELS)):
+        if LEVELS[level][0] <= per_pixel:
+            best = level
+    return best
+
+
+def query(field, start, end, pixels):
+    # (min, max, mean) of field for each of pixels columns from start to
+    # end, None where there is no data. Means are rounded to the nearest.
+    global last_reads
+    last_reads = 0
+    k = FIELDS.index(field)
+    span = end - start
+    level = level_for(span, pixels)
+    lows = [None] * pixels
+    highs = [None] * pixels
+    sums = [0] * pixels
+    counts = [0] * pixels
+    for rec in _records(level, start, end):
+        col = min(pixels - 1, (rec[0] - start) * pixels // span)
+        if level is None:
+            lo = hi = total = rec[1 + k]
+            n = 1
+        else:
+            n = rec[1]
+            lo, hi, total = rec[2 + 3 * k: 5 + 3 * k]
+        lows[col] = lo if lows[col] is None else min(lows[col], lo)
+        highs[col] = hi if highs[col] is None else max(highs[col], hi)
+        sums[col] += total
+        counts[col] += n
+    return [(lows[c], highs[c], (sums[c] + counts[c] // 2) // counts[c]) if counts[c] else None for c in range(pixels)]
@@ -0,0 +1,138 @@
+import binascii
+
+import helper as ih
+
+# The settings page as static byte chunks with value slots in between. The
+# chunks are bytes constants, so when this module is frozen into the
+# firmware they are read straight from flash, and a request only allocates
+# the escaped config values. The stylesheet is served separately with an
+# ETag so browsers can keep it.
+
+CSS = b"""body {
+  font-family: Arial, sans-serif;
+  margin: 40px;
+  background-color: #f9f9f9;
+}
+h1 {
+  color: #333;
+}
+form {
+  max-width: 400px;
+  padding: 20px;
+  background: #fff;
+  border: 1px solid #ccc;
+  border-radius: 8px;
+}
+label {
+  display: block;
+  margin-top: 15px;
+  font-weight: bold;
+}
+input[type="text"] {
+  width: 100%;
+  padding: 8px;
+  margin-top: 5px;
+  border: 1px solid #ccc;
+  border-radius: 4px;
+}
+button {
+  margin-top: 20px;
+  padding: 10px 15px;
+  background: #0078d7;
+  color: white;
+  border: none;
+  border-radius: 4px;
+  cursor: pointer;
+}
+button:hover {
+  background: #005a9e;
+}
+"""
+CSS_ETAG = '"{:08x}"'.format(binascii.crc32(CSS) & 0xffffffff)
+
+# Static chunks, each followed by the config value named in SLOTS (None ends the page)
+CHUNKS = (
+    b"""<html lang="en">
+<head>
+  <meta charset="UTF-8">
+  <title>Settings Form</title>
+  <link rel="stylesheet" href="/style.css">
+</head>
+<body>
+  <h1>Device Settings</h1>
+  <form method="GET" action="/">
+  <label>Wifi SSID:</label>
+  <input type="text" name="wifi_ssid" value=\"""",
+    b"""">
+
+  <label>Wifi Password:</label>
+  <input type="text" name="wifi_password" value=\"""",
+    b"""">
+
+  <label>API Key:</label>
+  <input type="text" name="api_key" value=\"""",
+    b"""">
+
+  <label>Latitude:</label>
+  <input type="text" name="loc_lat" value=\"""",
+    b"""">
+
+  <label>Longitude:</label>
+  <input type="text" name="loc_lon" value=\"""",
+    b"""">
+
+  <label>Location Name:</label>
+  <input type="text" name="loc_name" value=\"""",
+    b"""">
+
+  <label>Update Interval (Seconds):</label>
+  <input type="text" name="upd_int" value=\"""",
+    b"""">
+
+  <button type="submit">Submit</button>
+</form>
+<form method="GET" action="/reset">
+  <button type="submit">Restart Device</button>
+</form>
+</body>
+</html>
+""",
+)
+SLOTS = ("WIFI_SSID", "WIFI_PASSWORD", "API_KEY", "LAT", "LON", "LOCATION_NAME", "UPDATE_INTERVAL", None)
+
+STATIC_LENGTH = sum(len(c) for c in CHUNKS)
+
+
+def escape(value):
+    s = str(value)
+    for a, b in (("&", "&amp;"), ("<", "&lt;"), (">", "&gt;"), ('"', "&quot;"), ("'", "&#39;")):
+        if a in s:
+            s = s.replace(a, b)
+    return s
+
+
+def _value(slot):
+    if slot == "LAT":
+        return ih.cfg["LOCATION"][0]
+    if slot == "LON":
+        return ih.cfg["LOCATION"][1]
+    value = ih.cfg.get(slot)
+    return "" if value is None else value
+
+
+def values():
+    # Escaped slot values from the in-RAM config
+    return [escape(_value(slot)).encode() for slot in SLOTS if slot is not None]
+
+
+def length(vals):
+    return STATIC_LENGTH + sum(len(v) for v in vals)
+
+
+async def write_page(writer, vals):
+    # Streams the page a chunk at a time
+    for i in range(len(CHUNKS)):
+        writer.write(CHUNKS[i])
+        if i < len(vals):
+            writer.write(vals[i])
+        await writer.drain()
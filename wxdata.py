@@ -0,0 +1,161 @@
+import time
+
+import datetime
+import helper as ih
+import httpc
+import jsonpull
+import membudget
+import metrics
+import sdcache
+
+# Weather data shared by the WX: Now, Hourly and Daily pages. Current,
+# hourly and daily values come from one Open-Meteo request and are kept
+# until they are older than the update interval, so switching between the
+# weather pages does not go back to the network. The last response is also
+# kept on the SD card, so pages can draw straight away after a boot and
+# fall back to old data when offline. Refetches are conditional on the
+# ETag / Last-Modified of the kept response.
+
+URL = ("https://api.open-meteo.com/v1/forecast?latitude={}&longitude={}"
+       "&current=temperature_2m,apparent_temperature,wind_direction_10m,wind_speed_10m,weather_code,is_day"
+       "&hourly=temperature_2m,precipitation_probability,wind_speed_10m,wind_direction_10m"
+       "&daily=weather_code,temperature_2m_max,temperature_2m_min,rain_sum"
+       "&forecast_days=5&forecast_hours=24&timezone=auto")
+CACHE_KEY = "weather"
+
+# Hourly entries kept from each response. The page shows 5 from the current
+# hour, the rest covers the hour moving on while the data sits in the cache.
+HOURS = 8
+_HOURLY = (0, HOURS)
+_DAILY = (0, 5)
+# Fields pulled out of the response stream, see jsonpull
+SPEC = {
+    "utc_offset_seconds": True,
+    "current": True,
+    "hourly": {"time": _HOURLY, "temperature_2m": _HOURLY, "precipitation_probability": _HOURLY,
+               "wind_speed_10m": _HOURLY, "wind_direction_10m": _HOURLY},
+    "daily": {"weather_code": _DAILY, "temperature_2m_max": _DAILY, "temperature_2m_min": _DAILY,
+              "rain_sum": _DAILY},
+}
+# Kept when memory is tight, just the hours the page shows
+_SHORT = (0, 5)
+SPEC_SHORT = {
+    "utc_offset_seconds": True,
+    "current": True,
+    "hourly": {"time": _SHORT, "temperature_2m": _SHORT, "precipitation_probability": _SHORT,
+               "wind_speed_10m": _SHORT, "wind_direction_10m": _SHORT},
+    "daily": SPEC["daily"],
+}
+
+data = None
+fetched = None
+location = None
+# Validators of the response data came from
+etag = None
+modified = None
+# True when data is older than asked for because a fetch failed
+stale = False
+
+
+def age():
+    # Seconds since the cached data was fetched, None if there is none
+    if fetched is None:
+        return None
+    return time.time() - fetched
+
+
+def fresh(loc, max_age):
+    return data is not None and loc == location and age() < max_age
+
+
+def load_cached(loc):
+    # Pull the last response off the SD card if RAM is empty
+    global data, fetched, location, etag, modified
+    if data is not None and loc == location:
+        return
+    entry = sdcache.load(CACHE_KEY)
+    if entry is None:
+        return
+    stamp, payload = entry
+    if payload.get("loc") == list(loc):
+        data = payload["data"]
+        fetched = stamp
+        location = loc
+        etag = payload.get("etag")
+        modified = payload.get("modified")
+
+
+def fetch(loc):
+    global data, fetched, location, stale, etag, modified
+    budget = membudget.prepare("weather")
+    if budget == membudget.CRITICAL:
+        raise MemoryError("Not enough memory to fetch weather")
+    ih.pulse_network_led()
+    t = metrics.begin()
+    same = data is not None and loc == location
+    try:
+        response = httpc.get(URL.format(loc[0], loc[1]), etag if same else None, modified if same else None)
+        try:
+            if response.status == 304:
+                new_data = data
+            elif response.status == 200:
+                new_data = jsonpull.load(response.raw, SPEC if budget == membudget.NORMAL else SPEC_SHORT)
+            else:
+                raise OSError("Weather fetch failed, HTTP {}".format(response.status))
+            # A short copy must not be revalidated, the next fetch gets it all
+            short = budget != membudget.NORMAL and response.status == 200
+            etag = None if short else response.etag
+            modified = None if short else response.modified
+        finally:
+            response.close()
+    finally:
+        ih.stop_network_led()
+        ih.network_led_pwm.duty_u16(30000)
+        metrics.end(metrics.WEATHER, t)
+    data = new_data
+    # Local time for the pages follows the forecast location, DST included
+    datetime.set_offset(data.get("utc_offset_seconds", 0))
+    fetched = time.time()
+    location = loc
+    stale = False
+    sdcache.save(CACHE_KEY, {"loc": list(loc), "data": data, "etag": etag, "modified": modified}, fetched)
+    return data
+
+
+def get(loc, max_age, online=True):
+    # Cached data if it is younger than max_age seconds, otherwise a fresh
+    # fetch. Old data is returned with stale set if the fetch fails.
+    global stale
+    load_cached(loc)
+    if fresh(loc, max_age):
+        stale = False
+        return data
+    try:
+        # online may be a function that brings the link up on demand
+        if callable(online):
+            online = online()
+        if not online:
+            raise OSError("No network connection")
+        return fetch(loc)
+    except Exception as e:
+        metrics.count(metrics.FETCH_ERRORS)
+        if isinstance(e, MemoryError):
+            membudget.event("weather fetch: {}".format(e))
+        if data is None or loc != location:
+            raise
+        print("Using cached weather data: ", e)
+        stale = True
+        return data
+
+
+def hour_index(data, day, hour):
+    # Index into the hourly arrays for the given day of month and hour.
+    # forecast_hours makes the arrays start at the hour of the fetch, which
+    # may be behind the current hour when the data comes from the cache.
+    # None when the hour is not among the kept entries.
+    times = data["hourly"]["time"]
+    for i in range(len(times)):
+        # Times look like "2024-05-01T13:00"
+        if int(times[i][8:10]) == day and int(times[i][11:13]) == hour:
+            return i
+    return None